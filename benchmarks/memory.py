@@ -0,0 +1,100 @@
+"""
+Benchmark of the memory of the agents and of the pool of dead agents.
+
+- bytes per agent : memory allocated by spawning 100k sheep, with an empty pool (every sheep is a new object) and
+  with a pool of dead sheep to reuse. A sheep keeps an instance dictionary : mesa.Agent (0.9.0) declares no
+  __slots__, so slots on the agent classes cannot make a new agent smaller, and only the reuse of dead agents
+  saves allocations.
+- garbage collection : number and duration of the collections during a boom/bust run, with the pool of dead
+  agents reused by the births and with a pool which drops every dead agent (every birth then allocates a new
+  object).
+
+    $ python -m benchmarks.memory
+"""
+
+import gc
+import time
+import tracemalloc
+from collections import defaultdict
+
+from prey_predator.agents import Sheep
+from prey_predator.model import WolfSheep
+from prey_predator.params import default_parameters
+
+
+class DroppingPool(defaultdict):
+    """
+    An agent pool which forgets the dead agents."""
+
+    def __missing__(self, key):
+        return []
+
+
+def bytes_per_agent(pooled, n=100_000):
+    """
+    Returns the memory allocated per sheep when spawning n sheep, with a pool of n dead sheep if pooled."""
+    parameters = {**default_parameters(), "grass": False, "initial_sheep": 0, "initial_wolves": 0}
+    model = WolfSheep(seed=0, **parameters)
+    if pooled:
+        model.agent_pool[Sheep].extend(
+            Sheep(-i, (0, 0), model, moore=True, energy=10) for i in range(1, n + 1)
+        )
+    tracemalloc.start()
+    start = tracemalloc.take_snapshot()
+    agents = [Sheep.spawn(model, (0, 0), True, energy=10) for i in range(n)]
+    end = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in end.compare_to(start, "filename"))
+    # the list holding the agents is not part of their size
+    return (allocated - 8 * len(agents)) / n
+
+
+def gc_pauses(pooled, steps=300):
+    """
+    Runs a boom/bust model, returning the number of collections and their total and maximum duration."""
+    parameters = {
+        **default_parameters(),
+        "width": 60,
+        "height": 60,
+        "initial_sheep": 3000,
+        "initial_wolves": 300,
+    }
+    model = WolfSheep(seed=0, scheduler="array", **parameters)
+    if not pooled:
+        model.agent_pool = DroppingPool()
+    pauses = []
+    started = []
+
+    def callback(phase, info):
+        if phase == "start":
+            started.append(time.perf_counter())
+        else:
+            pauses.append(time.perf_counter() - started.pop())
+
+    gc.collect()
+    gc.callbacks.append(callback)
+    try:
+        start = time.perf_counter()
+        model.run_model(steps)
+        elapsed = time.perf_counter() - start
+    finally:
+        gc.callbacks.remove(callback)
+    return len(pauses), sum(pauses), max(pauses, default=0), elapsed
+
+
+def main():
+    print("bytes per spawned agent")
+    for pooled in (False, True):
+        print("  {:<10} {:8.1f}".format("pool" if pooled else "no pool", bytes_per_agent(pooled)))
+    print("garbage collection over a boom/bust run")
+    for pooled in (False, True):
+        count, total, longest, elapsed = gc_pauses(pooled)
+        print(
+            "  {:<10} {:5d} collections, {:7.1f} ms total, {:6.2f} ms max, run {:6.2f} s".format(
+                "pool" if pooled else "no pool", count, total * 1e3, longest * 1e3, elapsed
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Benchmark of the breed schedulers, on their own overhead : stepping, adding and removing 100k agents
+whose step does nothing.
+
+    $ python -m benchmarks.scheduler
+"""
+
+import random
+import time
+
+import numpy as np
+from mesa import Agent
+
+from prey_predator.schedule import ArrayActivationByBreed, RandomActivationByBreed
+
+
+class IdleModel:
+    """
+    The part of a model a scheduler relies on."""
+
+    def __init__(self, seed=0):
+        self.random = random.Random(seed)
+        self.np_random = np.random.default_rng(seed)
+        self.instrumentation = None
+
+    def draw_moves(self, n):
+        pass
+
+
+class IdleAgent(Agent):
+    def step(self):
+        pass
+
+
+def bench(scheduler_class, agents=100_000, steps=20, churn=0.1):
+    """
+    Returns the mean time of a step of the scheduler, and the time to remove then add back
+    a fraction churn of the agents."""
+    model = IdleModel()
+    schedule = scheduler_class(model)
+    population = [IdleAgent(i, model) for i in range(agents)]
+    for agent in population:
+        schedule.add(agent)
+    start = time.perf_counter()
+    for _ in range(steps):
+        schedule.step()
+    step_time = (time.perf_counter() - start) / steps
+    leaving = random.Random(1).sample(population, int(churn * agents))
+    start = time.perf_counter()
+    for agent in leaving:
+        schedule.remove(agent)
+    for agent in leaving:
+        schedule.add(agent)
+    churn_time = time.perf_counter() - start
+    assert schedule.get_breed_count(IdleAgent) == agents
+    return step_time, churn_time
+
+
+def main():
+    for scheduler_class in (RandomActivationByBreed, ArrayActivationByBreed):
+        step_time, churn_time = bench(scheduler_class)
+        print(
+            "{:<24} step {:7.2f} ms   remove+add 10% {:7.2f} ms".format(
+                scheduler_class.__name__, step_time * 1e3, churn_time * 1e3
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
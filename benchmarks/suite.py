@@ -0,0 +1,288 @@
+"""
+Scaling benchmark suite of WolfSheep.step.
+
+Runs the model over a grid of cases (grid size, initial population, grass on or off) and measures, for each
+case : the steps per second, the percentiles of the duration of a step, the peak resident memory and the memory
+allocated by a step. Every case runs in its own process, so that the peak memory of a case is its own.
+It also runs a fixed-seed determinism check : a hash of the series collected by short runs of every
+engine and scheduler, which an optimization must not change. In the counter random mode, every engine and
+scheduler must give the same trajectory, whose hash is pinned below (counter-based draws are the same on every
+platform). tests/test_rng.py checks the pinned hash with the same series_hash, without the benchmark.
+
+The results are saved as a JSON baseline, and compared against it on the next runs : a case slower (or bigger)
+than the baseline by more than the threshold, or a changed trajectory, is a regression (exit code 1).
+
+    $ python -m benchmarks.suite --baseline benchmarks/baselines/local.json
+    $ python -m benchmarks.suite --quick --baseline benchmarks/baselines/local.json --threshold 0.3
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from prey_predator.params import default_parameters
+
+GRID_SIZES = (20, 100, 300, 1000)
+POPULATIONS = (250, 2500, 25000)
+QUICK_GRID_SIZES = (20, 100)
+QUICK_POPULATIONS = (250, 2500)
+# runs of the determinism check : (engine, scheduler, random mode)
+DETERMINISM_RUNS = (
+    ("agents", "dict", "sequential"),
+    ("agents", "array", "sequential"),
+    ("arrays", "dict", "sequential"),
+    ("agents", "dict", "counter"),
+    ("agents", "array", "counter"),
+    ("arrays", "dict", "counter"),
+)
+DETERMINISM_STEPS = 100
+# series hash of the runs in the counter random mode
+COUNTER_HASH = "336f86f8b76a73628ff19055205eb2cfba9cc2d2f5acde63e0287af644f3d592"
+
+# metrics compared against the baseline, and whether a higher value is better
+COMPARED_METRICS = {
+    "steps_per_second": True,
+    "latency_p50_ms": False,
+    "latency_p99_ms": False,
+    "peak_rss_mib": False,
+}
+
+
+def case_parameters(size, population, grass):
+    """
+    Returns the parameters of a case : a size x size grid with population animals (60% sheep, 40% wolves)."""
+    return {
+        **default_parameters(),
+        "width": size,
+        "height": size,
+        "initial_sheep": population * 3 // 5,
+        "initial_wolves": population * 2 // 5,
+        "grass": grass,
+    }
+
+
+def case_name(size, population, grass, engine):
+    return "{0}x{0} n={1} grass={2} engine={3}".format(
+        size, population, "on" if grass else "off", engine
+    )
+
+
+def peak_rss_mib():
+    """
+    Returns the peak resident memory of the process, in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def run_case(size, population, grass, engine, steps, warmup, allocation_steps):
+    """
+    Builds and runs a case, returning its metrics."""
+    from prey_predator.model import WolfSheep
+
+    model = WolfSheep(seed=0, engine=engine, **case_parameters(size, population, grass))
+    for _ in range(warmup):
+        model.step()
+    latencies = []
+    for _ in range(steps):
+        start = time.perf_counter()
+        model.step()
+        latencies.append(time.perf_counter() - start)
+    rss = peak_rss_mib()
+    # allocations are measured apart, tracemalloc slowing the steps down
+    allocated = []
+    tracemalloc.start()
+    for _ in range(allocation_steps):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        model.step()
+        allocated.append(tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+    latencies = np.array(latencies)
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1e3
+    return {
+        "steps_per_second": len(latencies) / latencies.sum(),
+        "latency_p50_ms": p50,
+        "latency_p90_ms": p90,
+        "latency_p99_ms": p99,
+        "peak_rss_mib": rss,
+        "step_allocation_peak_kib": max(allocated, default=0) / 2**10,
+        "final_population": model.get_agent_count(),
+    }
+
+
+def series_hash(engine, scheduler, rng="sequential", steps=DETERMINISM_STEPS):
+    """
+    Returns the sha256 of the series collected by a fixed-seed run."""
+    from prey_predator.model import WolfSheep
+
+    model = WolfSheep(
+        seed=1, engine=engine, scheduler=scheduler, rng=rng, **default_parameters()
+    )
+    model.run_model(steps)
+    digest = hashlib.sha256()
+    for name, column in sorted(model.datacollector.get_series().items()):
+        digest.update(name.encode())
+        digest.update(np.ascontiguousarray(column).tobytes())
+    return digest.hexdigest()
+
+
+def determinism():
+    """
+    Returns the series hash of every determinism run, checking that running it twice gives the same hash,
+    and that the runs in the counter random mode give the pinned COUNTER_HASH."""
+    hashes = {}
+    for engine, scheduler, rng in DETERMINISM_RUNS:
+        name = "engine={} scheduler={}".format(engine, scheduler)
+        if rng != "sequential":
+            name += " rng={}".format(rng)
+        first = series_hash(engine, scheduler, rng)
+        if series_hash(engine, scheduler, rng) != first:
+            raise AssertionError("Two runs with the same seed differ: {}".format(name))
+        if rng == "counter" and first != COUNTER_HASH:
+            raise AssertionError(
+                "The counter random mode does not give the pinned trajectory: {}".format(name)
+            )
+        hashes[name] = first
+    return hashes
+
+
+def run_suite(cases, steps, warmup, allocation_steps):
+    """
+    Runs every case in a fresh process, returning {name: metrics}."""
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    for size, population, grass, engine in cases:
+        name = case_name(size, population, grass, engine)
+        with context.Pool(1) as pool:
+            results[name] = pool.apply(
+                run_case, (size, population, grass, engine, steps, warmup, allocation_steps)
+            )
+        metrics = results[name]
+        print(
+            "{:<40} {:9.1f} steps/s  p50 {:8.2f} ms  p99 {:8.2f} ms  "
+            "rss {:7.1f} MiB  alloc {:9.1f} KiB".format(
+                name,
+                metrics["steps_per_second"],
+                metrics["latency_p50_ms"],
+                metrics["latency_p99_ms"],
+                metrics["peak_rss_mib"],
+                metrics["step_allocation_peak_kib"],
+            ),
+            flush=True,
+        )
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Compares results against a baseline, returning the list of regressions (as messages)."""
+    regressions = []
+    for name, expected in baseline["determinism"].items():
+        actual = results["determinism"].get(name)
+        if actual is not None and actual != expected:
+            regressions.append("trajectory changed: {}".format(name))
+    for name, metrics in results["cases"].items():
+        reference = baseline["cases"].get(name)
+        if reference is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            ratio = metrics[metric] / reference[metric]
+            if ratio < 1 - threshold if higher_is_better else ratio > 1 + threshold:
+                regressions.append(
+                    "{}: {} {:.2f} vs {:.2f} in the baseline".format(
+                        name, metric, metrics[metric], reference[metric]
+                    )
+                )
+    return regressions
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.suite", description=__doc__.split("\n\n")[0]
+    )
+    parser.add_argument(
+        "--baseline",
+        help="JSON baseline : written if it does not exist, compared against otherwise",
+    )
+    parser.add_argument(
+        "--update", action="store_true", help="overwrite the baseline with the results"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="relative change of a metric counted as a regression (default: 0.2)",
+    )
+    parser.add_argument(
+        "--quick", action="store_true", help="only the small grids and populations"
+    )
+    parser.add_argument(
+        "--engine", choices=["agents", "arrays"], nargs="+", default=["agents"]
+    )
+    parser.add_argument(
+        "--no-grass",
+        dest="grass",
+        action="store_const",
+        const=(False,),
+        default=(True, False),
+        help="only the cases without grass",
+    )
+    parser.add_argument("--steps", type=int, default=20, help="measured steps per case")
+    parser.add_argument("--warmup", type=int, default=3, help="steps before measuring")
+    parser.add_argument(
+        "--allocation-steps", type=int, default=3, help="steps measured with tracemalloc"
+    )
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    sizes = QUICK_GRID_SIZES if args.quick else GRID_SIZES
+    populations = QUICK_POPULATIONS if args.quick else POPULATIONS
+    cases = list(itertools.product(sizes, populations, args.grass, args.engine))
+
+    print("determinism check", flush=True)
+    results = {
+        "machine": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpus": os.cpu_count(),
+        },
+        "determinism": determinism(),
+    }
+    for name, digest in results["determinism"].items():
+        print("  {:<32} {}".format(name, digest[:16]))
+    results["cases"] = run_suite(cases, args.steps, args.warmup, args.allocation_steps)
+
+    if args.baseline is None:
+        return 0
+    if os.path.exists(args.baseline) and not args.update:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print("REGRESSION", regression)
+        if not regressions:
+            print("no regression against {}".format(args.baseline))
+        return 1 if regressions else 0
+    os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+    with open(args.baseline, "w") as file:
+        json.dump(results, file, indent=2)
+    print("baseline written to {}".format(args.baseline))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
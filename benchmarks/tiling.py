@@ -0,0 +1,53 @@
+"""
+Benchmark of the spatial tiling : time of a step of a large grid, in one process with the array engine,
+then cut into more and more tiles (one worker process per tile).
+The speed-up is only expected up to the number of cores of the machine.
+
+    $ python -m benchmarks.tiling
+"""
+
+import os
+import time
+
+from prey_predator.model import WolfSheep
+from prey_predator.params import default_parameters
+from prey_predator.tiling import TiledWolfSheep
+
+SIZE = 1000
+POPULATION = 500_000
+LAYOUTS = ((1, 1), (2, 1), (2, 2), (4, 2), (4, 4))
+
+
+def parameters():
+    return {
+        **default_parameters(),
+        "width": SIZE,
+        "height": SIZE,
+        "initial_sheep": POPULATION * 3 // 5,
+        "initial_wolves": POPULATION * 2 // 5,
+    }
+
+
+def step_time(model, steps):
+    model.step()
+    start = time.perf_counter()
+    model.run_model(steps)
+    return (time.perf_counter() - start) / steps
+
+
+def main(steps=10):
+    print("{} cores, {}x{} grid, {} animals".format(os.cpu_count(), SIZE, SIZE, POPULATION))
+    reference = step_time(WolfSheep(seed=0, engine="arrays", **parameters()), steps)
+    print("  {:<12} {:8.1f} ms".format("WolfSheep", reference * 1e3))
+    for tiles in LAYOUTS:
+        with TiledWolfSheep(tiles=tiles, seed=0, **parameters()) as model:
+            elapsed = step_time(model, steps)
+        print(
+            "  {:<12} {:8.1f} ms   speed-up {:5.2f}".format(
+                "{}x{} tiles".format(*tiles), elapsed * 1e3, reference / elapsed
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
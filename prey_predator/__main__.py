@@ -0,0 +1,5 @@
+import sys
+
+from prey_predator.cli import main
+
+sys.exit(main())
@@ -1,4 +1,3 @@
-from mesa import Agent
 from prey_predator.random_walk import RandomWalker
 
 ###############################
@@ -12,7 +11,8 @@ class Sheep(RandomWalker):
     The init is the same as the RandomWalker, with some additionnal attributes : the energy, the age, and the last_ate indicator.
     """
 
-    energy = None
+    # the methods called by step, in order (timed one by one by an instrumented model)
+    phases = ("random_move", "eat_grass", "reproduce", "aging", "exhaustion_death")
 
     def __init__(self, unique_id, pos, model, moore, energy):
         super().__init__(unique_id, pos, model, moore=moore)
@@ -29,9 +29,7 @@ class Sheep(RandomWalker):
         """
 
         self.random_move()
-        # if the model takes into account grass patches
-        if self.model.grass:
-            self.eat_grass()
+        self.eat_grass()
         self.reproduce()
         self.aging()
         self.exhaustion_death()
@@ -42,32 +40,31 @@ class Sheep(RandomWalker):
         Additionally, the sheep loses sheep_move_energy."""
         super().random_move()
         self.energy -= self.model.sheep_move_energy
+        self.model.statistics.energy_changed(self, -self.model.sheep_move_energy)
 
     def eat_grass(self):
         """
         This function checks for grass in the sheep's current cell.
         If the sheep hasn't eaten this step, and hasn't eaten too recently (we require for the sheep to wait
         sheep_min_digestion long before eating again), and if there's a fully grown grass patch in the cell,
-        the sheep eats, gains new energy, and the grasspatch's gets_eaten method is called.
-        Otherwise, the last_ate attribute is incremented."""
-        # get_neighbors with radius=0 and include_center=True gets the agent in
-        # the same cell
-        cell = self.model.grid.get_neighbors(
-            self.pos, moore=True, radius=0, include_center=True
-        )
+        the sheep eats, gains new energy, and the grass field's gets_eaten method is called on its cell.
+        Otherwise, the last_ate attribute is incremented.
+        Nothing happens if the model does not take into account grass patches."""
+        if not self.model.grass:
+            return
+        grass_field = self.model.grass_field
         ate = False
-        # if there is a grass patch in the cell + the sheep is hungry
-        if cell and (self.last_ate >= self.model.sheep_min_digestion):
-            for thing in cell:
-                # find the grass patch agent on the cell and checks if it can be eaten
-                if (type(thing) == GrassPatch) and (thing.grown):
-                    # sheep eats, hungryness variables reinitialized
-                    # grass patch variables reinitialized
-                    self.energy += self.model.sheep_gain_from_food
-                    self.last_ate = 0
-                    thing.gets_eaten()
-                    ate = True
-                    break
+        # if there is a fully grown grass patch in the cell + the sheep is hungry
+        if (self.last_ate >= self.model.sheep_min_digestion) and grass_field.is_grown(
+            self.pos
+        ):
+            # sheep eats, hungryness variables reinitialized
+            # grass patch variables reinitialized
+            self.model.statistics.ate(self, self.model.sheep_gain_from_food)
+            self.energy += self.model.sheep_gain_from_food
+            self.last_ate = 0
+            grass_field.gets_eaten(self.pos)
+            ate = True
         # sheep didn't eat, hungyness increases
         if not ate:
             self.last_ate += 1
@@ -76,23 +73,24 @@ class Sheep(RandomWalker):
         """
         If the sheep has more energy than the sheep_reproduction_energy value, and using a probability based
         on the sheep_reproduce value, the sheep can reproduce on its own. If it does, a new sheep agent is
-        initialized in the parent's cell, and is added to the scheduler and the grid. The parent also loses
-        reproduction energy."""
+        initialized in the parent's cell (reusing a dead agent if possible, see RandomWalker.spawn), and is added
+        to the scheduler and the grid. The parent also loses reproduction energy.
+        The birth and the energy lost are reported to the model's PopulationStatistics."""
         if (self.energy > self.model.sheep_reproduction_energy) and (
-            self.model.random.random() <= self.model.sheep_reproduce
+            self.model.reproduce_draw(self) <= self.model.sheep_reproduce
         ):
-            kid = Sheep(
-                self.model.next_id(),
-                self.pos,
-                self.model,
-                self.moore,
-                energy=self.model.sheep_energy,
+            kid = Sheep.spawn(
+                self.model, self.pos, self.moore, energy=self.model.sheep_energy
             )
             # new sheep added to the model
             self.model.schedule.add(kid)
             self.model.grid.place_agent(kid, self.pos)
+            self.model.statistics.born(kid)
             # old sheep looses reproduction energy
             self.energy -= self.model.sheep_reproduction_energy
+            self.model.statistics.energy_changed(
+                self, -self.model.sheep_reproduction_energy
+            )
 
     def exhaustion_death(self):
         """
@@ -120,7 +118,8 @@ class Wolf(RandomWalker):
     The init is the same as the RandomWalker, with some additionnal attributes : the energy, the age, and the last_ate indicator.
     """
 
-    energy = None
+    # the methods called by step, in order (timed one by one by an instrumented model)
+    phases = ("random_move", "eat_sheep", "reproduce", "aging", "exhaustion_death")
 
     def __init__(self, unique_id, pos, model, moore, energy):
         super().__init__(unique_id, pos, model, moore=moore)
@@ -147,30 +146,26 @@ class Wolf(RandomWalker):
         Additionally, the wolf loses wolf_move_energy."""
         super().random_move()
         self.energy -= self.model.wolf_move_energy
+        self.model.statistics.energy_changed(self, -self.model.wolf_move_energy)
 
     def eat_sheep(self):
         """
         This function checks for sheep in the wolf's current cell.
         If the wold hasn't eaten this step, and hasn't eaten too recently (we require for the wolf to wait
-        wolf_min_digestion long before eating again), and if there's a sheep in the cell,
-        the wolf eats, gains new energy, and the sheep's dies method is called.
+        wolf_min_digestion long before eating again), and if there's a sheep in the cell (looked up in
+        the grid's breed occupancy index), the wolf eats, gains new energy, and the sheep's dies method is called.
         Otherwise, the last_ate attribute is incremented."""
-        # other agents in the same cell
-        cell = self.model.grid.get_neighbors(
-            self.pos, moore=True, radius=0, include_center=True
-        )
         ate = False
-        # if there are agents in the cell and the wolf is hungy
-        if cell and (self.last_ate >= self.model.wolf_min_digestion):
-            for thing in cell:
-                # eats the first sheep agent it can find
-                if type(thing) == Sheep:
-                    # sheep dies and wolf gets hungryness variables reinitialized
-                    self.energy += self.model.wolf_gain_from_food
-                    self.last_ate = 0
-                    ate = True
-                    thing.dies()
-                    break
+        # if the wolf is hungry, it eats the first sheep agent of its cell, if any
+        if self.last_ate >= self.model.wolf_min_digestion:
+            prey = self.model.grid.first_of_breed(self.pos, Sheep)
+            if prey is not None:
+                # sheep dies and wolf gets hungryness variables reinitialized
+                self.model.statistics.ate(self, self.model.wolf_gain_from_food)
+                self.energy += self.model.wolf_gain_from_food
+                self.last_ate = 0
+                ate = True
+                prey.dies()
         # wolf didn't eat, hungryness grows
         if not ate:
             self.last_ate += 1
@@ -179,23 +174,24 @@ class Wolf(RandomWalker):
         """
         If the wolf has more energy than the wolf_reproduction_energy value, and using a probability based
         on the wolf_reproduce value, the wolf can reproduce on its own. If it does, a new wolf agent is
-        initialized in the parent's cell, and is added to the scheduler and the grid. The parent also loses
-        reproduction energy."""
+        initialized in the parent's cell (reusing a dead agent if possible, see RandomWalker.spawn), and is added
+        to the scheduler and the grid. The parent also loses reproduction energy.
+        The birth and the energy lost are reported to the model's PopulationStatistics."""
         if (self.energy > self.model.wolf_reproduction_energy) and (
-            self.model.random.random() <= self.model.wolf_reproduce
+            self.model.reproduce_draw(self) <= self.model.wolf_reproduce
         ):
             # Si le loup a assez d'énergie, on crée un agent enfant, qu'on ajoute à la grille et au schedule.
-            kid = Wolf(
-                self.model.next_id(),
-                self.pos,
-                self.model,
-                self.moore,
-                energy=self.model.wolf_energy,
+            kid = Wolf.spawn(
+                self.model, self.pos, self.moore, energy=self.model.wolf_energy
             )
             self.model.schedule.add(kid)
             self.model.grid.place_agent(kid, self.pos)
+            self.model.statistics.born(kid)
 
             self.energy -= self.model.wolf_reproduction_energy
+            self.model.statistics.energy_changed(
+                self, -self.model.wolf_reproduction_energy
+            )
 
     def exhaustion_death(self):
         """
@@ -217,29 +213,51 @@ class Wolf(RandomWalker):
 ###############################
 
 
-class GrassPatch(Agent):
+class GrassPatch:
     """
     A patch of grass that grows at a fixed rate and it is eaten by sheep.
+    The grass itself is stored in the model's GrassField arrays : a GrassPatch is only a thin view on one
+    cell of the field, so that the portrayal and any code handling patch objects keep working.
     """
 
-    def __init__(self, unique_id, pos, model, fully_grown, countdown):
+    def __init__(self, field, pos):
         """
-        Creates a new patch of grass
+        Creates a view on a patch of grass
         Args:
-            pos: a position in the grid,
-            model: the according model it belongs to,
-            grown: (boolean) Whether the patch of grass is fully grown or not,
-            countdown: Time for the patch of grass to be fully grown again.
-            The countdown value should be initialized with a model variable.
+            field: the GrassField holding the grass,
+            pos: the position of the patch in the grid.
+        """
+        self.field = field
+        self.model = field.model
+        self.pos = pos
+
+    @property
+    def grown(self):
         """
-        super().__init__(unique_id, model)
-        self.grown = fully_grown
-        self.countdown = countdown
+        (boolean) Whether the patch of grass is fully grown or not."""
+        return bool(self.field.grown[self.pos])
+
+    @grown.setter
+    def grown(self, value):
+        self.field.set_grown(self.pos, value)
+
+    @property
+    def countdown(self):
+        """
+        Time for the patch of grass to be fully grown again."""
+        x, y = self.pos
+        return int(self.field.countdown_of(x * self.field.height + y))
+
+    @countdown.setter
+    def countdown(self, value):
+        x, y = self.pos
+        self.field.set_countdown(x * self.field.height + y, value)
 
     def step(self):
         """
-        Each step, the countdown to full growth is decreased by 1.
-        We then apply the update_growth method."""
+        The countdown to full growth is decreased by 1.
+        We then apply the update_growth method.
+        The model does not call it anymore : the whole field is updated at once by GrassField.step."""
         self.countdown -= 1
         self.update_growth()
 
@@ -254,5 +272,4 @@ class GrassPatch(Agent):
         """
         This method will be used when a sheep eats the grass patch.
         The countdown turns back to its maximum value, and the grown boolean becomes False."""
-        self.countdown = self.model.grass_regrowth_time
-        self.grown = False
+        self.field.gets_eaten(self.pos)
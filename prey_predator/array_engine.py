@@ -0,0 +1,353 @@
+"""
+Struct-of-arrays simulation engine.
+
+Instead of one Mesa agent per animal, the sheep and the wolves are stored breed by breed in contiguous
+NumPy arrays (unique id, cell, energy, age, last_ate), and every phase of a step (move, eat, reproduce,
+age, die) is applied to a whole breed at once. The rules are the ones of agents.py.
+The births, deaths, meals and energy changes of each phase are reported at once to the model's
+PopulationStatistics, as the agents report theirs one by one.
+"""
+
+import numpy as np
+
+from prey_predator.agents import Sheep, Wolf
+from prey_predator.rng import MOVE, REPRODUCE
+from prey_predator.space import torus_neighbourhood_table
+
+
+def rank_in_groups(keys):
+    """
+    Given sorted keys, returns for each element its rank among the elements sharing its key."""
+    n = len(keys)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    return np.arange(n) - np.repeat(starts, np.diff(np.r_[starts, n]))
+
+
+class BreedArrays:
+    """
+    The population of one breed, stored as one array per attribute.
+    Cells are flat indices x * height + y in the grid.
+    Births are appended at the end of the arrays, and deaths are removed by compacting them.
+    """
+
+    dtypes = {
+        "unique_id": np.int64,
+        "cell": np.int64,
+        "energy": np.float64,
+        "age": np.int64,
+        "last_ate": np.int64,
+    }
+
+    def __init__(self):
+        for name, dtype in self.dtypes.items():
+            setattr(self, name, np.zeros(0, dtype=dtype))
+
+    def __len__(self):
+        return len(self.unique_id)
+
+    def append(self, unique_id, cell, energy):
+        """
+        Adds new-born agents (age and last_ate at 0) at the end of the arrays."""
+        n = len(unique_id)
+        self.unique_id = np.concatenate([self.unique_id, unique_id])
+        self.cell = np.concatenate([self.cell, cell])
+        self.energy = np.concatenate([self.energy, np.broadcast_to(energy, n)])
+        self.age = np.concatenate([self.age, np.zeros(n, dtype=np.int64)])
+        self.last_ate = np.concatenate([self.last_ate, np.zeros(n, dtype=np.int64)])
+
+    def select(self, index):
+        """
+        Keeps only the agents selected by index (a boolean mask or an array of indices, in the new order).
+        Used to compact the arrays after deaths, and to reorder them."""
+        self.unique_id = self.unique_id[index]
+        self.cell = self.cell[index]
+        self.energy = self.energy[index]
+        self.age = self.age[index]
+        self.last_ate = self.last_ate[index]
+
+
+class ArrayEngine:
+    """
+    Steps the sheep and the wolves of a WolfSheep model as batched array operations.
+
+    The order of a step is the one of the agent engine : all the sheep move, eat grass, reproduce, age and
+    die, then all the wolves do the same with sheep as food.
+    At the start of its phase, a breed's arrays are shuffled into activation order, so that when several
+    agents compete for the same food in a cell, the one activated first gets it, as with the scheduler.
+    Likewise, a wolf eats the sheep of its cell that arrived there first (kids arrive just after their parent),
+    as it would find it first in the cell's list of agents.
+    New-born agents are not stepped in the step they are born in.
+    """
+
+    # the PopulationStatistics the events are reported to, if any
+    statistics = None
+
+    def __init__(self, model, moore=True):
+        self.model = model
+        self.statistics = getattr(model, "statistics", None)
+        self.width = model.grid.width
+        self.height = model.grid.height
+        self.moves = torus_neighbourhood_table(self.width, self.height, moore, True)
+        self.sheep = BreedArrays()
+        self.wolves = BreedArrays()
+        # order in which the sheep arrived in their cell during the last sheep phase
+        self.sheep_arrival = np.zeros(0)
+
+    def new_ids(self, n):
+        """
+        Returns n fresh unique ids, consuming the model's id counter like next_id does."""
+        first = self.model.current_id + 1
+        self.model.current_id += n
+        return np.arange(first, first + n, dtype=np.int64)
+
+    def add_agents(self, breed, cells, energy):
+        """
+        Adds agents of the given breed in the given flat cells."""
+        cells = np.asarray(cells, dtype=np.int64)
+        arrays = self.breed_arrays(breed)
+        if breed is Sheep:
+            self.sheep_arrival = np.r_[
+                self.sheep_arrival, len(arrays) + np.arange(len(cells))
+            ]
+        arrays.append(self.new_ids(len(cells)), cells, energy)
+
+    def breed_arrays(self, breed):
+        """
+        Returns the BreedArrays of a breed class."""
+        return self.sheep if breed is Sheep else self.wolves
+
+    def breed_of(self, arrays):
+        """
+        Returns the breed class of a BreedArrays."""
+        return Sheep if arrays is self.sheep else Wolf
+
+    def get_breed_count(self, breed):
+        """
+        Returns the current number of agents of certain breed."""
+        return len(self.breed_arrays(breed))
+
+    def positions(self, breed):
+        """
+        Returns the x and y coordinates arrays of the agents of a breed."""
+        return np.divmod(self.breed_arrays(breed).cell, self.height)
+
+    def step(self):
+        """
+        A step of the engine : the sheep, then the wolves. The grass grows in the model's step."""
+        self.step_sheep()
+        self.step_wolves()
+
+    def step_sheep(self):
+        model = self.model
+        sheep = self.sheep
+        sheep.select(self.activation_order(sheep))
+        # each phase is timed when the model is instrumented, as the phases of the agents
+        model.timed("Sheep", "random_move", self.random_move, sheep, model.sheep_move_energy)
+        self.feed_sheep()
+
+    def feed_sheep(self):
+        """
+        The rest of the sheep phase, once the sheep moved : they eat, reproduce, age and die."""
+        model = self.model
+        sheep = self.sheep
+        if model.grass:
+            model.timed("Sheep", "eat_grass", self.eat_grass)
+        parents = model.timed(
+            "Sheep",
+            "reproduce",
+            self.reproduce,
+            sheep,
+            model.sheep_reproduction_energy,
+            model.sheep_reproduce,
+        )
+        kids = sheep.cell[parents]
+        model.timed("Sheep", "aging", self.aging, sheep)
+        alive = model.timed(
+            "Sheep", "exhaustion_death", self.alive, sheep, model.sheep_life_expectancy
+        )
+        # survivors arrived in activation order, kids just after their parent
+        self.sheep_arrival = np.r_[np.flatnonzero(alive), np.flatnonzero(parents) + 0.5]
+        self.record_deaths(Sheep, alive)
+        sheep.select(alive)
+        sheep.append(self.new_ids(len(kids)), kids, model.sheep_energy)
+        self.record_births(Sheep, len(kids))
+
+    def step_wolves(self):
+        model = self.model
+        wolves = self.wolves
+        wolves.select(self.activation_order(wolves))
+        model.timed("Wolf", "random_move", self.random_move, wolves, model.wolf_move_energy)
+        self.feed_wolves()
+
+    def feed_wolves(self):
+        """
+        The rest of the wolf phase, once the wolves moved : they eat sheep, reproduce, age and die."""
+        model = self.model
+        wolves = self.wolves
+        model.timed("Wolf", "eat_sheep", self.eat_sheep)
+        parents = model.timed(
+            "Wolf",
+            "reproduce",
+            self.reproduce,
+            wolves,
+            model.wolf_reproduction_energy,
+            model.wolf_reproduce,
+        )
+        kids = wolves.cell[parents]
+        model.timed("Wolf", "aging", self.aging, wolves)
+        alive = model.timed(
+            "Wolf", "exhaustion_death", self.alive, wolves, model.wolf_life_expectancy
+        )
+        self.record_deaths(Wolf, alive)
+        wolves.select(alive)
+        wolves.append(self.new_ids(len(kids)), kids, model.wolf_energy)
+        self.record_births(Wolf, len(kids))
+
+    def record_deaths(self, breed, alive):
+        """
+        Reports the death of the agents of a breed left out of the alive mask, before they are removed."""
+        if self.statistics is not None:
+            arrays = self.breed_arrays(breed)
+            dead = ~alive
+            self.statistics.died_many(
+                breed, arrays.energy[dead], arrays.age[dead], arrays.last_ate[dead]
+            )
+
+    def record_births(self, breed, n):
+        """
+        Reports the birth of the last n agents of a breed."""
+        if self.statistics is not None and n:
+            arrays = self.breed_arrays(breed)
+            self.statistics.born_many(
+                breed, arrays.energy[-n:], arrays.age[-n:], arrays.last_ate[-n:]
+            )
+
+    # the random draws of a step, one per agent of a breed
+
+    def activation_order(self, breed):
+        """
+        Returns the order in which the agents of a breed are activated, as a permutation of their indices."""
+        counter_rng = self.model.counter_rng
+        if counter_rng is not None:
+            return counter_rng.order(self.model.schedule.steps, breed.unique_id)
+        return self.model.np_random.permutation(len(breed))
+
+    def move_draws(self, breed):
+        """
+        Returns the index of the move of each agent in its row of the moves table."""
+        counter_rng = self.model.counter_rng
+        if counter_rng is not None:
+            draws = counter_rng.random(self.model.schedule.steps, breed.unique_id, MOVE)
+            return (draws * self.moves.shape[1]).astype(np.int64)
+        return self.model.np_random.integers(0, self.moves.shape[1], size=len(breed))
+
+    def uniform_draws(self, breed):
+        """
+        Returns a uniform number in [0, 1) for each agent, deciding whether it reproduces."""
+        counter_rng = self.model.counter_rng
+        if counter_rng is not None:
+            return counter_rng.random(self.model.schedule.steps, breed.unique_id, REPRODUCE)
+        return self.model.np_random.random(len(breed))
+
+    def random_move(self, breed, move_energy):
+        """
+        Every agent steps one cell in any allowable direction (or stays), and loses move_energy."""
+        breed.cell = self.moves[breed.cell, self.move_draws(breed)]
+        breed.energy -= move_energy
+        if self.statistics is not None:
+            self.statistics.energy_changed_many(self.breed_of(breed), -move_energy * len(breed))
+
+    def feeding_order(self, candidates, cells, order):
+        """
+        Sorts the indices of the candidates to some food by cell, then by order within a cell.
+        Returns the sorted candidates, their cells and their rank in their cell."""
+        candidates = candidates[np.lexsort((order[candidates], cells[candidates]))]
+        candidate_cells = cells[candidates]
+        return candidates, candidate_cells, rank_in_groups(candidate_cells)
+
+    def eat_grass(self):
+        """
+        The hungry sheep standing on a fully grown grass patch eat it, one sheep per patch (the first activated).
+        The other sheep get hungrier."""
+        model = self.model
+        sheep = self.sheep
+        field = model.grass_field
+        grown = field.grown.reshape(-1)
+        hungry = np.flatnonzero(
+            (sheep.last_ate >= model.sheep_min_digestion) & grown[sheep.cell]
+        )
+        candidates, cells, rank = self.feeding_order(
+            hungry, sheep.cell, np.arange(len(sheep))
+        )
+        eaters = candidates[rank == 0]
+        eaten = cells[rank == 0]
+        if self.statistics is not None:
+            self.statistics.ate_many(Sheep, sheep.last_ate[eaters], model.sheep_gain_from_food)
+        sheep.last_ate += 1
+        sheep.last_ate[eaters] = 0
+        sheep.energy[eaters] += model.sheep_gain_from_food
+        field.eat(eaten)
+
+    def eat_sheep(self):
+        """
+        The hungry wolves eat the sheep of their cell, one sheep per wolf and as long as there are sheep left.
+        The eaten sheep die, and the other wolves get hungrier."""
+        model = self.model
+        sheep = self.sheep
+        wolves = self.wolves
+        cells_count = self.width * self.height
+        sheep_per_cell = np.bincount(sheep.cell, minlength=cells_count)
+        hungry = np.flatnonzero(
+            (wolves.last_ate >= model.wolf_min_digestion)
+            & (sheep_per_cell[wolves.cell] > 0)
+        )
+        candidates, cells, rank = self.feeding_order(
+            hungry, wolves.cell, np.arange(len(wolves))
+        )
+        eating = rank < sheep_per_cell[cells]
+        eaters = candidates[eating]
+        if self.statistics is not None:
+            self.statistics.ate_many(Wolf, wolves.last_ate[eaters], model.wolf_gain_from_food)
+        wolves.last_ate += 1
+        wolves.last_ate[eaters] = 0
+        wolves.energy[eaters] += model.wolf_gain_from_food
+        # each cell loses as many sheep as wolves ate there, the first arrived ones
+        eaten_per_cell = np.bincount(cells[eating], minlength=cells_count)
+        preys, prey_cells, prey_rank = self.feeding_order(
+            np.flatnonzero(eaten_per_cell[sheep.cell] > 0),
+            sheep.cell,
+            self.sheep_arrival,
+        )
+        alive = np.ones(len(sheep), dtype=bool)
+        alive[preys[prey_rank < eaten_per_cell[prey_cells]]] = False
+        self.record_deaths(Sheep, alive)
+        sheep.select(alive)
+        self.sheep_arrival = self.sheep_arrival[alive]
+
+    def reproduce(self, breed, reproduction_energy, reproduce_probability):
+        """
+        The agents having more than reproduction_energy reproduce with probability reproduce_probability,
+        and lose reproduction_energy. Returns the boolean mask of the parents."""
+        draws = self.uniform_draws(breed)
+        parents = (breed.energy > reproduction_energy) & (
+            draws <= reproduce_probability
+        )
+        breed.energy[parents] -= reproduction_energy
+        if self.statistics is not None:
+            self.statistics.energy_changed_many(
+                self.breed_of(breed), -reproduction_energy * int(np.count_nonzero(parents))
+            )
+        return parents
+
+    def aging(self, breed):
+        """
+        Every agent gets one step older."""
+        breed.age += 1
+
+    def alive(self, breed, life_expectancy):
+        """
+        Returns the mask of the agents surviving exhaustion death : the agents with negative energy
+        or older than life_expectancy die. As in agents.py, an agent with exactly 0 energy stays alive."""
+        return ~((breed.energy < 0) | (breed.age >= life_expectancy))
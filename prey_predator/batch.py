@@ -0,0 +1,173 @@
+"""
+Parallel parameter sweeps over the Wolf-Sheep model.
+
+Every run (a parameter set and a replicate number) is simulated by its own worker task, with a seed derived
+from the run itself, and its collected series is written as soon as it finishes into its own Parquet file of
+the output directory. The directory can be read as one Parquet dataset. Runs already written are skipped when
+a sweep is started again with the same output.
+
+Writing the results requires pyarrow.
+"""
+
+import copy
+import hashlib
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from prey_predator.model import WolfSheep
+from prey_predator.params import default_parameters
+from prey_predator.stopping import condition_key
+
+
+def parameter_grid(grid):
+    """
+    Returns the list of the parameter sets of a grid, given as {parameter name: list of values}."""
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+
+
+def run_key(parameters, replicate, steps, engine, base_seed, stop_conditions=()):
+    """
+    Returns a stable identifier of a run, derived from its full parameter set, its replicate number
+    and the settings of the sweep (stop conditions by their class and parameters, or by their repr if they do
+    not give them)."""
+    settings = [parameters, replicate, steps, engine, base_seed]
+    if stop_conditions:
+        settings.append(
+            [condition_key(condition) or repr(condition) for condition in stop_conditions]
+        )
+    canonical = json.dumps(settings, sort_keys=True)
+    return hashlib.sha256(canonical.encode()).hexdigest()[:16]
+
+
+def run_seed(key):
+    """
+    Returns the deterministic seed of a run, derived from its key."""
+    return int(key, 16) >> 1
+
+
+def run_filename(key):
+    """
+    Returns the name of the Parquet file of a run in a sweep output directory."""
+    return "run-{}.parquet".format(key)
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as error:
+        raise ImportError(
+            "Writing sweep results requires pyarrow: pip install pyarrow"
+        ) from error
+    return pyarrow
+
+
+def run_one(
+    parameters, replicate, key, seed, steps, engine, output, stop_conditions=(), cache=None
+):
+    """
+    Worker task : simulates one run (or loads it from the result cache) and writes its collected series in the
+    output directory.
+    The run stops early if one of the stop conditions fires, its reason being written in the stop_reason
+    column (empty if the run went through all the steps).
+    The file is written under a hidden temporary name and renamed at the end, so that only complete runs
+    are found in the output."""
+    pa = _import_pyarrow()
+    model = WolfSheep(seed=seed, engine=engine, cache=cache, **parameters)
+    # conditions keep a state : each run gets its own copy
+    model.run_until(*copy.deepcopy(stop_conditions), max_steps=steps)
+    series = model.datacollector.get_series()
+    n = model.datacollector.size
+    columns = {
+        "run": [key] * n,
+        "replicate": [replicate] * n,
+        "seed": [seed] * n,
+        "stop_reason": [model.stop_reason or ""] * n,
+    }
+    columns.update(
+        (name, values) for name, values in series.items() if values.ndim == 1
+    )
+    columns.update({name: [value] * n for name, value in parameters.items()})
+    path = os.path.join(output, run_filename(key))
+    tmp_path = os.path.join(output, "." + run_filename(key))
+    pa.parquet.write_table(pa.table(columns), tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def run_sweep(
+    parameter_sets,
+    replicates,
+    output,
+    steps=100,
+    processes=None,
+    base_seed=0,
+    engine="agents",
+    stop_conditions=(),
+    cache=None,
+):
+    """
+    Runs every parameter set replicates times over a process pool, writing each run in the output directory.
+
+    Args:
+        parameter_sets: a list of parameter sets (see parameter_grid), or a grid {name: list of values}.
+            Parameters missing from a set take their default value.
+        replicates: number of runs of each parameter set, each with its own seed.
+        output: directory of the Parquet files, one per run.
+        steps: number of steps of each run.
+        processes: size of the process pool (default: the number of CPUs).
+        base_seed: seed from which the seed of each run is derived.
+        engine: the WolfSheep engine used for the runs.
+        stop_conditions: conditions stopping a run before steps steps (see prey_predator.stopping), for
+            instance [Extinction()] not to simulate the regrowth of the grass once the animals are extinct.
+        cache: the directory of a result cache (see prey_predator.cache), shared by the workers : runs already
+            cached, by this sweep or another one, are not simulated again.
+    Returns the paths of the runs written by this call; runs already in output are skipped.
+    """
+    _import_pyarrow()
+    if isinstance(parameter_sets, dict):
+        parameter_sets = parameter_grid(parameter_sets)
+    os.makedirs(output, exist_ok=True)
+    done = set(os.listdir(output))
+
+    runs = []
+    for parameters in parameter_sets:
+        parameters = {**default_parameters(), **parameters}
+        for replicate in range(replicates):
+            key = run_key(
+                parameters, replicate, steps, engine, base_seed, stop_conditions
+            )
+            if run_filename(key) not in done:
+                seed = run_seed(key)
+                runs.append(
+                    (
+                        parameters,
+                        replicate,
+                        key,
+                        seed,
+                        steps,
+                        engine,
+                        output,
+                        stop_conditions,
+                        cache,
+                    )
+                )
+
+    written = []
+    with ProcessPoolExecutor(processes) as pool:
+        futures = [pool.submit(run_one, *run) for run in runs]
+        for future in as_completed(futures):
+            written.append(future.result())
+    return written
+
+
+def read_sweep(output):
+    """
+    Reads all the runs of a sweep output directory as one pyarrow Table."""
+    pa = _import_pyarrow()
+    import pyarrow.dataset
+
+    return pa.dataset.dataset(output, format="parquet").to_table()
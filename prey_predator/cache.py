@@ -0,0 +1,181 @@
+"""
+Persistent cache of the results of Wolf-Sheep runs.
+
+A run is identified by a content hash of everything its result depends on : the model class and its full
+constructor arguments (parameters, seed, engine, scheduler, random mode, collection settings), the number of steps
+reached, the stop conditions, and the version of the code (a hash of the sources of the package). The cache
+directory holds one compressed .npz entry per run, named by this hash : the final summary of the run and the
+checkpoint of its final state, which holds the collected series as well.
+
+A model built with a cache (WolfSheep(..., cache=directory)) consults it in run_model and run_until : on a hit, the
+model is loaded with the cached state instead of simulating the steps, and ends exactly as if it had run them.
+Only runs with a seed are cached.
+
+Entries are written to a temporary file then renamed, so that concurrent readers only ever see complete entries,
+and processes running the same configuration at once just write the same entry twice. Reading an entry marks it
+as recently used : once the directory is above max_bytes, the least recently used entries are evicted.
+"""
+
+import functools
+import hashlib
+import json
+import os
+import time
+import uuid
+import zipfile
+from collections import namedtuple
+
+import numpy as np
+
+from prey_predator.agents import Sheep, Wolf
+from prey_predator.checkpoint import get_state, remove_agents, set_state
+from prey_predator.stopping import condition_key
+
+# version of the layout of the entries
+CACHE_FORMAT = 1
+# temporary files older than this (in seconds) were left by crashed writers
+STALE_AGE = 3600
+
+CachedRun = namedtuple("CachedRun", ["summary", "series", "state"])
+CachedRun.__doc__ = """
+A cached run : its summary (the result returned by the run, its final step, numbers of sheep and wolves, grown
+grass and stop reason), its collected series ({name: array}) and the checkpoint state of its final step."""
+
+
+@functools.lru_cache(maxsize=None)
+def code_version():
+    """
+    Returns a hash of the sources of the prey_predator package : results of another version of the code are
+    not reused."""
+    digest = hashlib.sha256()
+    package = os.path.dirname(os.path.abspath(__file__))
+    for name in sorted(os.listdir(package)):
+        if name.endswith(".py"):
+            digest.update(name.encode())
+            with open(os.path.join(package, name), "rb") as file:
+                digest.update(file.read())
+    return digest.hexdigest()
+
+
+def cache_key(arguments, steps, stop_conditions=()):
+    """
+    Returns the key of a run : the hash of its constructor arguments (JSON values), the number of steps reached,
+    its stop conditions (by their class and parameters, see stopping.condition_key) and the version of the code.
+    Returns None if one of the stop conditions cannot be identified : the run is not cached."""
+    conditions = [condition_key(condition) for condition in stop_conditions]
+    if None in conditions:
+        return None
+    settings = {
+        "format": CACHE_FORMAT,
+        "code": code_version(),
+        "arguments": arguments,
+        "steps": steps,
+        "stop_conditions": conditions,
+    }
+    canonical = json.dumps(settings, sort_keys=True)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def run_summary(model, result=None):
+    """
+    Returns the final summary of a run, which returned result."""
+    return {
+        "result": result,
+        "steps": model.schedule.steps,
+        "sheep": model.get_breed_count(Sheep),
+        "wolves": model.get_breed_count(Wolf),
+        "grown_grass": model.grass_field.count_grown(),
+        "stop_reason": model.stop_reason,
+    }
+
+
+class ResultCache:
+    """
+    A directory of cached runs, holding at most max_bytes (the least recently used entries being evicted).
+    Hits and misses of this instance are counted in hits and misses.
+    """
+
+    def __init__(self, directory, max_bytes=2**30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".npz")
+
+    def get(self, key):
+        """
+        Returns the CachedRun of a key, or None if it is not in the cache."""
+        path = self.path(key)
+        try:
+            with np.load(path) as archive:
+                arrays = {name: archive[name] for name in archive.files}
+            # the entry was used : it is evicted last
+            os.utime(path)
+        except (OSError, ValueError, zipfile.BadZipFile):
+            # missing, evicted meanwhile, or corrupted
+            self.misses += 1
+            return None
+        self.hits += 1
+        summary = json.loads(arrays.pop("summary").tobytes().decode())
+        series = {
+            name[len("collector/") :]: values
+            for name, values in arrays.items()
+            if name.startswith("collector/")
+        }
+        return CachedRun(summary, series, arrays)
+
+    def put(self, key, model, result=None):
+        """
+        Stores the final state of a run (which returned result), then evicts the least recently used entries
+        above max_bytes."""
+        arrays = get_state(model)
+        summary = run_summary(model, result)
+        arrays["summary"] = np.frombuffer(json.dumps(summary).encode(), dtype=np.uint8)
+        tmp_path = os.path.join(
+            self.directory, ".{}-{}.tmp".format(key, uuid.uuid4().hex)
+        )
+        with open(tmp_path, "wb") as file:
+            np.savez_compressed(file, **arrays)
+        os.replace(tmp_path, self.path(key))
+        self.evict()
+
+    def load(self, key, model):
+        """
+        Loads the cached final state of a run into model (built with the same arguments), and returns its
+        CachedRun, or returns None if the run is not in the cache."""
+        cached = self.get(key)
+        if cached is not None:
+            remove_agents(model)
+            set_state(model, cached.state)
+        return cached
+
+    def evict(self):
+        """
+        Removes the least recently used entries while the cache holds more than max_bytes (the last entry
+        is kept), and the temporary files left by crashed writers."""
+        entries = []
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            try:
+                stat = entry.stat()
+                if entry.name.endswith(".tmp"):
+                    if now - stat.st_mtime > STALE_AGE:
+                        os.remove(entry.path)
+                elif entry.name.endswith(".npz"):
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            except FileNotFoundError:
+                # removed by another process
+                pass
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for mtime, size, path in entries[:-1]:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
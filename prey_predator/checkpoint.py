@@ -0,0 +1,218 @@
+"""
+Checkpoints of a running Wolf-Sheep model.
+
+A checkpoint is a NumPy .npz archive : the agents are stored as arrays (one per attribute and breed) rather
+than pickled objects, along with the grass field, the collected series, the id counter and the state of
+the random generators. Restoring a checkpoint gives back a model which continues exactly as the saved one
+would have.
+"""
+
+import json
+import os
+
+import numpy as np
+
+from prey_predator.agents import Sheep, Wolf
+from prey_predator.array_engine import BreedArrays
+from prey_predator.params import PARAMETER_NAMES
+from prey_predator.schedule import ArrayActivationByBreed
+
+BREEDS = {"Sheep": Sheep, "Wolf": Wolf}
+AGENT_ATTRIBUTES = ("unique_id", "energy", "age", "last_ate")
+DENSITIES = ("sheep", "wolf", "grass")
+
+
+def get_state(model):
+    """
+    Returns the state of a model, as a dict of NumPy arrays (metadata being JSON encoded in "meta")."""
+    version, internal_state, gauss_next = model.random.getstate()
+    # the draws of the current batch of moves not consumed yet
+    move_draws = list(model.move_draws)
+    model.move_draws = iter(move_draws)
+    meta = {
+        "parameters": {name: getattr(model, name) for name in PARAMETER_NAMES},
+        "seed": model.seed,
+        "engine": "arrays" if model.array_engine is not None else "agents",
+        "scheduler": "array" if isinstance(model.schedule, ArrayActivationByBreed) else "dict",
+        "rng": "counter" if model.counter_rng is not None else "sequential",
+        "bulk_init": model.bulk_init,
+        "counter_key": model.counter_rng.key if model.counter_rng is not None else None,
+        "current_id": model.current_id,
+        "running": model.running,
+        "stop_reason": model.stop_reason,
+        "steps": model.schedule.steps,
+        "time": model.schedule.time,
+        "random": [version, gauss_next],
+        "np_random": model.np_random.bit_generator.state,
+        "breeds": [breed.__name__ for breed in model.schedule.breeds],
+        "datacollector": {
+            "every": model.datacollector.every,
+            "capacity": model.datacollector.capacity,
+            "spill_bytes": model.datacollector.spill_bytes,
+            "age_bins": model.datacollector.age_bins,
+        },
+    }
+    state = {
+        "meta": np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8),
+        "random": np.array(internal_state, dtype=np.uint32),
+        "move_draws": np.array(move_draws, dtype=np.float64),
+        "grass_present": model.grass_field.present,
+        "grass_grown": model.grass_field.grown,
+        "grass_countdown": model.grass_field.countdown,
+    }
+    # the initial density maps are part of the cache key of the model
+    for name, density in zip(DENSITIES, model.densities):
+        if density is not None:
+            state["density/" + name] = np.asarray(density, dtype=np.float64)
+    for name, column in model.datacollector.get_series().items():
+        state["collector/" + name] = column
+
+    if model.array_engine is not None:
+        engine = model.array_engine
+        for name, breed in BREEDS.items():
+            arrays = engine.breed_arrays(breed)
+            for attribute in arrays.dtypes:
+                state["{}/{}".format(name, attribute)] = getattr(arrays, attribute)
+        state["sheep_arrival"] = engine.sheep_arrival
+        return state
+
+    # agents, in the order of the scheduler
+    for name, breed in BREEDS.items():
+        agents = model.schedule.get_breed_agents(breed)
+        for attribute in AGENT_ATTRIBUTES:
+            state["{}/{}".format(name, attribute)] = np.array(
+                [getattr(agent, attribute) for agent in agents]
+            )
+        state[name + "/pos"] = np.array(
+            [agent.pos for agent in agents], dtype=np.int64
+        ).reshape(-1, 2)
+        state[name + "/moore"] = np.array([agent.moore for agent in agents], dtype=bool)
+    # global order of the scheduler, and order of the agents in the cells of the grid
+    state["schedule_order"] = np.array(
+        [agent.unique_id for agent in model.schedule.agents], dtype=np.int64
+    )
+    state["grid_order"] = np.array(
+        [agent.unique_id for cell, x, y in model.grid.coord_iter() for agent in cell],
+        dtype=np.int64,
+    )
+    return state
+
+
+def remove_agents(model):
+    """
+    Removes every sheep and wolf of a model, so that a state can be loaded into it."""
+    if model.array_engine is not None:
+        model.array_engine.sheep = BreedArrays()
+        model.array_engine.wolves = BreedArrays()
+        model.array_engine.sheep_arrival = np.zeros(0)
+        return
+    for agent in list(model.schedule.agents):
+        model.grid.remove_agent(agent)
+        model.schedule.remove(agent)
+
+
+def set_state(model, state):
+    """
+    Loads a state returned by get_state into a model without agents nor grass, built with the same engine."""
+    meta = json.loads(state["meta"].tobytes().decode())
+    model.current_id = meta["current_id"]
+    model.running = meta["running"]
+    model.stop_reason = meta.get("stop_reason")
+    model.schedule.steps = meta["steps"]
+    model.schedule.time = meta["time"]
+    version, gauss_next = meta["random"]
+    model.random.setstate((version, tuple(state["random"].tolist()), gauss_next))
+    model.np_random.bit_generator.state = meta["np_random"]
+    if model.counter_rng is not None:
+        model.counter_rng.key = meta["counter_key"]
+    model.move_draws = iter(state["move_draws"].tolist())
+    model.grass_field.present[...] = state["grass_present"]
+    model.grass_field.grown[...] = state["grass_grown"]
+    model.grass_field.recount()
+    model.grass_field.countdown = state["grass_countdown"]
+
+    collector = model.datacollector
+    size = len(state["collector/Step"])
+    while collector.capacity < size:
+        collector._grow()
+    for name in collector.layout:
+        collector._columns[name][:size] = state["collector/" + name]
+    collector.size = size
+
+    if model.array_engine is not None:
+        engine = model.array_engine
+        for name, breed in BREEDS.items():
+            arrays = engine.breed_arrays(breed)
+            for attribute in arrays.dtypes:
+                setattr(arrays, attribute, state["{}/{}".format(name, attribute)].copy())
+        engine.sheep_arrival = state["sheep_arrival"].copy()
+        model.statistics.rebuild()
+        return
+
+    agents = {}
+    for name, breed in BREEDS.items():
+        columns = [state["{}/{}".format(name, attribute)] for attribute in AGENT_ATTRIBUTES]
+        columns += [state[name + "/pos"], state[name + "/moore"]]
+        for unique_id, energy, age, last_ate, pos, moore in zip(*columns):
+            agent = breed(
+                int(unique_id),
+                tuple(pos.tolist()),
+                model,
+                moore=bool(moore),
+                energy=energy.item(),
+            )
+            agent.age = int(age)
+            agent.last_ate = int(last_ate)
+            agents[agent.unique_id] = agent
+    # breeds are stepped in the order they were first added to the scheduler
+    for name in meta["breeds"]:
+        model.schedule.add_breed(BREEDS[name])
+    for unique_id in state["schedule_order"].tolist():
+        model.schedule.add(agents[unique_id])
+    for unique_id in state["grid_order"].tolist():
+        agent = agents[unique_id]
+        model.grid.place_agent(agent, agent.pos)
+    # the agents were loaded without their events
+    model.statistics.rebuild()
+
+
+def save_checkpoint(model, path, compress=False):
+    """
+    Saves the state of a model in the file path. The file is replaced atomically, so that a crash while
+    saving leaves the previous checkpoint intact."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as file:
+        (np.savez_compressed if compress else np.savez)(file, **get_state(model))
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(model_class, path):
+    """
+    Returns a new model of class model_class restored from the checkpoint file path."""
+    with np.load(path) as archive:
+        state = {name: archive[name] for name in archive.files}
+    meta = json.loads(state["meta"].tobytes().decode())
+    parameters = meta["parameters"]
+    # build an empty model, then fill it with the saved state
+    model = model_class(
+        seed=meta.get("seed"),
+        engine=meta["engine"],
+        scheduler=meta["scheduler"],
+        rng=meta.get("rng", "sequential"),
+        **{**parameters, "initial_sheep": 0, "initial_wolves": 0, "grass": False}
+    )
+    model.initial_sheep = parameters["initial_sheep"]
+    model.initial_wolves = parameters["initial_wolves"]
+    model.grass = parameters["grass"]
+    # the initial agents are not drawn again, but the model keeps how they were, as the original did
+    model.bulk_init = meta.get("bulk_init", False)
+    model.densities = tuple(state.get("density/" + name) for name in DENSITIES)
+    collector = meta["datacollector"]
+    model.datacollector = type(model.datacollector)(
+        every=collector["every"],
+        capacity=collector["capacity"],
+        spill_bytes=collector["spill_bytes"],
+        age_bins=collector["age_bins"],
+    )
+    set_state(model, state)
+    return model
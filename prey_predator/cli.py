@@ -0,0 +1,247 @@
+"""
+Headless command line interface of the Wolf-Sheep model.
+
+    $ python -m prey_predator --steps 500 --seed 1 --initial-sheep 300 --output series.csv
+
+The model is built from the shared parameter specification, overridden by an optional JSON config file,
+then by the flags. It runs the requested number of steps and writes the collected series as CSV
+(or Parquet, for an output ending in .parquet). The visualization stack is never imported.
+"""
+
+import argparse
+import csv
+import json
+import subprocess
+import sys
+
+from prey_predator.params import PARAMETERS, default_parameters
+
+# Time allowed to import the command line interface and the model, in seconds.
+IMPORT_BUDGET = 0.3
+# Modules which must not be imported by a headless run.
+VISUALIZATION_MODULES = ("mesa.visualization", "tornado", "prey_predator.server")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m prey_predator",
+        description="Run the Wolf-Sheep model without its visualization server.",
+    )
+    parser.add_argument("--steps", type=int, default=100, help="number of steps")
+    parser.add_argument("--seed", type=int, default=None, help="random seed")
+    parser.add_argument("--engine", choices=["agents", "arrays"], default="agents")
+    parser.add_argument(
+        "--scheduler",
+        choices=["dict", "array"],
+        default="dict",
+        help="scheduler of the agents : array keeps each breed in a NumPy array of agents",
+    )
+    parser.add_argument(
+        "--rng",
+        choices=["sequential", "counter"],
+        default="sequential",
+        help="random mode : counter-based draws give the same run with every engine",
+    )
+    parser.add_argument(
+        "--collect-every", type=int, default=1, help="collect the series every N steps"
+    )
+    parser.add_argument(
+        "--config", help="JSON file of parameter values, overridden by the flags"
+    )
+    parser.add_argument(
+        "--output", default="-", help="CSV or .parquet file of the series (- for stdout)"
+    )
+    parser.add_argument(
+        "--stop-on-extinction",
+        action="store_true",
+        help="stop once there is neither sheep nor wolf left",
+    )
+    parser.add_argument(
+        "--population-cap", type=int, help="stop once there are more animals than this"
+    )
+    parser.add_argument(
+        "--steady-window",
+        type=int,
+        help="stop once the populations stayed within 5%% over this many steps",
+    )
+    parser.add_argument(
+        "--trace",
+        help="instrument the run and write the timings of its phases as a Chrome trace (JSON) file",
+    )
+    parser.add_argument(
+        "--record",
+        help="record the run to this file, to replay it in the server (python run.py --replay FILE) or query it",
+    )
+    parser.add_argument(
+        "--cache",
+        help="directory of a result cache : a run already cached is loaded instead of simulated (needs --seed)",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=float,
+        default=1024,
+        help="size of the result cache, in MiB (default: 1024)",
+    )
+    parser.add_argument(
+        "--bulk-init",
+        action="store_true",
+        help="create the initial agents and grass in bulk, with vectorized draws",
+    )
+    for breed in ("sheep", "wolf", "grass"):
+        parser.add_argument(
+            "--{}-density".format(breed),
+            help="NumPy .npy file of the initial density map of the {} (implies --bulk-init)".format(breed),
+        )
+    parser.add_argument(
+        "--check-import-budget",
+        action="store_true",
+        help="measure the import time of a headless run and check it against the budget",
+    )
+    parameters = parser.add_argument_group("model parameters")
+    for parameter in PARAMETERS:
+        flag = "--" + parameter.name.replace("_", "-")
+        if isinstance(parameter.value, bool):
+            parameters.add_argument(
+                flag,
+                dest=parameter.name,
+                action=argparse.BooleanOptionalAction,
+                default=None,
+                help="{} (default: {})".format(parameter.description, parameter.value),
+            )
+        else:
+            parameters.add_argument(
+                flag,
+                dest=parameter.name,
+                type=type(parameter.value),
+                default=None,
+                help="{} (default: {})".format(parameter.description, parameter.value),
+            )
+    return parser
+
+
+def model_parameters(args):
+    """
+    Returns the parameters of the model : the defaults, updated by the config file, then by the flags."""
+    parameters = default_parameters()
+    if args.config:
+        with open(args.config) as config:
+            values = json.load(config)
+        unknown = set(values) - set(parameters)
+        if unknown:
+            raise ValueError("Unknown parameters in config: {}".format(sorted(unknown)))
+        parameters.update(values)
+    for name in parameters:
+        value = getattr(args, name)
+        if value is not None:
+            parameters[name] = value
+    return parameters
+
+
+def density_maps(args):
+    """
+    Returns the initial density maps given by the flags, as model arguments."""
+    import numpy as np
+
+    maps = {}
+    for breed in ("sheep", "wolf", "grass"):
+        path = getattr(args, breed + "_density")
+        if path is not None:
+            maps[breed + "_density"] = np.load(path)
+    return maps
+
+
+def stop_conditions(args):
+    """
+    Returns the stop conditions requested by the flags."""
+    from prey_predator.stopping import Extinction, PopulationCap, SteadyState
+
+    conditions = []
+    if args.stop_on_extinction:
+        conditions.append(Extinction())
+    if args.population_cap is not None:
+        conditions.append(PopulationCap(args.population_cap))
+    if args.steady_window is not None:
+        conditions.append(SteadyState(args.steady_window))
+    return conditions
+
+
+def write_series(series, output):
+    """
+    Writes the collected one-dimensional series {name: array}, as CSV or Parquet."""
+    columns = {name: values for name, values in series.items() if values.ndim == 1}
+    if output.endswith(".parquet"):
+        import pyarrow
+        import pyarrow.parquet
+
+        pyarrow.parquet.write_table(pyarrow.table(columns), output)
+        return
+    stream = sys.stdout if output == "-" else open(output, "w", newline="")
+    try:
+        writer = csv.writer(stream)
+        writer.writerow(columns)
+        writer.writerows(zip(*(values.tolist() for values in columns.values())))
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+
+
+def check_import_budget():
+    """
+    Measures, in a fresh interpreter, the time to import the command line interface and the model,
+    and checks that it fits in IMPORT_BUDGET without importing the visualization stack.
+    Returns the exit code."""
+    code = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        "import prey_predator.cli, prey_predator.model\n"
+        "print(time.perf_counter() - start)\n"
+        "print(' '.join(name for name in sys.modules if name.startswith({!r})))\n"
+    ).format(VISUALIZATION_MODULES)
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    elapsed, imported = result.stdout.splitlines()
+    elapsed = float(elapsed)
+    print("import time: {:.3f}s (budget {:.3f}s)".format(elapsed, IMPORT_BUDGET))
+    if imported:
+        print("visualization modules imported: {}".format(imported))
+    return 0 if elapsed <= IMPORT_BUDGET and not imported else 1
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.check_import_budget:
+        return check_import_budget()
+
+    from prey_predator.cache import ResultCache
+    from prey_predator.datacollection import ColumnarDataCollector
+    from prey_predator.model import WolfSheep
+
+    cache = None
+    if args.cache is not None:
+        cache = ResultCache(args.cache, max_bytes=int(args.cache_size * 2**20))
+
+    model = WolfSheep(
+        seed=args.seed,
+        engine=args.engine,
+        scheduler=args.scheduler,
+        datacollector=ColumnarDataCollector(every=args.collect_every),
+        instrument=args.trace is not None,
+        record=args.record,
+        rng=args.rng,
+        cache=cache,
+        bulk_init=args.bulk_init,
+        **density_maps(args),
+        **model_parameters(args)
+    )
+    reason = model.run_until(*stop_conditions(args), max_steps=args.steps)
+    if reason is not None:
+        print(
+            "stopped at step {}: {}".format(model.schedule.steps, reason), file=sys.stderr
+        )
+    if args.trace is not None:
+        model.instrumentation.dump_chrome_trace(args.trace)
+    if model.recorder is not None:
+        model.recorder.close()
+    write_series(model.datacollector.get_series(), args.output)
+    return 0
@@ -0,0 +1,242 @@
+"""
+Columnar data collection.
+
+The series of the model are stored in preallocated NumPy columns, doubled in size whenever they are full,
+instead of Python lists of per-step values. Collection can happen every N steps, or when a trigger fires.
+Past a configurable size, the columns are moved to memory-mapped files so that very long runs do not
+have to fit in memory.
+"""
+
+import os
+import shutil
+import tempfile
+import weakref
+from collections.abc import Sequence
+
+import numpy as np
+
+from prey_predator.agents import Sheep, Wolf
+
+
+def age_histogram(age, life_expectancy, bins, weights=None):
+    """
+    Returns the histogram of the given ages, in bins bins of equal width spanning the life expectancy
+    (older agents are counted in the last bin). weights are the numbers of agents of each age, if given."""
+    index = np.minimum(age * bins // max(life_expectancy, 1), bins - 1)
+    if weights is None:
+        return np.bincount(index, minlength=bins)
+    return np.bincount(index, weights=weights, minlength=bins).astype(np.int64)
+
+
+def breed_summary(model, breed, age_bins):
+    """
+    Returns the number of agents of a breed, their total energy and the histogram of their ages.
+    They are read from the model's PopulationStatistics if it has some, and computed from its agents otherwise.
+    Summaries of several parts of a model add up to the summary of the whole model."""
+    statistics = getattr(model, "statistics", None)
+    if statistics is not None:
+        return statistics.summary(breed, age_bins)
+    energy = model.get_breed_values(breed, "energy")
+    age = model.get_breed_values(breed, "age")
+    return (
+        len(energy),
+        energy.sum(),
+        age_histogram(age, model.get_life_expectancy(breed), age_bins),
+    )
+
+
+class Series(Sequence):
+    """
+    A read-only view on the collected part of a column, giving back Python values (as mesa's
+    DataCollector lists do), so that it can be sent to the visualization as is."""
+
+    def __init__(self, collector, name):
+        self.collector = collector
+        self.name = name
+
+    def __len__(self):
+        return self.collector.size
+
+    def __getitem__(self, index):
+        return self.collector.get_column(self.name)[index].tolist()
+
+
+class ColumnarDataCollector:
+    """
+    Collects the series of a WolfSheep model into NumPy columns.
+
+    Each collection records the step, the number of wolves and sheep, the number of grown grass patches,
+    the total and mean energy of each breed, and a histogram of the ages of each breed (age_bins bins
+    spanning the breed's life expectancy).
+
+    Args:
+        every: collect every `every` steps.
+        triggers: callables taking the model, collection also happens on steps where one returns True.
+        capacity: initial number of rows of the columns.
+        spill_bytes: size of the columns past which they are moved to memory-mapped files.
+        spill_dir: directory of the memory-mapped files (default: a new temporary directory, removed with the
+        collector or by close).
+        age_bins: number of bins of the age histograms.
+    """
+
+    def __init__(
+        self,
+        every=1,
+        triggers=(),
+        capacity=1024,
+        spill_bytes=256 * 2**20,
+        spill_dir=None,
+        age_bins=10,
+    ):
+        self.every = every
+        self.triggers = list(triggers)
+        self.spill_bytes = spill_bytes
+        self.spill_dir = spill_dir
+        self.age_bins = age_bins
+        self.spilled = False
+        self.size = 0
+        self.capacity = capacity
+        # name -> (dtype, shape of one row)
+        self.layout = {
+            "Step": (np.int64, ()),
+            "Wolves": (np.int64, ()),
+            "Sheep": (np.int64, ()),
+            "Grown grass": (np.int64, ()),
+            "Total sheep energy": (np.float64, ()),
+            "Mean sheep energy": (np.float64, ()),
+            "Total wolf energy": (np.float64, ()),
+            "Mean wolf energy": (np.float64, ()),
+            "Sheep ages": (np.int64, (age_bins,)),
+            "Wolf ages": (np.int64, (age_bins,)),
+        }
+        self._generation = 0
+        # removes the temporary spill directory, once the collector created one
+        self._cleanup = None
+        self._columns = {
+            name: self._allocate(name, capacity) for name in self.layout
+        }
+
+    @property
+    def model_vars(self):
+        """
+        The collected one-dimensional series, as in mesa's DataCollector : {name: sequence of values}."""
+        return {
+            name: Series(self, name)
+            for name, (dtype, shape) in self.layout.items()
+            if not shape
+        }
+
+    def get_column(self, name):
+        """
+        Returns the collected part of a column, as a NumPy array (a view, not a copy)."""
+        return self._columns[name][: self.size]
+
+    def get_series(self):
+        """
+        Returns the collected part of every column, as a dict of NumPy arrays."""
+        return {name: self.get_column(name) for name in self.layout}
+
+    def get_model_vars_dataframe(self):
+        """
+        Returns the one-dimensional series as a pandas DataFrame indexed by step."""
+        import pandas as pd
+
+        series = {name: self.get_column(name) for name in self.model_vars}
+        return pd.DataFrame(series).set_index("Step")
+
+    def should_collect(self, model):
+        """
+        Returns True if the data is to be collected at the current step : if the step is a multiple of
+        `every`, or if a trigger fires."""
+        return model.schedule.steps % self.every == 0 or any(
+            trigger(model) for trigger in self.triggers
+        )
+
+    def collect(self, model):
+        """
+        Called by the model at the end of each step : collects the data if should_collect says so."""
+        if self.should_collect(model):
+            self.collect_now(model)
+
+    def collect_now(self, model):
+        """
+        Collects a new row of data."""
+        self.record(
+            model.schedule.steps,
+            model.grass_field.count_grown(),
+            {breed: breed_summary(model, breed, self.age_bins) for breed in (Sheep, Wolf)},
+        )
+
+    def record(self, step, grown_grass, summaries):
+        """
+        Records a new row of data, from the number of grown grass patches and the breed_summary of each breed
+        (which may have been summed over several parts of a model)."""
+        if self.size == self.capacity:
+            self._grow()
+        row = self.size
+        columns = self._columns
+        columns["Step"][row] = step
+        columns["Grown grass"][row] = grown_grass
+        for breed, name, label in ((Sheep, "Sheep", "sheep"), (Wolf, "Wolves", "wolf")):
+            count, total_energy, ages = summaries[breed]
+            columns[name][row] = count
+            columns["Total {} energy".format(label)][row] = total_energy
+            columns["Mean {} energy".format(label)][row] = (
+                total_energy / count if count else np.nan
+            )
+            columns["{} ages".format(label.capitalize())][row] = ages
+        self.size += 1
+
+    def age_histogram(self, age, life_expectancy):
+        """
+        Returns the histogram of the given ages, in age_bins bins of equal width spanning the life expectancy
+        (older agents are counted in the last bin)."""
+        return age_histogram(age, life_expectancy, self.age_bins)
+
+    def close(self):
+        """
+        Removes the temporary directory of the memory-mapped columns, if the collector created one (it is
+        removed anyway once the collector is garbage collected). The columns must not be used afterwards."""
+        if self._cleanup is not None:
+            self._cleanup()
+
+    def nbytes(self, capacity):
+        """
+        Returns the size in bytes of the columns for a given capacity."""
+        return sum(
+            capacity * int(np.prod(shape, dtype=np.int64)) * np.dtype(dtype).itemsize
+            for dtype, shape in self.layout.values()
+        )
+
+    def _allocate(self, name, capacity):
+        dtype, shape = self.layout[name]
+        if not self.spilled:
+            return np.zeros((capacity,) + shape, dtype=dtype)
+        path = os.path.join(
+            self.spill_dir, "{}-{}.npy".format(name.replace(" ", "_"), self._generation)
+        )
+        return np.lib.format.open_memmap(
+            path, mode="w+", dtype=dtype, shape=(capacity,) + shape
+        )
+
+    def _grow(self):
+        """
+        Doubles the capacity of the columns, moving them to memory-mapped files once they get too big."""
+        capacity = self.capacity * 2
+        if not self.spilled and self.nbytes(capacity) > self.spill_bytes:
+            self.spilled = True
+            if self.spill_dir is None:
+                self.spill_dir = tempfile.mkdtemp(prefix="prey_predator-")
+                self._cleanup = weakref.finalize(
+                    self, shutil.rmtree, self.spill_dir, ignore_errors=True
+                )
+        self._generation += 1
+        for name, old in self._columns.items():
+            new = self._allocate(name, capacity)
+            new[: self.size] = old[: self.size]
+            self._columns[name] = new
+            if isinstance(old, np.memmap):
+                path = old.filename
+                del old
+                os.remove(path)
+        self.capacity = capacity
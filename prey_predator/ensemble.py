@@ -0,0 +1,209 @@
+"""
+Replicate ensembles of the Wolf-Sheep model, simulated at once in a single process.
+
+The R replicates of an ensemble share the same parameters and are stacked along a replicate axis : replicate r
+owns the cells r * width * height to (r + 1) * width * height - 1 of one array engine (its own torus), and
+the rows r * width to (r + 1) * width - 1 of one grass field. Every phase of a step thus runs once for the
+whole ensemble, instead of once per model.
+Each replicate draws its random numbers from its own generator, spawned from the seed of the ensemble : a
+replicate evolves the same whatever the number of replicates it is simulated with.
+Once a replicate has neither sheep nor wolves it is extinct : it costs no draw anymore, and its grass is not
+reported anymore.
+
+    >>> result = run_ensemble(replicates=200, steps=300, seed=1, sheep_reproduce=0.1)
+    >>> result.mean["Sheep"], result.quantiles["Sheep"]
+"""
+
+import warnings
+from collections import namedtuple
+
+import numpy as np
+
+from prey_predator.agents import Sheep, Wolf
+from prey_predator.array_engine import ArrayEngine, BreedArrays
+from prey_predator.grass import GrassField
+from prey_predator.params import PARAMETER_NAMES, default_parameters
+from prey_predator.space import torus_neighbourhood_table
+
+EnsembleResult = namedtuple(
+    "EnsembleResult", ["series", "mean", "quantiles", "extinction_step"]
+)
+EnsembleResult.__doc__ = """
+Results of an ensemble run.
+
+series: {name: array of shape (steps, replicates)} for the "Sheep", "Wolves" and "Grown grass" series
+(the grass of a replicate is NaN after its extinction).
+mean: {name: array of shape (steps,)}, the ensemble mean of each series.
+quantiles: {name: array of shape (number of quantiles, steps)}, the ensemble quantiles of each series.
+extinction_step: for each replicate, the step it went extinct at, or -1."""
+
+
+class EnsembleEngine(ArrayEngine):
+    """
+    The array engine of an ensemble. Cells are flat indices r * width * height + x * height + y.
+    The agents of a breed are grouped by replicate at the start of each phase, so that the draws of each
+    replicate are taken from its own generator in one call.
+    """
+
+    def __init__(self, model, moore=True):
+        self.model = model
+        self.replicates = model.replicates
+        self.cells_count = model.width * model.height
+        # the grid of the engine is the stack of the tori of the replicates
+        self.width = model.replicates * model.width
+        self.height = model.height
+        self.moves = torus_neighbourhood_table(model.width, model.height, moore, True)
+        self.sheep = BreedArrays()
+        self.wolves = BreedArrays()
+        self.sheep_arrival = np.zeros(0)
+
+    def replicate_counts(self, breed):
+        """
+        Returns the number of agents of a breed in each replicate."""
+        return np.bincount(breed.cell // self.cells_count, minlength=self.replicates)
+
+    def blocks(self, breed):
+        """
+        Yields the generator, start and size of the block of each replicate having agents of the breed
+        (the agents being grouped by replicate)."""
+        counts = self.replicate_counts(breed)
+        starts = np.cumsum(counts) - counts
+        for r in np.flatnonzero(counts).tolist():
+            yield self.model.generators[r], int(starts[r]), int(counts[r])
+
+    def activation_order(self, breed):
+        """
+        Groups the agents by replicate (kids having been appended at the end), in random order within
+        their replicate."""
+        order = np.argsort(breed.cell // self.cells_count, kind="stable")
+        for rng, start, n in self.blocks(breed):
+            order[start : start + n] = order[start : start + n][rng.permutation(n)]
+        return order
+
+    def move_draws(self, breed):
+        draws = np.empty(len(breed), dtype=np.int64)
+        for rng, start, n in self.blocks(breed):
+            draws[start : start + n] = rng.integers(0, self.moves.shape[1], n)
+        return draws
+
+    def uniform_draws(self, breed):
+        draws = np.empty(len(breed))
+        for rng, start, n in self.blocks(breed):
+            draws[start : start + n] = rng.random(n)
+        return draws
+
+    def random_move(self, breed, move_energy):
+        """
+        Every agent steps one cell of its replicate's torus in any allowable direction (or stays), and loses
+        move_energy."""
+        local = breed.cell % self.cells_count
+        breed.cell = breed.cell - local + self.moves[local, self.move_draws(breed)]
+        breed.energy -= move_energy
+
+
+class WolfSheepEnsemble:
+    """
+    R replicates of a Wolf-Sheep model, with the rules of the array engine, stepped together.
+
+    Args:
+        replicates: the number of replicates.
+        seed: seed of the ensemble, from which the generator of each replicate is spawned.
+        parameters: the parameters of WolfSheep, missing ones taking their default value.
+    """
+
+    def __init__(self, replicates, seed=None, **parameters):
+        unknown = set(parameters) - set(PARAMETER_NAMES)
+        if unknown:
+            raise ValueError("Unknown parameters: {}".format(sorted(unknown)))
+        for name, value in {**default_parameters(), **parameters}.items():
+            setattr(self, name, value)
+        self.replicates = replicates
+        self.generators = [
+            np.random.default_rng(seed_sequence)
+            for seed_sequence in np.random.SeedSequence(seed).spawn(replicates)
+        ]
+        self.current_id = 0
+        self.steps = 0
+        self.extinction_step = np.full(replicates, -1)
+        self.grass_field = GrassField(
+            self, replicates * self.width, self.height, self.grass_regrowth_time
+        )
+        self.array_engine = EnsembleEngine(self)
+
+        cells_count = self.width * self.height
+        for r, rng in enumerate(self.generators):
+            offset = r * cells_count
+            self.array_engine.add_agents(
+                Sheep, offset + rng.integers(0, cells_count, self.initial_sheep), self.sheep_energy
+            )
+            self.array_engine.add_agents(
+                Wolf, offset + rng.integers(0, cells_count, self.initial_wolves), self.wolf_energy
+            )
+            # grass patches are created with a probability of 0.5 in each cell, as in WolfSheep
+            if self.grass:
+                rows = slice(r * self.width, (r + 1) * self.width)
+                present = rng.random((self.width, self.height)) < 0.5
+                self.grass_field.present[rows] = present
+                self.grass_field.grown[rows] = present
+        self.grass_field.recount()
+        # the initial patches are grown : no growth is scheduled
+        self.grass_field.countdown = self.grass_regrowth_time
+
+    def timed(self, owner, phase, function, *args):
+        return function(*args)
+
+    def counts(self, breed):
+        """
+        Returns the number of agents of a breed in each replicate."""
+        return self.array_engine.replicate_counts(self.array_engine.breed_arrays(breed))
+
+    def alive(self):
+        """
+        Returns the mask of the replicates which are not extinct."""
+        return self.extinction_step < 0
+
+    def grown_grass(self):
+        """
+        Returns the number of grown grass patches of each replicate (NaN for the extinct ones)."""
+        grown = self.grass_field.grown.reshape(self.replicates, -1)
+        return np.where(self.alive(), np.count_nonzero(grown, axis=1), np.nan)
+
+    def step(self):
+        alive = self.alive()
+        self.array_engine.step()
+        if self.grass:
+            # the grass of extinct replicates keeps growing, but only costs the patches due at each step
+            self.grass_field.step()
+        self.steps += 1
+        extinct = alive & (self.counts(Sheep) + self.counts(Wolf) == 0)
+        self.extinction_step[extinct] = self.steps
+
+    def run(self, steps, quantiles=(0.05, 0.5, 0.95)):
+        """
+        Runs the ensemble for a number of steps, and returns its EnsembleResult."""
+        series = {
+            "Sheep": np.zeros((steps, self.replicates), dtype=np.int64),
+            "Wolves": np.zeros((steps, self.replicates), dtype=np.int64),
+            "Grown grass": np.zeros((steps, self.replicates)),
+        }
+        for i in range(steps):
+            self.step()
+            series["Sheep"][i] = self.counts(Sheep)
+            series["Wolves"][i] = self.counts(Wolf)
+            series["Grown grass"][i] = self.grown_grass()
+        with warnings.catch_warnings():
+            # steps at which the grass of every replicate is NaN
+            warnings.simplefilter("ignore", RuntimeWarning)
+            mean = {name: np.nanmean(values, axis=1) for name, values in series.items()}
+            quantile_values = {
+                name: np.nanquantile(values, quantiles, axis=1)
+                for name, values in series.items()
+            }
+        return EnsembleResult(series, mean, quantile_values, self.extinction_step.copy())
+
+
+def run_ensemble(replicates, steps, seed=None, quantiles=(0.05, 0.5, 0.95), **parameters):
+    """
+    Runs replicates replicates of the model with the given parameters (missing ones taking their default value)
+    for steps steps, and returns their EnsembleResult."""
+    return WolfSheepEnsemble(replicates, seed=seed, **parameters).run(steps, quantiles)
@@ -0,0 +1,176 @@
+"""
+Array-backed grass layer.
+
+The grass is not made of agents anymore: every cell of the grid owns a slot in a few NumPy arrays
+(whether a patch exists there, whether it is grown, and its regrowth countdown).
+A patch only changes state once after it is eaten, when its countdown reaches 0 : its regrowth is scheduled
+as an event in a bucket queue keyed by the tick it is due, and each step only touches the patches due this
+tick. The grass thus costs time in proportion to the feeding of the sheep rather than to the area of the grid.
+The number of grown patches is kept up to date the same way, by the patches eaten and grown.
+"""
+
+from collections import defaultdict
+
+import numpy as np
+
+from prey_predator.agents import GrassPatch
+
+
+class GrassField:
+    """
+    The grass of the model, stored as NumPy arrays indexed by [x, y].
+    The semantics are the ones of the former GrassPatch agents : each step, the countdown of every patch
+    decreases by 1, and a patch becomes grown once its countdown reaches 0.
+    The countdowns are not decreased one by one : the field keeps the value each countdown was set to and the
+    tick it was set at, and the countdown property computes them on demand. Countdowns have to be set with
+    set_countdown (or by assigning the countdown property), so that the regrowth of the patch is scheduled.
+    The grown array is changed by add_patch, set_grown, gets_eaten and eat, which keep the number of grown patches
+    and the regrowth of the patches up to date : code setting it directly has to call recount afterwards.
+    """
+
+    def __init__(self, model, width, height, regrowth_time):
+        """
+        Creates an empty grass field (no patch in any cell).
+        Args:
+            model: the according model it belongs to,
+            width, height: the dimensions of the grid,
+            regrowth_time: the countdown a patch gets back when it is eaten.
+        """
+        self.model = model
+        self.width = width
+        self.height = height
+        self.regrowth_time = regrowth_time
+        # whether a cell holds a grass patch at all
+        self.present = np.zeros((width, height), dtype=bool)
+        self.grown = np.zeros((width, height), dtype=bool)
+        # number of grown patches
+        self.grown_count = 0
+        # number of steps of the field so far
+        self.tick = 0
+        # the countdown of a cell is set_value - (tick - set_tick)
+        self.set_value = np.zeros(width * height, dtype=np.int64)
+        self.set_tick = np.zeros(width * height, dtype=np.int64)
+        # {tick: [arrays of the cells whose countdown reaches 0 at this tick]}
+        self.due = defaultdict(list)
+
+    @property
+    def countdown(self):
+        """
+        The countdowns of all the cells, as a (width, height) array (a copy : use set_countdown to change them)."""
+        return (self.set_value - (self.tick - self.set_tick)).reshape(self.width, self.height)
+
+    @countdown.setter
+    def countdown(self, values):
+        # only the growing patches need their growth to be scheduled (present and grown are set first)
+        self.set_value[...] = np.broadcast_to(values, (self.width, self.height)).reshape(-1)
+        self.set_tick[...] = self.tick
+        self.due.clear()
+        growing = np.flatnonzero(self.present & ~self.grown)
+        self.set_countdown(growing, self.set_value[growing])
+
+    def countdown_of(self, cells):
+        """
+        Returns the countdowns of the cells (flat indices x * height + y)."""
+        return self.set_value[cells] - (self.tick - self.set_tick[cells])
+
+    def set_countdown(self, cells, values):
+        """
+        Sets the countdown of the cells (flat indices x * height + y), and schedules the growth of their patches.
+        A countdown set to c grows its patch c steps later (at the next step if c <= 0), as if it was decreased
+        by every step."""
+        cells = np.atleast_1d(cells)
+        values = np.broadcast_to(values, cells.shape)
+        self.set_value[cells] = values
+        self.set_tick[cells] = self.tick
+        due = self.tick + np.maximum(values, 1)
+        if len(cells) and (due == due[0]).all():
+            # the usual case : patches eaten at the same tick with the same regrowth time
+            self.due[int(due[0])].append(cells.copy())
+        else:
+            for tick in np.unique(due).tolist():
+                self.due[tick].append(cells[due == tick])
+
+    def recount(self):
+        """
+        Counts the grown patches again, after the grown array was set directly."""
+        self.grown_count = int(np.count_nonzero(self.grown))
+
+    def set_grown(self, pos, value):
+        """
+        Sets whether the patch of the cell pos is fully grown. A patch which is not grown anymore grows back once
+        its countdown reaches 0 (at the next step if it already has), as if it was decreased by every step."""
+        was_grown = bool(self.grown[pos])
+        self.grown_count += int(bool(value)) - int(was_grown)
+        self.grown[pos] = value
+        if was_grown and not value:
+            cell = pos[0] * self.height + pos[1]
+            self.set_countdown(cell, self.countdown_of(cell))
+
+    def add_patch(self, pos, fully_grown, countdown):
+        """
+        Creates a grass patch in the cell pos."""
+        self.present[pos] = True
+        self.set_grown(pos, fully_grown)
+        cell = pos[0] * self.height + pos[1]
+        if fully_grown:
+            # nothing to schedule
+            self.set_value[cell] = countdown
+            self.set_tick[cell] = self.tick
+        else:
+            self.set_countdown(cell, countdown)
+
+    def step(self):
+        """
+        Each step, the countdown of every patch is decreased by 1, and the patches whose countdown
+        has reached 0 become grown. Only the patches due this tick are checked (a countdown may have been set
+        again since it was scheduled), and cells without a patch are masked out."""
+        self.tick += 1
+        due = self.due.pop(self.tick, None)
+        if due is None:
+            return
+        # a cell may have been scheduled twice for the same tick
+        cells = due[0] if len(due) == 1 else np.unique(np.concatenate(due))
+        grown = self.grown.reshape(-1)
+        cells = cells[
+            (self.countdown_of(cells) <= 0) & self.present.reshape(-1)[cells] & ~grown[cells]
+        ]
+        grown[cells] = True
+        self.grown_count += len(cells)
+
+    def is_grown(self, pos):
+        """
+        Returns True if there is a fully grown grass patch in the cell pos."""
+        return bool(self.grown[pos])
+
+    def gets_eaten(self, pos):
+        """
+        This method will be used when a sheep eats the grass patch of the cell pos.
+        The countdown turns back to its maximum value, and the grown boolean becomes False."""
+        self.set_countdown(pos[0] * self.height + pos[1], self.regrowth_time)
+        self.grown_count -= int(self.grown[pos])
+        self.grown[pos] = False
+
+    def eat(self, cells):
+        """
+        The grown patches of the cells (distinct flat indices x * height + y) are eaten at once."""
+        self.set_countdown(cells, self.regrowth_time)
+        self.grown.reshape(-1)[cells] = False
+        self.grown_count -= len(cells)
+
+    def count_grown(self):
+        """
+        Returns the number of fully grown grass patches."""
+        return self.grown_count
+
+    def patch(self, pos):
+        """
+        Returns a GrassPatch view on the cell pos, or None if there is no grass there."""
+        if not self.present[pos]:
+            return None
+        return GrassPatch(self, pos)
+
+    def patches(self):
+        """
+        Iterates over GrassPatch views of every grass patch of the field."""
+        for x, y in zip(*np.nonzero(self.present)):
+            yield GrassPatch(self, (int(x), int(y)))
@@ -0,0 +1,172 @@
+"""
+Opt-in instrumentation of the steps of the Wolf-Sheep model.
+
+When a model has an Instrumentation (WolfSheep(instrument=True)), each step records the wall time and the number
+of calls of every phase of every breed (the methods listed in the breed's `phases`, the growth of the grass and
+the data collection), along with the births, the deaths and the peak population of the step.
+Without it, the model only checks once per breed and per step that there is no instrumentation.
+"""
+
+import json
+import time
+from collections import defaultdict
+
+import numpy as np
+
+
+class Instrumentation:
+    """
+    Per-step, per-phase timings of a model.
+
+    phase_rows holds (step, owner, phase, calls, seconds) rows, owner being a breed name or a part of the model
+    ("GrassField", "DataCollector"), and step_rows holds (step, start, seconds, population, births, deaths,
+    peak_population) rows, start being the time since the instrumentation was created.
+    """
+
+    phase_dtype = [
+        ("step", np.int64),
+        ("owner", "U16"),
+        ("phase", "U24"),
+        ("calls", np.int64),
+        ("seconds", np.float64),
+    ]
+    step_dtype = [
+        ("step", np.int64),
+        ("start", np.float64),
+        ("seconds", np.float64),
+        ("population", np.int64),
+        ("births", np.int64),
+        ("deaths", np.int64),
+        ("peak_population", np.int64),
+    ]
+
+    def __init__(self, model):
+        self.model = model
+        self.origin = time.perf_counter()
+        self.phase_rows = []
+        self.step_rows = []
+        # (owner, phase) -> [calls, seconds] of the current step
+        self._phases = defaultdict(lambda: [0, 0.0])
+        self._step_start = None
+        self._first_id = 0
+        self._population = 0
+        self._peak = 0
+
+    def population(self):
+        return self.model.get_agent_count()
+
+    def begin_step(self):
+        self._phases.clear()
+        self._first_id = self.model.current_id
+        self._population = self._peak = self.population()
+        self._step_start = time.perf_counter()
+
+    def end_step(self):
+        elapsed = time.perf_counter() - self._step_start
+        step = self.model.schedule.steps
+        for (owner, phase), (calls, seconds) in self._phases.items():
+            self.phase_rows.append((step, owner, phase, calls, seconds))
+        population = self.population()
+        births = self.model.current_id - self._first_id
+        self.step_rows.append(
+            (
+                step,
+                self._step_start - self.origin,
+                elapsed,
+                population,
+                births,
+                self._population + births - population,
+                max(self._peak, population),
+            )
+        )
+
+    def call(self, owner, phase, function, *args):
+        """
+        Calls function(*args), recording its duration as a call of the phase of owner."""
+        start = time.perf_counter()
+        result = function(*args)
+        record = self._phases[owner, phase]
+        record[0] += 1
+        record[1] += time.perf_counter() - start
+        self._peak = max(self._peak, self.population())
+        return result
+
+    def step_agents(self, breed, agents):
+        """
+        Steps the given agents of a breed (called by the scheduler instead of their step method), running their
+        phases one by one to time them."""
+        clock = time.perf_counter
+        owner = breed.__name__
+        records = [self._phases[owner, phase] for phase in breed.phases]
+        peak = self._peak
+        get_agent_count = self.model.get_agent_count
+        for agent in agents:
+            for phase, record in zip(breed.phases, records):
+                start = clock()
+                getattr(agent, phase)()
+                record[1] += clock() - start
+                record[0] += 1
+            peak = max(peak, get_agent_count())
+        self._peak = peak
+
+    def phase_table(self):
+        """
+        Returns the per-step, per-phase timings as a NumPy structured array."""
+        return np.array(self.phase_rows, dtype=self.phase_dtype)
+
+    def step_table(self):
+        """
+        Returns the per-step summary (duration, population, births, deaths, peak) as a NumPy structured array."""
+        return np.array(self.step_rows, dtype=self.step_dtype)
+
+    def dump_chrome_trace(self, path):
+        """
+        Writes the timings as a Chrome trace (JSON, for chrome://tracing or Perfetto).
+        Each step is a span, and the phases of a step are drawn one after the other within it, one track per
+        owner, with their total duration over the step (the calls of the different phases are interleaved,
+        agent by agent). The population, births and deaths are drawn as counters."""
+        events = []
+        starts = {}
+        for step, start, seconds, population, births, deaths, peak in self.step_rows:
+            starts[step] = start
+            events.append(
+                {
+                    "name": "step {}".format(step),
+                    "ph": "X",
+                    "pid": 0,
+                    "tid": "step",
+                    "ts": start * 1e6,
+                    "dur": seconds * 1e6,
+                }
+            )
+            events.append(
+                {
+                    "name": "population",
+                    "ph": "C",
+                    "pid": 0,
+                    "ts": start * 1e6,
+                    "args": {
+                        "population": population,
+                        "births": births,
+                        "deaths": deaths,
+                        "peak": peak,
+                    },
+                }
+            )
+        offsets = defaultdict(float)
+        for step, owner, phase, calls, seconds in self.phase_rows:
+            ts = starts[step] + offsets[step, owner]
+            offsets[step, owner] += seconds
+            events.append(
+                {
+                    "name": phase,
+                    "ph": "X",
+                    "pid": 0,
+                    "tid": owner,
+                    "ts": ts * 1e6,
+                    "dur": seconds * 1e6,
+                    "args": {"calls": calls},
+                }
+            )
+        with open(path, "w") as file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
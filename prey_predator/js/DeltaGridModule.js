@@ -0,0 +1,90 @@
+/*
+ * Grid of the Wolf-Sheep model, drawn from the frames of DeltaCanvasGrid (see visualization.py).
+ * The state of every block of cells is kept here (grass, sheep, wolves), and each frame only redraws the
+ * blocks it changes. Blocks of one cell are drawn as the server's portrayal did (a grass square, a grey
+ * circle for the sheep and a black one for the wolves), larger blocks as a heatmap of their densities.
+ */
+var DeltaGridModule = function(canvas_width, canvas_height) {
+    var canvas = $("<canvas width='" + canvas_width + "' height='" + canvas_height + "' " +
+        "style='border:1px dotted'></canvas>")[0];
+    $("#elements").append(canvas);
+    var context = canvas.getContext("2d");
+
+    var state = null;
+    var lastId = null;
+    var block = 1;
+    var width = 0;
+    var height = 0;
+
+    var grassColors = ["#ffffff", "honeydew", "darkseagreen"];
+
+    var mix = function(color, target, weight) {
+        return color.map(function(value, i) {
+            return value + (target[i] - value) * weight;
+        });
+    };
+
+    // density of a count of animals in a block, on a log scale saturating at 4 animals per cell
+    var density = function(count) {
+        return Math.min(1, Math.log1p(count) / Math.log1p(4 * block * block));
+    };
+
+    var drawBlock = function(index) {
+        var x = Math.floor(index / height);
+        var y = index % height;
+        var w = canvas_width / width;
+        var h = canvas_height / height;
+        // y grows upwards, as in mesa's CanvasGrid
+        var left = x * w;
+        var top = canvas_height - (y + 1) * h;
+        var grass = state[3 * index];
+        var sheep = state[3 * index + 1];
+        var wolves = state[3 * index + 2];
+        if (block == 1) {
+            context.fillStyle = grassColors[grass];
+            context.fillRect(left, top, w, h);
+            var circle = function(radius, color) {
+                context.beginPath();
+                context.arc(left + w / 2, top + h / 2, radius * Math.min(w, h), 0, 2 * Math.PI);
+                context.fillStyle = color;
+                context.fill();
+            };
+            if (wolves > 0) circle(0.5, "black");
+            if (sheep > 0) circle(0.2, "grey");
+        } else {
+            var color = mix([255, 255, 255], [143, 188, 143], grass / (block * block));
+            color = mix(color, [128, 128, 128], 0.6 * density(sheep));
+            color = mix(color, [139, 0, 0], 0.8 * density(wolves));
+            context.fillStyle = "rgb(" + color.map(Math.round).join(",") + ")";
+            context.fillRect(left, top, w, h);
+        }
+    };
+
+    this.render = function(data) {
+        if (data.base === null) {
+            // whole frame
+            state = Uint16Array.from(data.values);
+            block = data.block;
+            width = data.width;
+            height = data.height;
+            context.clearRect(0, 0, canvas_width, canvas_height);
+            for (var i = 0; i < width * height; i++) drawBlock(i);
+        } else if (data.base === lastId) {
+            for (var j = 0; j < data.index.length; j++) {
+                var index = data.index[j];
+                state.set(data.values.slice(3 * j, 3 * j + 3), 3 * index);
+                drawBlock(index);
+            }
+        } else {
+            // a frame was missed : wait for the next whole frame
+            return;
+        }
+        lastId = data.id;
+    };
+
+    this.reset = function() {
+        state = null;
+        lastId = null;
+        context.clearRect(0, 0, canvas_width, canvas_height);
+    };
+};
@@ -0,0 +1,56 @@
+/*
+ * A line chart of the series of the model keeping at most max_points points per series (see
+ * DownsampledChartModule in visualization.py) : when the chart is full, every other point is dropped,
+ * and from then on only one new point out of stride is added.
+ */
+var DownsampledChartModule = function(series, canvas_width, canvas_height, max_points) {
+    var canvas = $("<canvas width='" + canvas_width + "' height='" + canvas_height + "' " +
+        "style='border:1px dotted'></canvas>")[0];
+    $("#elements").append(canvas);
+    var context = canvas.getContext("2d");
+
+    var datasets = series.map(function(s) {
+        return {label: s.Label, borderColor: s.Color, backgroundColor: s.Color, data: [], pointRadius: 0};
+    });
+    var chart = new Chart(context, {
+        type: "line",
+        data: {labels: [], datasets: datasets},
+        options: {
+            responsive: true,
+            animation: false,
+            scales: {x: {display: true, ticks: {maxTicksLimit: 11}}, y: {display: true}}
+        }
+    });
+
+    var stride = 1;
+    var received = 0;
+
+    var everyOther = function(values) {
+        return values.filter(function(value, i) { return i % 2 == 0; });
+    };
+
+    this.render = function(data) {
+        received += 1;
+        if ((received - 1) % stride != 0) return;
+        chart.data.labels.push(data.step);
+        for (var i = 0; i < data.values.length; i++) {
+            chart.data.datasets[i].data.push(data.values[i]);
+        }
+        if (chart.data.labels.length > max_points) {
+            chart.data.labels = everyOther(chart.data.labels);
+            chart.data.datasets.forEach(function(dataset) {
+                dataset.data = everyOther(dataset.data);
+            });
+            stride *= 2;
+        }
+        chart.update();
+    };
+
+    this.reset = function() {
+        stride = 1;
+        received = 0;
+        chart.data.labels = [];
+        chart.data.datasets.forEach(function(dataset) { dataset.data = []; });
+        chart.update();
+    };
+};
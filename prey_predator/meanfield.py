@@ -0,0 +1,640 @@
+"""
+A mean-field approximation of the Wolf-Sheep model, to screen parameter sets before simulating them.
+
+The model follows the expected numbers of animals instead of the animals themselves. For each breed, it keeps the
+number of animals of each energy and hunger (the number of steps since the last meal, capped at the digestion
+time), and the number of animals of each age. The age structure is assumed independent of the energy and hunger.
+A step applies the rules of the agents to these distributions, in the order of WolfSheep.step :
+
+- every animal loses its move energy,
+- the grid is well mixed : the animals of a breed are spread over the cells as a Poisson distribution. A grown
+  patch is eaten if at least one hungry sheep is in its cell, and a cell with k hungry wolves and j sheep loses
+  min(k, j) sheep,
+- the animals above their reproduction energy give birth with their reproduction probability,
+- the animals die of old age, or with a negative energy,
+- an eaten patch grows back after grass_regrowth_time steps, and only the cells with a patch (half of them, as
+  in WolfSheep) ever grow grass.
+
+Energies are counted in whole units (the energy parameters are rounded), up to max_energy. A breed falling below
+extinction_threshold animals is extinct. Some parameter sets let the population grow without bound (a lamb is
+born with more energy than its parent loses) : once there are more than max_density animals per cell, a run
+stops, as with a stopping.PopulationCap, and its outcome is an explosion.
+
+A batch of parameter sets (and replicates) is integrated at once, one row of NumPy arrays per run. The model is
+deterministic, or stochastic with stochastic=True : the numbers of survivors, births and preys of each step are
+then drawn (binomial and Poisson draws around their expected values), so that replicates of a parameter set
+estimate the probability of each outcome.
+
+predict integrates a batch of parameter sets, and reports the outcome of each one, the probability of coexistence
+and the period of the cycles. validate compares these predictions with agent-based runs, and run_screened_sweep
+only simulates the parameter sets whose outcome is uncertain.
+
+    >>> result = predict({"sheep_reproduce": [0.05, 0.1, 0.2], "wolf_gain_from_food": [10, 20, 40]}, steps=300)
+    >>> result.outcome, result.coexistence, result.period
+"""
+
+import json
+import os
+import warnings
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from prey_predator.agents import Sheep, Wolf
+from prey_predator.batch import parameter_grid, run_sweep
+from prey_predator.model import WolfSheep
+from prey_predator.params import PARAMETER_NAMES, default_parameters
+from prey_predator.stopping import Extinction, PopulationCap
+
+# outcomes of a run, by code : 1 if the wolves are extinct, + 2 if the sheep are extinct, or 4 if the
+# population went above its cap
+OUTCOMES = ("coexistence", "wolves extinct", "sheep extinct", "extinction", "explosion")
+
+MeanFieldResult = namedtuple(
+    "MeanFieldResult",
+    ["parameter_sets", "series", "outcome", "outcome_probability", "coexistence", "period", "uncertain"],
+)
+MeanFieldResult.__doc__ = """
+Predictions of the mean-field model for a batch of parameter sets.
+
+parameter_sets: the full parameter sets, in the order of the other fields.
+series: {name: array of shape (steps, parameter sets)} for the "Sheep", "Wolves" and "Grown grass" series
+(mean of the replicates, the exploded ones being left out).
+outcome: the most frequent outcome of each parameter set (see OUTCOMES).
+outcome_probability: array of shape (parameter sets, len(OUTCOMES)), the fraction of the replicates ending with
+each outcome.
+coexistence: the fraction of the replicates of each parameter set where wolves and sheep coexist.
+period: the median period of the cycles of the sheep over the second half of the runs (NaN without cycles).
+uncertain: the mask of the parameter sets whose most frequent outcome is below the required certainty."""
+
+ValidationResult = namedtuple(
+    "ValidationResult",
+    ["prediction", "outcome", "outcome_probability", "coexistence", "period", "agreement", "brier_score"],
+)
+ValidationResult.__doc__ = """
+Comparison of the mean-field predictions with agent-based runs.
+
+prediction: the MeanFieldResult of the parameter sets.
+outcome, outcome_probability, coexistence, period: the same fields as in the prediction, observed in the
+agent-based runs.
+agreement: the fraction of the parameter sets whose predicted and observed outcomes are the same.
+brier_score: the mean squared difference between the predicted and observed probabilities of coexistence."""
+
+
+def full_parameter_sets(parameter_sets):
+    """
+    Returns the full parameter sets of a list of parameter sets, or of a grid {name: list of values}
+    (missing parameters take their default value)."""
+    if isinstance(parameter_sets, dict):
+        parameter_sets = parameter_grid(parameter_sets)
+    full_sets = []
+    for parameters in parameter_sets:
+        unknown = set(parameters) - set(PARAMETER_NAMES)
+        if unknown:
+            raise ValueError("Unknown parameters: {}".format(sorted(unknown)))
+        full_sets.append({**default_parameters(), **parameters})
+    return full_sets
+
+
+def outcome_codes(sheep, wolves, exploded=False):
+    """
+    Returns the code of the outcome (index in OUTCOMES) of runs ending with these numbers of sheep and wolves,
+    or which exploded."""
+    codes = (np.asarray(wolves) <= 0) * 1 + (np.asarray(sheep) <= 0) * 2
+    return np.where(exploded, 4, codes)
+
+
+def outcome_summary(codes):
+    """
+    From the outcome codes of shape (parameter sets, replicates), returns the fraction of the replicates ending
+    with each outcome, and the most frequent outcome of each parameter set."""
+    probability = np.stack([(codes == code).mean(axis=1) for code in range(len(OUTCOMES))], axis=1)
+    outcome = [OUTCOMES[code] for code in probability.argmax(axis=1)]
+    return probability, outcome
+
+
+def cycle_period(series, min_correlation=0.5, min_period=4):
+    """
+    Returns the period of the cycles of each column of series (an array of shape (steps, runs)), or NaN for
+    the columns which do not cycle. As for stopping.PeriodicState, the period is the lag of the highest
+    autocorrelation past the first lag at which the autocorrelation is negative (and past min_period), if this
+    autocorrelation is at least min_correlation."""
+    series = np.asarray(series, dtype=np.float64)
+    steps = len(series)
+    lags = np.arange(1, steps // 2 + 1)
+    period = np.full(series.shape[1], np.nan)
+    if len(lags) == 0:
+        return period
+    centered = series - series.mean(axis=0)
+    variance = (centered * centered).sum(axis=0)
+    spectrum = np.fft.rfft(centered, 2 * steps, axis=0)
+    autocovariance = np.fft.irfft(spectrum * spectrum.conj(), 2 * steps, axis=0)[lags]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        correlation = autocovariance / variance * (steps / (steps - lags))[:, None]
+    negative = correlation < 0
+    # the first negative lag of each column
+    first_negative = lags[negative.argmax(axis=0)]
+    candidates = lags[:, None] >= np.maximum(first_negative, min_period)
+    correlation = np.where(candidates, correlation, -np.inf)
+    best = correlation.argmax(axis=0)
+    columns = np.arange(series.shape[1])
+    cycles = (
+        (variance > 0)
+        & negative.any(axis=0)
+        & (correlation[best, columns] >= min_correlation)
+    )
+    period[cycles] = lags[best[cycles]]
+    return period
+
+
+def expected_minimum(mean_a, mean_b):
+    """
+    Returns E[min(A, B)] for independent Poisson variables A and B of the given means (arrays) :
+    the sum over n >= 1 of P(A >= n) P(B >= n)."""
+    mean_a = np.asarray(mean_a, dtype=np.float64)
+    mean_b = np.asarray(mean_b, dtype=np.float64)
+    largest = float(max(np.max(mean_a, initial=0), np.max(mean_b, initial=0)))
+    terms = int(largest + 8 * np.sqrt(largest) + 10)
+    # P(X = n) and P(X <= n), from n = 0
+    pmf_a, pmf_b = np.exp(-mean_a), np.exp(-mean_b)
+    cdf_a, cdf_b = pmf_a.copy(), pmf_b.copy()
+    total = np.zeros(np.broadcast(mean_a, mean_b).shape)
+    for n in range(1, terms + 1):
+        total += np.clip(1 - cdf_a, 0, 1) * np.clip(1 - cdf_b, 0, 1)
+        pmf_a = pmf_a * mean_a / n
+        pmf_b = pmf_b * mean_b / n
+        cdf_a += pmf_a
+        cdf_b += pmf_b
+    return total
+
+
+def shift_energy(states, shift):
+    """
+    Returns the distribution states[row, ..., energy] with the energies of each row moved by shift[row] (an
+    integer array) : energies above the last bin are counted in the last bin, and energies below the first one
+    are lost. The rows are shifted by slices, one group of rows per value of shift."""
+    shifted = np.zeros_like(states)
+    bins = states.shape[-1]
+    values = np.unique(shift)
+    for value in values.tolist():
+        if len(values) == 1:
+            source, target = states, shifted
+        else:
+            rows = shift == value
+            source, target = states[rows], np.zeros_like(states[rows])
+        if value >= bins:
+            target[..., -1] = source.sum(axis=-1)
+        elif value >= 0:
+            target[..., value:] = source[..., : bins - value]
+            # the last bin gathers every energy above it
+            target[..., -1] += source[..., bins - value :].sum(axis=-1)
+        elif -value < bins:
+            target[..., : bins + value] = source[..., -value:]
+        if len(values) > 1:
+            shifted[rows] = target
+    return shifted
+
+
+class BreedDistribution:
+    """
+    The animals of a breed in each row of a batch : states[row, wait, energy + offset] is the number of animals
+    of each energy which can eat again in wait steps (0 for the hungry ones, digestion after a meal), and
+    ages[row, age] the number of animals of each age.
+    The parameters of the breed are arrays with one value per row.
+    """
+
+    def __init__(
+        self,
+        count,
+        energy,
+        gain,
+        move,
+        reproduction_energy,
+        reproduce,
+        life_expectancy,
+        digestion,
+        max_energy,
+        extinction_threshold,
+    ):
+        def whole(values):
+            return np.rint(values).astype(np.int64)
+
+        self.energy = whole(energy)
+        self.gain = whole(gain)
+        self.move = whole(move)
+        self.reproduction_energy = whole(reproduction_energy)
+        self.reproduce_probability = np.asarray(reproduce, dtype=np.float64)
+        self.life_expectancy = np.maximum(whole(life_expectancy), 1)
+        self.digestion = np.maximum(whole(digestion), 0)
+        self.extinction_threshold = extinction_threshold
+
+        rows = len(self.energy)
+        self.rows = np.arange(rows)
+        # energies go down to -move after a move, and are above 0 at the end of a step
+        self.offset = int(max(self.move.max(initial=0), self.reproduction_energy.max(initial=0), 0))
+        meals = np.ceil(self.life_expectancy / (self.digestion + 1))
+        top = np.maximum(
+            self.energy + self.gain * meals, self.reproduction_energy + self.gain + 1
+        )
+        top = int(min(top.max(initial=1), max_energy))
+        self.energy_values = np.arange(-self.offset, top + 1)
+        self.birth_bin = np.clip(self.energy + self.offset, 0, len(self.energy_values) - 1)
+
+        waits = int(self.digestion.max(initial=0)) + 1
+        self.states = np.zeros((rows, waits, len(self.energy_values)))
+        self.ages = np.zeros((rows, int(self.life_expectancy.max(initial=1))))
+        self.add(np.asarray(count, dtype=np.float64))
+
+    def count(self):
+        return self.states.sum(axis=(1, 2))
+
+    def add(self, births):
+        """
+        Adds new animals (of age 0 and with their initial energy, which have just eaten)."""
+        self.states[self.rows, self.digestion, self.birth_bin] += births
+        self.ages[:, 0] += births
+
+    def scale(self, factor):
+        """
+        Multiplies the number of animals of each row by factor (the animals removed are taken at random)."""
+        factor = np.maximum(factor, 0)
+        self.states *= factor[:, None, None]
+        self.ages *= factor[:, None]
+
+    def hungry_count(self):
+        return self.states[:, 0].sum(axis=1)
+
+    def random_move(self):
+        if (self.move == self.move[0]).all() and self.move[0] >= 0:
+            # the same move energy in every row : shifted in place
+            move = self.move[0]
+            self.states[..., : self.states.shape[-1] - move] = self.states[..., move:]
+            self.states[..., self.states.shape[-1] - move :] = 0
+        else:
+            self.states = shift_energy(self.states, -self.move)
+
+    def eat(self, probability):
+        """
+        Each hungry animal eats with the probability of its row. The others get one step closer to being
+        hungry."""
+        hungry = self.states[:, 0]
+        fed = hungry * probability[:, None]
+        still_hungry = np.maximum(hungry - fed, 0)
+        self.states[:, :-1] = self.states[:, 1:]
+        self.states[:, -1] = 0
+        self.states[:, 0] += still_hungry
+        self.states[self.rows, self.digestion] += shift_energy(fed, self.gain)
+
+    def reproduction(self):
+        """
+        The animals above their reproduction energy give birth with their reproduction probability, and lose the
+        reproduction energy. Returns the expected number of births of each row."""
+        can = self.energy_values[None, :] > self.reproduction_energy[:, None]
+        reproducing = (can * self.reproduce_probability[:, None])[:, None, :]
+        parents = self.states * reproducing
+        self.states *= 1 - reproducing
+        self.states += shift_energy(parents, -self.reproduction_energy)
+        return parents.sum(axis=(1, 2))
+
+    def aging_and_deaths(self, births, rng=None):
+        """
+        Ages the animals, removes the ones dying of old age or with a negative energy, then adds the births.
+        With a generator, the numbers of survivors and of births are drawn around their expected values."""
+        count = self.count()
+        old = self.ages[self.rows, self.life_expectancy - 1]
+        self.ages[:, 1:] = self.ages[:, :-1]
+        self.ages[:, 0] = 0
+        self.ages[np.arange(self.ages.shape[1])[None, :] >= self.life_expectancy[:, None]] = 0
+        starving = self.states[:, :, : self.offset].sum(axis=(1, 2))
+        self.states[:, :, : self.offset] = 0
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            survive_age = np.where(count > 0, 1 - old / count, 1)
+            survive_energy = np.where(count > 0, 1 - starving / count, 1)
+            sampling = 1
+            if rng is not None:
+                expected = count * survive_age * survive_energy
+                survivors = rng.binomial(
+                    np.rint(count).astype(np.int64), np.clip(survive_age * survive_energy, 0, 1)
+                )
+                sampling = np.where(expected > 0, survivors / expected, 0)
+                births = rng.poisson(np.maximum(births, 0))
+        # the animals dying of old age are taken at random among the energies, and the starving ones among the ages
+        self.states *= np.maximum(survive_age * sampling, 0)[:, None, None]
+        self.ages *= np.maximum(survive_energy * sampling, 0)[:, None]
+        self.add(births)
+
+        extinct = self.count() < self.extinction_threshold
+        self.states[extinct] = 0
+        self.ages[extinct] = 0
+
+
+class MeanFieldWolfSheep:
+    """
+    The mean-field model of a batch of parameter sets, each one integrated replicates times (one row per
+    replicate, replicates being consecutive).
+
+    Args:
+        parameter_sets: a list of parameter sets, or a grid {name: list of values}. Parameters missing from
+            a set take their default value.
+        replicates: the number of replicates of each parameter set.
+        stochastic: if True, the numbers of survivors, births and preys of each step are drawn around their
+            expected values.
+        seed: the seed of the draws.
+        max_energy: the highest energy followed, higher energies counting as max_energy.
+        extinction_threshold: the number of animals under which a breed is extinct.
+        max_density: the number of animals per cell above which a run explodes (and stops).
+    """
+
+    def __init__(
+        self,
+        parameter_sets,
+        replicates=1,
+        stochastic=False,
+        seed=None,
+        max_energy=100,
+        extinction_threshold=1.0,
+        max_density=50,
+    ):
+        self.parameter_sets = full_parameter_sets(parameter_sets)
+        self.replicates = replicates
+        self.rng = np.random.default_rng(seed) if stochastic else None
+        self.steps = 0
+
+        def column(name):
+            return np.repeat([parameters[name] for parameters in self.parameter_sets], replicates)
+
+        self.cells = column("width") * column("height")
+        self.cap = max_density * self.cells
+        self.explosion_step = np.full(len(self.cells), -1)
+        self.grass = column("grass").astype(bool)
+        self.grass_regrowth_time = np.maximum(np.rint(column("grass_regrowth_time")), 1).astype(np.int64)
+
+        breeds = {}
+        for breed, prefix in (("sheep", "sheep"), ("wolves", "wolf")):
+            breeds[breed] = BreedDistribution(
+                column("initial_" + breed),
+                column(prefix + "_energy"),
+                column(prefix + "_gain_from_food"),
+                column(prefix + "_move_energy"),
+                column(prefix + "_reproduction_energy"),
+                column(prefix + "_reproduce"),
+                column(prefix + "_life_expectancy"),
+                column(prefix + "_min_digestion"),
+                max_energy,
+                extinction_threshold,
+            )
+        self.sheep = breeds["sheep"]
+        self.wolves = breeds["wolves"]
+
+        # half of the cells have a grass patch, grown at first
+        rows = len(self.cells)
+        if self.rng is None:
+            patches = self.cells / 2
+        else:
+            patches = self.rng.binomial(self.cells, 0.5).astype(np.float64)
+        self.grown = np.where(self.grass, patches, 0.0)
+        # regrowing[row, k] : the patches of a row growing back in k + 1 steps
+        self.regrowing = np.zeros((rows, int(self.grass_regrowth_time.max(initial=1))))
+
+    def grown_grass(self):
+        return self.grown.copy()
+
+    def step(self):
+        rows = np.arange(len(self.cells))
+
+        # sheep
+        self.sheep.random_move()
+        hungry = self.sheep.hungry_count()
+        eaten = np.where(self.grass, self.grown * -np.expm1(-hungry / self.cells), 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.sheep.eat(np.where(hungry > 0, eaten / hungry, 0))
+        self.grown -= eaten
+        self.regrowing[rows, self.grass_regrowth_time - 1] += eaten
+        self.sheep.aging_and_deaths(self.sheep.reproduction(), self.rng)
+
+        # wolves
+        self.wolves.random_move()
+        hungry = self.wolves.hungry_count()
+        sheep = self.sheep.count()
+        preys = np.minimum(
+            self.cells * expected_minimum(hungry / self.cells, sheep / self.cells), sheep
+        )
+        if self.rng is not None:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                preys = self.rng.binomial(
+                    np.rint(sheep).astype(np.int64), np.where(sheep > 0, np.clip(preys / sheep, 0, 1), 0)
+                ).astype(np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.sheep.scale(np.where(sheep > 0, 1 - preys / sheep, 0))
+            self.wolves.eat(np.where(hungry > 0, np.clip(preys / hungry, 0, 1), 0))
+        self.wolves.aging_and_deaths(self.wolves.reproduction(), self.rng)
+
+        # grass
+        self.grown += self.regrowing[:, 0]
+        self.regrowing[:, :-1] = self.regrowing[:, 1:]
+        self.regrowing[:, -1] = 0
+        self.steps += 1
+
+        # the exploded runs stop : they do not cost any more terms in expected_minimum
+        exploded = (self.explosion_step < 0) & (self.sheep.count() + self.wolves.count() > self.cap)
+        if exploded.any():
+            self.explosion_step[exploded] = self.steps
+            self.sheep.scale(np.where(exploded, 0.0, 1.0))
+            self.wolves.scale(np.where(exploded, 0.0, 1.0))
+
+    def exploded(self):
+        """
+        Returns the mask of the runs which exploded."""
+        return self.explosion_step >= 0
+
+    def run(self, steps, certainty=0.9, min_correlation=0.5):
+        """
+        Runs the batch for a number of steps, and returns its MeanFieldResult. A parameter set is uncertain if
+        less than a certainty fraction of its replicates end with its most frequent outcome."""
+        sets = len(self.parameter_sets)
+        series = {
+            "Sheep": np.zeros((steps, sets * self.replicates)),
+            "Wolves": np.zeros((steps, sets * self.replicates)),
+            "Grown grass": np.zeros((steps, sets * self.replicates)),
+        }
+        for i in range(steps):
+            self.step()
+            exploded = self.exploded()
+            series["Sheep"][i] = np.where(exploded, np.nan, self.sheep.count())
+            series["Wolves"][i] = np.where(exploded, np.nan, self.wolves.count())
+            series["Grown grass"][i] = np.where(exploded, np.nan, self.grown_grass())
+        codes = outcome_codes(
+            series["Sheep"][-1], series["Wolves"][-1], self.exploded()
+        ).reshape(sets, self.replicates)
+        probability, outcome = outcome_summary(codes)
+        period = median_period(series["Sheep"], codes, min_correlation)
+        with warnings.catch_warnings():
+            # steps at which every replicate of a parameter set exploded
+            warnings.simplefilter("ignore", RuntimeWarning)
+            mean = {
+                name: np.nanmean(values.reshape(steps, sets, self.replicates), axis=2)
+                for name, values in series.items()
+            }
+        return MeanFieldResult(
+            self.parameter_sets,
+            mean,
+            outcome,
+            probability,
+            probability[:, 0],
+            period,
+            probability.max(axis=1) < certainty,
+        )
+
+
+def median_period(sheep, codes, min_correlation=0.5):
+    """
+    Returns the median period of the cycles of the sheep of the coexisting replicates of each parameter set, over
+    the second half of the runs (sheep is an array of shape (steps, parameter sets * replicates), and codes the
+    outcome codes of shape (parameter sets, replicates))."""
+    sets, replicates = codes.shape
+    periods = cycle_period(sheep[len(sheep) // 2 :], min_correlation).reshape(sets, replicates)
+    periods[codes != 0] = np.nan
+    period = np.full(sets, np.nan)
+    cycling = ~np.isnan(periods).all(axis=1)
+    period[cycling] = np.nanmedian(periods[cycling], axis=1)
+    return period
+
+
+def predict(
+    parameter_sets,
+    steps=300,
+    replicates=16,
+    stochastic=True,
+    seed=None,
+    certainty=0.9,
+    **options
+):
+    """
+    Integrates the mean-field model of a batch of parameter sets (a list, or a grid {name: list of values}),
+    replicates times each, for steps steps, and returns its MeanFieldResult. The options are the ones of
+    MeanFieldWolfSheep (max_energy, extinction_threshold, max_density)."""
+    if not stochastic:
+        replicates = 1
+    model = MeanFieldWolfSheep(
+        parameter_sets, replicates=replicates, stochastic=stochastic, seed=seed, **options
+    )
+    return model.run(steps, certainty)
+
+
+def agent_based_outcome(parameters, seed, steps, max_density, engine):
+    """
+    Worker task of validate : runs the agent-based model for steps steps, stopping at the extinction of both
+    breeds or above max_density animals per cell, and returns the code of its outcome and its series of sheep
+    (zeros after an extinction, NaN after an explosion)."""
+    model = WolfSheep(seed=seed, engine=engine, **parameters)
+    cap = max_density * parameters["width"] * parameters["height"]
+    model.run_until(Extinction(), PopulationCap(cap), max_steps=steps)
+    # one row per step run (the initial state is not collected)
+    counts = model.datacollector.get_series()["Sheep"]
+    exploded = model.stop_reason is not None and model.stop_reason.startswith("population")
+    sheep = np.empty(steps)
+    sheep[: len(counts)] = counts
+    # the steps not run, after an extinction or an explosion
+    sheep[len(counts) :] = np.nan if exploded else 0.0
+    return (
+        outcome_codes(model.get_breed_count(Sheep), model.get_breed_count(Wolf), exploded),
+        sheep,
+    )
+
+
+def validate(
+    parameter_sets,
+    steps=300,
+    replicates=8,
+    seed=None,
+    certainty=0.9,
+    max_density=50,
+    engine="arrays",
+    processes=None,
+    **options
+):
+    """
+    Compares the predictions of the mean-field model with replicates agent-based runs of each parameter set
+    (simulated over a process pool of processes workers, with the given WolfSheep engine), and returns their
+    ValidationResult. The options are the ones of predict (replicates of the prediction excepted)."""
+    prediction = predict(
+        parameter_sets, steps, seed=seed, certainty=certainty, max_density=max_density, **options
+    )
+    sets = len(prediction.parameter_sets)
+    seeds = np.random.SeedSequence(seed).generate_state(sets * replicates, dtype=np.uint64) >> np.uint64(1)
+    codes = np.zeros((sets, replicates), dtype=np.int64)
+    sheep = np.zeros((steps, sets * replicates))
+    with ProcessPoolExecutor(processes) as pool:
+        futures = [
+            pool.submit(
+                agent_based_outcome, parameters, int(seeds[run]), steps, max_density, engine
+            )
+            for run, parameters in enumerate(
+                parameters for parameters in prediction.parameter_sets for _ in range(replicates)
+            )
+        ]
+        for run, future in enumerate(futures):
+            codes.flat[run], sheep[:, run] = future.result()
+    probability, outcome = outcome_summary(codes)
+    agreement = np.mean([a == b for a, b in zip(prediction.outcome, outcome)])
+    brier_score = np.mean((prediction.coexistence - probability[:, 0]) ** 2)
+    return ValidationResult(
+        prediction,
+        outcome,
+        probability,
+        probability[:, 0],
+        median_period(sheep, codes),
+        float(agreement),
+        float(brier_score),
+    )
+
+
+def run_screened_sweep(
+    parameter_sets,
+    replicates,
+    output,
+    steps=100,
+    certainty=0.9,
+    prediction_replicates=16,
+    seed=None,
+    **sweep_options
+):
+    """
+    Predicts the outcome of every parameter set with the mean-field model, and only runs the agent-based sweep
+    (see batch.run_sweep, which takes the sweep_options) of the parameter sets whose outcome is uncertain.
+    The predictions are written in the output directory, in _screening.json (ignored by read_sweep) : for each
+    parameter set, its predicted outcome, probability of coexistence and period, and whether it was simulated.
+    Returns the MeanFieldResult and the paths of the runs written by run_sweep."""
+    prediction = predict(
+        parameter_sets, steps, replicates=prediction_replicates, seed=seed, certainty=certainty
+    )
+    uncertain = [
+        parameters
+        for parameters, flag in zip(prediction.parameter_sets, prediction.uncertain)
+        if flag
+    ]
+    written = []
+    if uncertain:
+        written = run_sweep(uncertain, replicates, output, steps=steps, **sweep_options)
+    os.makedirs(output, exist_ok=True)
+    screening = [
+        {
+            "parameters": parameters,
+            "outcome": outcome,
+            "coexistence": float(coexistence),
+            "period": None if np.isnan(period) else float(period),
+            "simulated": bool(flag),
+        }
+        for parameters, outcome, coexistence, period, flag in zip(
+            prediction.parameter_sets,
+            prediction.outcome,
+            prediction.coexistence,
+            prediction.period,
+            prediction.uncertain,
+        )
+    ]
+    with open(os.path.join(output, "_screening.json"), "w") as file:
+        json.dump(screening, file, indent=1)
+    return prediction, written
@@ -9,12 +9,28 @@ Replication of the model found in NetLogo:
     Northwestern University, Evanston, IL.
 """
 
+import hashlib
+import itertools
+import random
+from collections import defaultdict
+
+import numpy as np
 from mesa import Model
-from mesa.space import MultiGrid
-from mesa.datacollection import DataCollector
 
-from prey_predator.agents import Sheep, Wolf, GrassPatch
-from prey_predator.schedule import RandomActivationByBreed
+from prey_predator.agents import Sheep, Wolf
+from prey_predator.array_engine import ArrayEngine, BreedArrays
+from prey_predator.cache import ResultCache, cache_key
+from prey_predator.checkpoint import load_checkpoint, save_checkpoint
+from prey_predator.datacollection import ColumnarDataCollector
+from prey_predator.grass import GrassField
+from prey_predator.instrumentation import Instrumentation
+from prey_predator.params import PARAMETER_NAMES
+from prey_predator.population import PopulationStatistics
+from prey_predator.recording import Recorder
+from prey_predator.rng import GRASS, MOVE, PLACE, REPRODUCE, CounterRNG
+from prey_predator.schedule import ArrayActivationByBreed, RandomActivationByBreed
+from prey_predator.space import BreedMultiGrid
+from prey_predator.stopping import Snapshot
 
 
 class WolfSheep(Model):
@@ -76,12 +92,79 @@ class WolfSheep(Model):
         grass,
         grass_regrowth_time,
         sheep_life_expectancy,
-        wolf_life_expectancy
+        wolf_life_expectancy,
+        seed=None,
+        engine="agents",
+        datacollector=None,
+        scheduler="dict",
+        instrument=False,
+        record=None,
+        rng="sequential",
+        cache=None,
+        bulk_init=False,
+        sheep_density=None,
+        wolf_density=None,
+        grass_density=None,
     ):
         """
         Create a new Wolf-Sheep model with the given self-explanatory parameters.
+
+        seed: seed of the model's random generators.
+        engine: "agents" to simulate every sheep and wolf as a Mesa agent, or "arrays" to use the
+        struct-of-arrays ArrayEngine, which follows the same rules with batched array operations.
+        datacollector: the ColumnarDataCollector of the model, to collect with another cadence or size
+        (default: collect every step).
+        scheduler: "dict" for the RandomActivationByBreed scheduler, or "array" for ArrayActivationByBreed,
+        which keeps the agents of each breed in a dense list and scales better to large populations.
+        instrument: if True, record the time spent in each phase of each step (see Instrumentation),
+        in self.instrumentation.
+        record: the path of a file to record the run to (see prey_predator.recording), or a Recorder.
+        rng: "sequential" to draw every random number from the model's generators in turn, or "counter" to
+        derive each draw from (seed, tick, agent id, purpose) with a counter-based generator (see
+        prey_predator.rng) : the trajectory does not depend on the order the agents are stepped in anymore.
+        cache: a ResultCache, or the directory of one, consulted by run_model and run_until (see
+        prey_predator.cache) : runs already cached are loaded instead of simulated.
+        bulk_init: if True, the initial agents and grass are drawn with one vectorized call each, and the agents
+        are registered in the grid and the scheduler in batch (see populate). The initial state then differs
+        from the one of the default, one by one, initialisation with the same seed (except in the counter
+        random mode, where both are the same).
+        sheep_density, wolf_density: optional maps of shape (grid.width, grid.height), indexed [x, y] : the
+        initial agents are put in each cell with a probability proportional to its density, instead of uniformly.
+        grass_density: optional map of shape (grid.width, grid.height) of the probability of a grass patch in
+        each cell, instead of 0.5. Giving a density map implies bulk_init.
         """
         super().__init__()
+        if engine not in ("agents", "arrays"):
+            raise ValueError("Unknown engine: {}".format(engine))
+        if scheduler not in ("dict", "array"):
+            raise ValueError("Unknown scheduler: {}".format(scheduler))
+        if rng not in ("sequential", "counter"):
+            raise ValueError("Unknown random mode: {}".format(rng))
+        # mesa stores the random generator on the class : each model gets its own
+        self.random = random.Random(seed)
+        self.np_random = np.random.default_rng(seed)
+        # dead agents of each breed, reused for the births (see RandomWalker.spawn)
+        self.agent_pool = defaultdict(list)
+        # uniform draws consumed by RandomWalker.random_move, refilled by the scheduler for each breed
+        self.move_draws = iter(())
+        self.counter_rng = CounterRNG(seed) if rng == "counter" else None
+        # the reproduction draws of the agents of the breed being stepped, in the counter random mode
+        self.reproduce_draws = {}
+        self.instrumentation = Instrumentation(self) if instrument else None
+        if isinstance(record, Recorder) or record is None:
+            self.recorder = record
+        else:
+            self.recorder = Recorder(record)
+        if isinstance(cache, ResultCache) or cache is None:
+            self.cache = cache
+        else:
+            self.cache = ResultCache(cache)
+        self.seed = seed
+        self.engine = engine
+        self.scheduler = scheduler
+        self.rng = rng
+        # why run_until stopped the model, if it did
+        self.stop_reason = None
         # Set parameters
         self.height = height
         self.width = width
@@ -113,21 +196,56 @@ class WolfSheep(Model):
         self.sheep_life_expectancy = sheep_life_expectancy
         self.wolf_life_expectancy = wolf_life_expectancy
 
-        self.schedule = RandomActivationByBreed(self)
-        self.grid = MultiGrid(self.height, self.width, torus=True)
-        self.datacollector = DataCollector(
-            {
-                "Wolves": lambda m: m.schedule.get_breed_count(Wolf),
-                "Sheep": lambda m: m.schedule.get_breed_count(Sheep),
-            }
+        if scheduler == "array":
+            self.schedule = ArrayActivationByBreed(self)
+        else:
+            self.schedule = RandomActivationByBreed(self)
+        self.grid = BreedMultiGrid(self.height, self.width, torus=True)
+        self.grass_field = GrassField(
+            self, self.grid.width, self.grid.height, self.grass_regrowth_time
         )
+        if datacollector is None:
+            datacollector = ColumnarDataCollector()
+        self.datacollector = datacollector
+        # running statistics of the sheep and the wolves, updated by the events of the agents
+        self.statistics = PopulationStatistics(self)
+
+        densities = (sheep_density, wolf_density, grass_density)
+        self.bulk_init = bulk_init or any(density is not None for density in densities)
+        self.densities = densities if self.bulk_init else (None, None, None)
+
+        self.array_engine = None
+        if engine == "arrays":
+            self.array_engine = ArrayEngine(self)
+        if self.bulk_init:
+            self.populate(*densities)
+            # the agents and the grass are created
+            initial_sheep = initial_wolves = 0
+        elif engine == "arrays":
+            # initial agents are put in random cells, as below
+            cells_count = self.grid.width * self.grid.height
+            for breed, count, energy in (
+                (Sheep, initial_sheep, self.sheep_energy),
+                (Wolf, initial_wolves, self.wolf_energy),
+            ):
+                if self.counter_rng is not None:
+                    cells = self.initial_cells(count)
+                else:
+                    cells = self.np_random.integers(0, cells_count, count)
+                self.array_engine.add_agents(breed, cells, energy)
+            # no agent is created in the grid nor in the scheduler
+            initial_sheep = initial_wolves = 0
 
         # Create sheep :
         # We choose to put initial sheep in random positions within the grid.
         # They are initialized with sheep_energy energy.
+        cells = self.initial_cells(initial_sheep)
         for i in range(initial_sheep):
-            x = self.random.randrange(self.grid.width)
-            y = self.random.randrange(self.grid.height)
+            if cells is None:
+                x = self.random.randrange(self.grid.width)
+                y = self.random.randrange(self.grid.height)
+            else:
+                x, y = divmod(cells[i], self.grid.height)
             sheep = Sheep(
                 self.next_id(),
                 pos=(x, y),
@@ -141,9 +259,13 @@ class WolfSheep(Model):
         # Create wolves :
         # We choose to put initial wolves in random positions within the grid.
         # They are initialized with wolf_energy energy.
+        cells = self.initial_cells(initial_wolves)
         for i in range(initial_wolves):
-            x = self.random.randrange(self.grid.width)
-            y = self.random.randrange(self.grid.height)
+            if cells is None:
+                x = self.random.randrange(self.grid.width)
+                y = self.random.randrange(self.grid.height)
+            else:
+                x, y = divmod(cells[i], self.grid.height)
             wolf = Wolf(
                 self.next_id(),
                 pos=(x, y),
@@ -157,25 +279,306 @@ class WolfSheep(Model):
         # Create grass patches :
         # Grass patches are created with a probability of 0.5 in each grid cell.
         # They all are created with the same grass_regrowth_time.
-        if self.grass:
-            for i in range(self.width):
-                for j in range(self.height):
-                    if self.random.random() < 0.5:
-                        grass = GrassPatch(
-                            self.next_id(),
-                            pos=(i, j),
-                            model=self,
+        # The patches are cells of the grass field arrays, not agents.
+        if self.grass and not self.bulk_init:
+            if self.counter_rng is not None:
+                grass_draws = self.counter_rng.random(
+                    0, np.arange(self.grid.width * self.grid.height), GRASS
+                ).tolist()
+            for i in range(self.grid.width):
+                for j in range(self.grid.height):
+                    if self.counter_rng is None:
+                        draw = self.random.random()
+                    else:
+                        draw = grass_draws[i * self.grid.height + j]
+                    if draw < 0.5:
+                        self.grass_field.add_patch(
+                            (i, j),
                             fully_grown=True,
                             countdown=self.grass_regrowth_time,
                         )
-                        self.schedule.add(grass)
-                        self.grid.place_agent(grass, (i, j))
+
+        # the initial agents are counted once, then the events keep the statistics up to date
+        self.statistics.rebuild()
+        if self.recorder is not None:
+            self.recorder.record(self)
 
     def step(self):
+        instrumentation = self.instrumentation
+        if instrumentation is not None:
+            instrumentation.begin_step()
+        self.statistics.begin_step()
+        if self.array_engine is not None:
+            self.array_engine.step()
+        # with the array engine, the scheduler has no agent and only counts the steps
         self.schedule.step()
+        # the grass grows after the animals moved, as the former GrassPatch breed did
+        if self.grass:
+            self.timed("GrassField", "step", self.grass_field.step)
         # Collect data
-        self.datacollector.collect(self)
+        self.timed("DataCollector", "collect", self.datacollector.collect, self)
+        if self.recorder is not None:
+            self.timed("Recorder", "record", self.recorder.record, self)
+        if instrumentation is not None:
+            instrumentation.end_step()
+
+    def timed(self, owner, phase, function, *args):
+        """
+        Calls function(*args). If the model is instrumented, the call is timed as a phase of owner."""
+        if self.instrumentation is None:
+            return function(*args)
+        return self.instrumentation.call(owner, phase, function, *args)
+
+    def draw_moves(self, n):
+        """
+        Draws at once the moves of n agents, as uniform numbers in [0, 1) consumed one by one
+        by RandomWalker.random_move."""
+        self.move_draws = iter(self.np_random.random(n).tolist())
+
+    def initial_cells(self, n):
+        """
+        In the counter random mode, returns the cells (flat indices) of the next n agents to be created, drawn
+        from their ids. Returns None in the sequential mode."""
+        if self.counter_rng is None:
+            return None
+        return self.draw_cells(n).tolist()
+
+    def density_map(self, density):
+        """
+        Returns a density map as a flat float array, checking its shape."""
+        density = np.asarray(density, dtype=np.float64)
+        if density.shape != (self.grid.width, self.grid.height):
+            raise ValueError(
+                "Density maps must have the shape (grid.width, grid.height) = {}, not {}".format(
+                    (self.grid.width, self.grid.height), density.shape
+                )
+            )
+        return density.reshape(-1)
+
+    def draw_cells(self, n, density=None):
+        """
+        Returns the cells (flat indices) of the next n agents to be created, in one vectorized draw : uniformly,
+        or with probabilities proportional to the density map. In the counter random mode, the cell of an agent
+        is drawn from its id."""
+        cells_count = self.grid.width * self.grid.height
+        if self.counter_rng is not None:
+            ids = np.arange(self.current_id + 1, self.current_id + n + 1)
+            draws = self.counter_rng.random(0, ids, PLACE)
+        else:
+            draws = self.np_random.random(n)
+        if density is None:
+            return np.minimum(draws * cells_count, cells_count - 1).astype(np.int64)
+        weights = np.cumsum(self.density_map(density))
+        if n and not weights[-1] > 0:
+            raise ValueError("A density map of agents must have a positive sum")
+        cells = np.searchsorted(weights, draws * weights[-1], side="right")
+        return np.minimum(cells, cells_count - 1)
+
+    def populate(self, sheep_density=None, wolf_density=None, grass_density=None):
+        """
+        Creates the initial agents and grass in bulk (see the bulk_init argument) : the cells of each breed are
+        drawn at once, the agents are registered in the grid and the scheduler in batch, and the grass patches
+        are drawn with one call for the whole grid."""
+        height = self.grid.height
+        for breed, count, energy, density in (
+            (Sheep, self.initial_sheep, self.sheep_energy, sheep_density),
+            (Wolf, self.initial_wolves, self.wolf_energy, wolf_density),
+        ):
+            cells = self.draw_cells(count, density)
+            if self.array_engine is not None:
+                self.array_engine.add_agents(breed, cells, energy)
+                continue
+            first = self.current_id + 1
+            self.current_id += count
+            agents = [
+                breed(unique_id, (x, y), self, moore=True, energy=energy)
+                for unique_id, x, y in zip(
+                    range(first, first + count),
+                    (cells // height).tolist(),
+                    (cells % height).tolist(),
+                )
+            ]
+            self.schedule.add_agents(agents)
+            self.grid.place_agents(agents)
+
+        if self.grass:
+            cells_count = self.grid.width * height
+            if self.counter_rng is not None:
+                draws = self.counter_rng.random(0, np.arange(cells_count), GRASS)
+            else:
+                draws = self.np_random.random(cells_count)
+            coverage = 0.5 if grass_density is None else self.density_map(grass_density)
+            present = (draws < coverage).reshape(self.grid.width, height)
+            field = self.grass_field
+            field.present[...] = present
+            field.grown[...] = present
+            field.recount()
+            field.countdown = np.where(present, self.grass_regrowth_time, 0)
+
+    def draw_for_agents(self, ids):
+        """
+        In the counter random mode, draws at once the activation order of the agents of a breed (given by their
+        ids), and their move and reproduction draws for this step. Returns the order, as a permutation of ids."""
+        tick = self.schedule.steps
+        order = self.counter_rng.order(tick, ids)
+        ids = np.asarray(ids)[order]
+        self.move_draws = iter(self.counter_rng.random(tick, ids, MOVE).tolist())
+        self.reproduce_draws = dict(
+            zip(ids.tolist(), self.counter_rng.random(tick, ids, REPRODUCE).tolist())
+        )
+        return order
+
+    def reproduce_draw(self, agent):
+        """
+        Returns the uniform number in [0, 1) deciding whether an agent reproduces : the next number of
+        self.random, or the agent's draw of the step in the counter random mode."""
+        if self.counter_rng is None:
+            return self.random.random()
+        return self.reproduce_draws[agent.unique_id]
+
+    def get_breed_count(self, breed_class):
+        """
+        Returns the current number of agents of certain breed, whatever the engine."""
+        if self.array_engine is not None:
+            return self.array_engine.get_breed_count(breed_class)
+        return self.schedule.get_breed_count(breed_class)
+
+    def get_agent_count(self):
+        """
+        Returns the current number of sheep and wolves, whatever the engine."""
+        if self.array_engine is not None:
+            return len(self.array_engine.sheep) + len(self.array_engine.wolves)
+        return self.schedule.get_agent_count()
+
+    def get_breed_values(self, breed_class, attribute):
+        """
+        Returns the values of an attribute (energy, age, last_ate) of all the agents of certain breed,
+        as a NumPy array, whatever the engine."""
+        if self.array_engine is not None:
+            return getattr(self.array_engine.breed_arrays(breed_class), attribute)
+        agents = self.schedule.get_breed_agents(breed_class)
+        return np.fromiter(
+            (getattr(agent, attribute) for agent in agents),
+            BreedArrays.dtypes[attribute],
+            len(agents),
+        )
+
+    def get_breed_cells(self, breed_class):
+        """
+        Returns the cells (flat indices x * grid.height + y) of all the agents of certain breed, as a NumPy array,
+        whatever the engine."""
+        if self.array_engine is not None:
+            return self.array_engine.breed_arrays(breed_class).cell
+        agents = self.schedule.get_breed_agents(breed_class)
+        height = self.grid.height
+        return np.fromiter(
+            (agent.pos[0] * height + agent.pos[1] for agent in agents), np.int64, len(agents)
+        )
+
+    def get_life_expectancy(self, breed_class):
+        """
+        Returns the life expectancy of certain breed."""
+        if breed_class is Sheep:
+            return self.sheep_life_expectancy
+        return self.wolf_life_expectancy
+
+    def checkpoint(self, path, compress=False):
+        """
+        Saves the whole state of the model (agents, grass, collected data, random generators) in the
+        binary file path. Triggers of the datacollector are not saved."""
+        save_checkpoint(self, path, compress=compress)
+
+    @classmethod
+    def restore(cls, path):
+        """
+        Returns the model saved in the checkpoint file path. It continues exactly as the saved model would have."""
+        return load_checkpoint(cls, path)
+
+    def snapshot(self):
+        """
+        Returns the Snapshot of the current state : step, number of sheep and wolves, and grown grass patches."""
+        return Snapshot(
+            self.schedule.steps,
+            self.get_breed_count(Sheep),
+            self.get_breed_count(Wolf),
+            self.grass_field.count_grown(),
+        )
+
+    def iter_run(self, step_count=None):
+        """
+        Runs the model step by step, yielding the Snapshot of each step. Runs step_count steps, or until the
+        caller stops iterating if step_count is None."""
+        for i in range(step_count) if step_count is not None else itertools.count():
+            self.step()
+            yield self.snapshot()
+
+    def run_until(self, *conditions, max_steps=None):
+        """
+        Runs the model until one of the stop conditions (see prey_predator.stopping) returns a reason to stop,
+        or for at most max_steps steps. The reason is recorded in self.stop_reason and returned (None if the
+        model ran max_steps steps), and self.running becomes False."""
+        key = self.cache_key(max_steps, conditions)
+        if key is not None:
+            cached = self.cache.load(key, self)
+            if cached is not None:
+                return cached.summary["result"]
+        reason = None
+        for snapshot in self.iter_run(max_steps):
+            for condition in conditions:
+                reason = condition(snapshot)
+                if reason is not None:
+                    self.stop_reason = reason
+                    self.running = False
+                    break
+            if reason is not None:
+                break
+        if key is not None:
+            self.cache.put(key, self, reason)
+        return reason
 
     def run_model(self, step_count=10):
+        key = self.cache_key(step_count)
+        if key is not None and self.cache.load(key, self) is not None:
+            return
         for i in range(step_count):
             self.step()
+        if key is not None:
+            self.cache.put(key, self)
+
+    def cache_arguments(self):
+        """
+        Returns the arguments the model was built with, as JSON values (the key of its runs in a result cache)."""
+        arguments = {name: getattr(self, name) for name in PARAMETER_NAMES}
+        arguments.update(
+            model=type(self).__module__ + "." + type(self).__qualname__,
+            seed=self.seed,
+            engine=self.engine,
+            scheduler=self.scheduler,
+            rng=self.rng,
+            bulk_init=self.bulk_init,
+            densities=[
+                None if density is None else hashlib.sha256(self.density_map(density)).hexdigest()
+                for density in self.densities
+            ],
+            every=self.datacollector.every,
+            age_bins=self.datacollector.age_bins,
+        )
+        return arguments
+
+    def cache_key(self, steps, conditions=()):
+        """
+        Returns the key in the result cache of running the model from its current step for steps more steps
+        (or until one of the stop conditions fires), or None if the run is not cached : the model has no cache,
+        no seed, a recorder or collection triggers, or a stop condition gives no parameters (see
+        stopping.condition_key). The model must not have been changed but by its steps."""
+        if (
+            self.cache is None
+            or self.seed is None
+            or self.recorder is not None
+            or self.datacollector.triggers
+        ):
+            return None
+        target = None if steps is None else self.schedule.steps + steps
+        return cache_key(
+            self.cache_arguments(), [self.schedule.steps, target], conditions
+        )
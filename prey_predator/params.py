@@ -0,0 +1,57 @@
+"""
+Specification of the parameters of the Wolf-Sheep model.
+
+This module is the single source of the parameters' defaults and descriptions : the visualization server builds
+its user settable parameters from it, and the command line interface and the batch tools take their defaults
+from it. It only depends on the standard library, so that importing it is instantaneous.
+"""
+
+from collections import namedtuple
+
+# kind is "fixed" (not settable in the server), "number", "slider" or "checkbox".
+# min_value, max_value and step are only used by sliders.
+Parameter = namedtuple(
+    "Parameter",
+    ["name", "kind", "description", "value", "min_value", "max_value", "step"],
+    defaults=[None, None, None],
+)
+
+# The values for each parameters are the ones used to compute our graph in our model restitution
+PARAMETERS = [
+    Parameter("height", "slider", "Height of the grid", 20, 10, 1000, 10),
+    Parameter("width", "slider", "Width of the grid", 20, 10, 1000, 10),
+    Parameter("sheep_energy", "number", "Energy of a Sheep", 10),
+    Parameter("wolf_energy", "number", "Energy of a Wolf", 10),
+    Parameter("initial_sheep", "number", "Initial Number of Sheeps", 150),
+    Parameter("initial_wolves", "number", "Initial Number of Wolves", 100),
+    Parameter(
+        "sheep_reproduce", "slider", "Sheep Reproducing Probability", 0.15, 0, 0.5, 0.01
+    ),
+    Parameter(
+        "wolf_reproduce", "slider", "Wolves Reproducing Probability", 0.11, 0, 0.5, 0.01
+    ),
+    Parameter("sheep_gain_from_food", "number", "Sheep Energy points with Food", 5),
+    Parameter("wolf_gain_from_food", "number", "Wolves Energy points with Food", 20),
+    Parameter("sheep_move_energy", "number", "Sheep energy loss with movement", 1),
+    Parameter("wolf_move_energy", "number", "Wolves energy loss with movement", 1),
+    Parameter(
+        "sheep_reproduction_energy", "number", "Sheep energy loss with reproduction", 2
+    ),
+    Parameter(
+        "wolf_reproduction_energy", "number", "Wolves energy loss with reproduction", 3
+    ),
+    Parameter("grass", "checkbox", "Are Sheeps eating Grass", True),
+    Parameter("grass_regrowth_time", "number", "Grass Regrowth Time", 15),
+    Parameter("sheep_life_expectancy", "number", "Sheep life expectancy", 45),
+    Parameter("wolf_life_expectancy", "number", "Wolf life expectancy", 100),
+    Parameter("sheep_min_digestion", "number", "Sheep digestion time", 3),
+    Parameter("wolf_min_digestion", "number", "Wolf digestion time", 10),
+]
+
+PARAMETER_NAMES = [parameter.name for parameter in PARAMETERS]
+
+
+def default_parameters():
+    """
+    Returns the default value of every model parameter."""
+    return {parameter.name: parameter.value for parameter in PARAMETERS}
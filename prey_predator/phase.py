@@ -0,0 +1,336 @@
+"""
+Adaptive exploration of the phase diagram of the Wolf-Sheep model : where, over two or three parameters, do wolves
+and sheep coexist ?
+
+The parameters take their values on a lattice : each axis (low, high, points) is cut into points - 1 intervals,
+each one being halved up to levels times. The exploration starts with the coarse grid (the cells between the
+points of the axes), and works in rounds :
+
+- every corner of the current cells is run replicates times, and a corner whose replicates disagree (less than a
+  certainty fraction of them with the same answer to "do they coexist ?") gets replicates more runs, up to
+  max_replicates,
+- once every corner is settled, the cells whose corners disagree (or are still uncertain) are cut into 2 ** d
+  cells, d being the number of axes, until the finest level : only the cells on the boundary between coexistence
+  and extinction are refined.
+
+A run stops as soon as its outcome is decided : once a breed is extinct (they cannot coexist anymore), or above
+max_density animals per cell (an explosion, see prey_predator.meanfield). The runs of a round are simulated in
+parallel by a process pool, each one with a seed derived from its parameters and replicate number.
+
+The phase map is a JSON file, written again after each run : the settings of the exploration and the outcomes of
+the runs of every point. An exploration started again with the same output resumes from its map, without
+running again the runs it holds.
+
+    >>> explorer = PhaseExplorer(
+    ...     {"sheep_reproduce": (0.02, 0.2, 5), "wolf_gain_from_food": (5, 40, 5)}, "phase.json", steps=300
+    ... )
+    >>> explorer.explore()
+    >>> explorer.phase_map()
+"""
+
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from prey_predator.agents import Sheep, Wolf
+from prey_predator.batch import run_key, run_seed
+from prey_predator.meanfield import OUTCOMES, outcome_codes
+from prey_predator.model import WolfSheep
+from prey_predator.params import PARAMETER_NAMES, default_parameters
+from prey_predator.stopping import Extinction, PopulationCap
+
+
+def run_point(parameters, seed, steps, max_density, engine, cache=None):
+    """
+    Worker task : runs the model until its outcome is decided or for steps steps, and returns the code of its
+    outcome (index in meanfield.OUTCOMES) and the number of steps it ran."""
+    model = WolfSheep(seed=seed, engine=engine, cache=cache, **parameters)
+    cap = PopulationCap(max_density * parameters["width"] * parameters["height"])
+    model.run_until(Extinction(Sheep), Extinction(Wolf), cap, max_steps=steps)
+    code = outcome_codes(
+        model.get_breed_count(Sheep),
+        model.get_breed_count(Wolf),
+        cap(model.snapshot()) is not None,
+    )
+    return int(code), model.schedule.steps
+
+
+class PhaseExplorer:
+    """
+    An adaptive exploration of the phase diagram over two or three parameters, saved in a JSON phase map.
+
+    Args:
+        axes: {parameter name: (low, high, points)}, the coarse grid of each parameter.
+        output: the path of the JSON phase map, resumed from if it exists.
+        steps: the number of steps of the runs (a run still coexisting after steps steps coexists).
+        replicates: the number of runs of a point, and of the runs added to a point whose outcome is uncertain.
+        max_replicates: the maximum number of runs of a point.
+        levels: the number of times the cells of the coarse grid can be halved.
+        certainty: the fraction of the runs of a point which must agree for its outcome to be certain.
+        parameters: the values of the other parameters (missing ones take their default value).
+        base_seed: seed from which the seed of each run is derived.
+        engine: the WolfSheep engine of the runs.
+        max_density: the number of animals per cell above which a run explodes.
+        cache: the directory of a result cache shared by the runs (see prey_predator.cache).
+    """
+
+    def __init__(
+        self,
+        axes,
+        output,
+        steps=300,
+        replicates=4,
+        max_replicates=16,
+        levels=3,
+        certainty=0.9,
+        parameters=None,
+        base_seed=0,
+        engine="arrays",
+        max_density=50,
+        cache=None,
+    ):
+        if not 2 <= len(axes) <= 3:
+            raise ValueError("A phase diagram has 2 or 3 axes, not {}".format(len(axes)))
+        unknown = (set(axes) | set(parameters or {})) - set(PARAMETER_NAMES)
+        if unknown:
+            raise ValueError("Unknown parameters: {}".format(sorted(unknown)))
+        self.axes = {name: (low, high, int(points)) for name, (low, high, points) in axes.items()}
+        if any(points < 2 for _, _, points in self.axes.values()):
+            raise ValueError("Every axis needs at least 2 points")
+        self.output = output
+        self.steps = steps
+        self.replicates = replicates
+        self.max_replicates = max_replicates
+        self.levels = levels
+        self.certainty = certainty
+        self.parameters = {**default_parameters(), **(parameters or {})}
+        self.base_seed = base_seed
+        self.engine = engine
+        self.max_density = max_density
+        self.cache = cache
+        # "i,j(,k)" lattice coordinates -> outcome codes of the runs of the point
+        self.outcomes = {}
+        self.load()
+
+    def settings(self):
+        """
+        The settings of the exploration, as JSON values : a phase map is only resumed with the same ones."""
+        return {
+            "axes": {name: list(axis) for name, axis in self.axes.items()},
+            "steps": self.steps,
+            "levels": self.levels,
+            "parameters": self.parameters,
+            "base_seed": self.base_seed,
+            "engine": self.engine,
+            "max_density": self.max_density,
+        }
+
+    def load(self):
+        """
+        Loads the outcomes of the runs of the phase map, if it exists."""
+        if not os.path.exists(self.output):
+            return
+        with open(self.output) as file:
+            saved = json.load(file)
+        if saved["settings"] != json.loads(json.dumps(self.settings())):
+            raise ValueError(
+                "The phase map {} was explored with other settings".format(self.output)
+            )
+        self.outcomes = {key: point["outcomes"] for key, point in saved["points"].items()}
+
+    def save(self):
+        """
+        Writes the phase map (to a temporary file renamed at the end, so that it is always complete)."""
+        points = {}
+        for key, outcomes in self.outcomes.items():
+            counts = np.bincount(outcomes, minlength=len(OUTCOMES))
+            points[key] = {
+                "parameters": self.point_parameters(key_coordinates(key)),
+                "outcomes": outcomes,
+                "coexistence": self.coexistence(key),
+                "counts": dict(zip(OUTCOMES, counts.tolist())),
+            }
+        phase_map = {"settings": self.settings(), "points": points, "cells": self.cells_map()}
+        tmp_path = self.output + ".tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(phase_map, file, indent=1)
+        os.replace(tmp_path, self.output)
+
+    def lattice_size(self):
+        """
+        The number of lattice steps between two points of the coarse grid."""
+        return 2**self.levels
+
+    def point_parameters(self, coordinates):
+        """
+        Returns the parameters of a lattice point (the integer parameters are rounded)."""
+        parameters = dict(self.parameters)
+        for (name, (low, high, points)), i in zip(self.axes.items(), coordinates):
+            value = low + (high - low) * i / ((points - 1) * self.lattice_size())
+            if isinstance(self.parameters[name], int) and not isinstance(
+                self.parameters[name], bool
+            ):
+                value = int(round(value))
+            parameters[name] = value
+        return parameters
+
+    def coexistence(self, key):
+        """
+        Returns the fraction of the runs of a point where wolves and sheep coexist."""
+        outcomes = self.outcomes.get(key, [])
+        if not outcomes:
+            return None
+        return float(np.mean(np.asarray(outcomes) == 0))
+
+    def coexist(self, key):
+        return self.coexistence(key) >= 0.5
+
+    def settled(self, key):
+        """
+        Returns True if a point needs no more run : its runs agree, or it has max_replicates runs."""
+        runs = len(self.outcomes.get(key, []))
+        if runs < self.replicates:
+            return False
+        fraction = self.coexistence(key)
+        return max(fraction, 1 - fraction) >= self.certainty or runs >= self.max_replicates
+
+    def certain(self, key):
+        fraction = self.coexistence(key)
+        return max(fraction, 1 - fraction) >= self.certainty
+
+    def coarse_cells(self):
+        """
+        Returns the cells of the coarse grid, as (corner coordinates, size in lattice steps)."""
+        size = self.lattice_size()
+        ranges = [range(0, (points - 1) * size, size) for _, _, points in self.axes.values()]
+        return [(corner, size) for corner in itertools.product(*ranges)]
+
+    def corners(self, cell):
+        corner, size = cell
+        return [
+            coordinates_key([c + o * size for c, o in zip(corner, offsets)])
+            for offsets in itertools.product((0, 1), repeat=len(corner))
+        ]
+
+    def on_boundary(self, cell):
+        """
+        Returns True if the corners of a cell disagree, or if one of them is uncertain."""
+        corners = self.corners(cell)
+        if not all(self.certain(key) for key in corners):
+            return True
+        return len({self.coexist(key) for key in corners}) > 1
+
+    def children(self, cell):
+        corner, size = cell
+        half = size // 2
+        return [
+            (tuple(c + o * half for c, o in zip(corner, offsets)), half)
+            for offsets in itertools.product((0, 1), repeat=len(corner))
+        ]
+
+    def cells(self):
+        """
+        Returns the cells of the exploration, refined as far as the runs of the phase map allow, and the cells
+        whose corners still need runs."""
+        cells, pending = [], []
+        stack = self.coarse_cells()
+        while stack:
+            cell = stack.pop()
+            if not all(self.settled(key) for key in self.corners(cell)):
+                pending.append(cell)
+                cells.append(cell)
+            elif cell[1] > 1 and self.on_boundary(cell):
+                stack.extend(self.children(cell))
+            else:
+                cells.append(cell)
+        return cells, pending
+
+    def cells_map(self):
+        """
+        Returns the cells of the exploration, as JSON values : their corner, their size (in lattice steps) and
+        their phase ("coexistence", "extinction", "boundary", or "pending" while their corners need runs)."""
+        cells, pending = self.cells()
+        pending = set(pending)
+        cells_map = []
+        for cell in sorted(cells):
+            corners = self.corners(cell)
+            if cell in pending:
+                phase = "pending"
+            elif self.on_boundary(cell):
+                phase = "boundary"
+            elif self.coexist(corners[0]):
+                phase = "coexistence"
+            else:
+                phase = "extinction"
+            cells_map.append({"corner": list(cell[0]), "size": cell[1], "phase": phase})
+        return cells_map
+
+    def next_runs(self):
+        """
+        Returns the runs (point key, replicate number) the current cells need."""
+        runs = []
+        _, pending = self.cells()
+        keys = sorted({key for cell in pending for key in self.corners(cell)})
+        for key in keys:
+            if self.settled(key):
+                continue
+            done = len(self.outcomes.get(key, []))
+            # replicates are added by whole batches, so that a resumed map gets the same runs
+            target = (done // self.replicates + 1) * self.replicates
+            runs.extend((key, replicate) for replicate in range(done, min(target, self.max_replicates)))
+        return runs
+
+    def explore(self, processes=None):
+        """
+        Explores the phase diagram until every cell is settled, running the runs of each round over a process
+        pool (of processes workers, the number of CPUs by default). Returns the phase map of cells_map."""
+        with ProcessPoolExecutor(processes) as pool:
+            runs = self.next_runs()
+            while runs:
+                futures = {}
+                for key, replicate in runs:
+                    parameters = self.point_parameters(key_coordinates(key))
+                    seed = run_seed(
+                        run_key(parameters, replicate, self.steps, self.engine, self.base_seed)
+                    )
+                    future = pool.submit(
+                        run_point,
+                        parameters,
+                        seed,
+                        self.steps,
+                        self.max_density,
+                        self.engine,
+                        self.cache,
+                    )
+                    futures[future] = (key, replicate)
+                results = {}
+                for future in as_completed(futures):
+                    key, replicate = futures[future]
+                    results[key, replicate] = future.result()[0]
+                    # the outcomes of a point are kept in replicate order, so that a map resumes exactly
+                    outcomes = self.outcomes.setdefault(key, [])
+                    while (key, len(outcomes)) in results:
+                        outcomes.append(results.pop((key, len(outcomes))))
+                    self.save()
+                runs = self.next_runs()
+        self.save()
+        return self.cells_map()
+
+    def phase_map(self):
+        """
+        Returns the explored points, as a list of (parameters, fraction of coexisting runs, number of runs)."""
+        return [
+            (self.point_parameters(key_coordinates(key)), self.coexistence(key), len(outcomes))
+            for key, outcomes in sorted(self.outcomes.items())
+        ]
+
+
+def coordinates_key(coordinates):
+    return ",".join(str(c) for c in coordinates)
+
+
+def key_coordinates(key):
+    return tuple(int(c) for c in key.split(","))
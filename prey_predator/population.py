@@ -0,0 +1,219 @@
+"""
+Population statistics kept up to date by the events of the agents.
+
+Instead of scanning every agent each time a statistic is needed, the model keeps running aggregates of each breed,
+updated in O(1) by the events of its agents : a birth (Sheep.reproduce, Wolf.reproduce), a death
+(RandomWalker.dies), a meal (eat_grass, eat_sheep) and a change of energy (moves and reproduction). The array
+engine sends the same events for a whole phase at once.
+
+The ages and the hunger of the agents are not stored one by one, as they change every step : an agent of age a at
+tick t was born at tick t - a, and an agent whose last_ate is l last ate at tick t - l. The aggregates count the
+agents born at each tick (the cohorts) and having last eaten at each tick (the meals), which only change on events,
+and the histograms are computed from these counters, in a time proportional to the life expectancy rather than to
+the population.
+
+The aggregates are computed from the agents once (rebuild) when the model is created or loaded, and after that
+only the events update them. With integer energies, they are exactly the values a scan of the agents gives ;
+otherwise the total energy may differ from it by rounding errors.
+"""
+
+import numpy as np
+
+from prey_predator.agents import Sheep, Wolf
+from prey_predator.datacollection import age_histogram
+
+
+def increment(counter, key, n=1):
+    counter[key] = counter.get(key, 0) + n
+
+
+def decrement(counter, key, n=1):
+    n = counter[key] - n
+    if n:
+        counter[key] = n
+    else:
+        del counter[key]
+
+
+class BreedStatistics:
+    """
+    The running aggregates of one breed : its number of agents, their total energy, and the number of agents
+    born at each tick (cohorts) and having last eaten at each tick (meals).
+    Meals are not tracked (track_meals is False) for the sheep of a model without grass, as they never eat.
+    """
+
+    __slots__ = ("count", "energy", "cohorts", "meals", "track_meals")
+
+    def __init__(self, track_meals=True):
+        self.count = 0
+        self.energy = 0.0
+        self.cohorts = {}
+        self.meals = {}
+        self.track_meals = track_meals
+
+    def add(self, tick, energy, age, last_ate):
+        self.count += 1
+        self.energy += energy
+        increment(self.cohorts, tick - age)
+        if self.track_meals:
+            increment(self.meals, tick - last_ate)
+
+    def remove(self, tick, energy, age, last_ate):
+        self.count -= 1
+        # no rounding error is left once the breed is extinct
+        self.energy = self.energy - energy if self.count else 0.0
+        decrement(self.cohorts, tick - age)
+        if self.track_meals:
+            decrement(self.meals, tick - last_ate)
+
+    def feed(self, tick, last_ate, gain):
+        """
+        An agent eats at tick : it last ate last_ate steps before the previous tick."""
+        self.energy += gain
+        if self.track_meals:
+            decrement(self.meals, tick - 1 - last_ate)
+            increment(self.meals, tick)
+
+    def add_many(self, tick, energy, age, last_ate):
+        """
+        Adds agents given as arrays of energies, ages and last_ate."""
+        self.count += len(energy)
+        self.energy += float(energy.sum())
+        self.update(self.cohorts, tick - age, 1)
+        if self.track_meals:
+            self.update(self.meals, tick - last_ate, 1)
+
+    def remove_many(self, tick, energy, age, last_ate):
+        self.count -= len(energy)
+        self.energy = self.energy - float(energy.sum()) if self.count else 0.0
+        self.update(self.cohorts, tick - age, -1)
+        if self.track_meals:
+            self.update(self.meals, tick - last_ate, -1)
+
+    def feed_many(self, tick, last_ate, gain):
+        self.energy += len(last_ate) * gain
+        if self.track_meals and len(last_ate):
+            self.update(self.meals, tick - 1 - last_ate, -1)
+            increment(self.meals, tick, len(last_ate))
+
+    def update(self, counter, ticks, sign):
+        if not len(ticks):
+            return
+        # the ticks span at most the life expectancy : counted without sorting them
+        first = int(ticks.min())
+        counts = np.bincount(ticks - first)
+        values = np.flatnonzero(counts)
+        for key, n in zip((values + first).tolist(), counts[values].tolist()):
+            if sign > 0:
+                increment(counter, key, n)
+            else:
+                decrement(counter, key, n)
+
+    def ages(self, tick):
+        """
+        Returns the ages of the cohorts at tick, and their number of agents."""
+        ticks = np.fromiter(self.cohorts.keys(), np.int64, len(self.cohorts))
+        counts = np.fromiter(self.cohorts.values(), np.int64, len(self.cohorts))
+        return tick - ticks, counts
+
+
+class PopulationStatistics:
+    """
+    The running aggregates of the sheep and the wolves of a model, and the events updating them.
+
+    tick is the step being run (schedule.steps + 1 during a step, schedule.steps between the steps) : an agent
+    born during a step has age 0 at the end of it.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.tick = 0
+        self.breeds = {Sheep: BreedStatistics(), Wolf: BreedStatistics()}
+
+    def rebuild(self):
+        """
+        Computes the aggregates from the agents of the model, once they were created or loaded outside of the
+        events (initial agents, checkpoints)."""
+        model = self.model
+        self.tick = model.schedule.steps
+        for breed in self.breeds:
+            # sheep only get hungrier in a model with grass
+            statistics = BreedStatistics(track_meals=breed is not Sheep or bool(model.grass))
+            statistics.add_many(
+                self.tick,
+                model.get_breed_values(breed, "energy"),
+                model.get_breed_values(breed, "age"),
+                model.get_breed_values(breed, "last_ate"),
+            )
+            self.breeds[breed] = statistics
+
+    def begin_step(self):
+        self.tick = self.model.schedule.steps + 1
+
+    # events of the agents
+
+    def born(self, agent):
+        self.breeds[type(agent)].add(self.tick, agent.energy, agent.age, agent.last_ate)
+
+    def died(self, agent):
+        self.breeds[type(agent)].remove(self.tick, agent.energy, agent.age, agent.last_ate)
+
+    def ate(self, agent, gain):
+        """
+        An agent eats and gains gain energy (called before its last_ate is reset)."""
+        self.breeds[type(agent)].feed(self.tick, agent.last_ate, gain)
+
+    def energy_changed(self, agent, delta):
+        self.breeds[type(agent)].energy += delta
+
+    # events of the array engine, for many agents of a breed at once
+
+    def born_many(self, breed, energy, age, last_ate):
+        self.breeds[breed].add_many(self.tick, energy, age, last_ate)
+
+    def died_many(self, breed, energy, age, last_ate):
+        self.breeds[breed].remove_many(self.tick, energy, age, last_ate)
+
+    def ate_many(self, breed, last_ate, gain):
+        self.breeds[breed].feed_many(self.tick, last_ate, gain)
+
+    def energy_changed_many(self, breed, delta):
+        self.breeds[breed].energy += delta
+
+    # statistics
+
+    def count(self, breed):
+        return self.breeds[breed].count
+
+    def total_energy(self, breed):
+        return self.breeds[breed].energy
+
+    def age_histogram(self, breed, bins):
+        """
+        Returns the histogram of the ages of a breed, as datacollection.age_histogram does."""
+        ages, counts = self.breeds[breed].ages(self.tick)
+        return age_histogram(ages, self.model.get_life_expectancy(breed), bins, weights=counts)
+
+    def hungry(self, breed):
+        """
+        Returns the number of agents of a breed hungry enough to eat (last_ate at least their min_digestion)."""
+        statistics = self.breeds[breed]
+        min_digestion = (
+            self.model.sheep_min_digestion if breed is Sheep else self.model.wolf_min_digestion
+        )
+        if not statistics.track_meals:
+            return statistics.count if min_digestion <= 0 else 0
+        last = self.tick - min_digestion
+        return sum(n for tick, n in statistics.meals.items() if tick <= last)
+
+    def grown_fraction(self):
+        """
+        Returns the fraction of the cells of the grid holding a fully grown grass patch."""
+        field = self.model.grass_field
+        return field.count_grown() / (field.width * field.height)
+
+    def summary(self, breed, age_bins):
+        """
+        Returns the number of agents of a breed, their total energy and the histogram of their ages, as
+        datacollection.breed_summary."""
+        return self.count(breed), self.total_energy(breed), self.age_histogram(breed, age_bins)
@@ -14,16 +14,10 @@ class RandomWalker(Agent):
 
     """
 
-    grid = None
-    x = None
-    y = None
-    moore = True
-
     def __init__(self, unique_id, pos, model, moore=True):
         """
-        grid: The MultiGrid object in which the agent lives.
-        x: The agent's current x coordinate
-        y: The agent's current y coordinate
+        pos: The agent's current (x, y) coordinates
+        model: The model in which the agent lives.
         moore: If True, may move in all 8 directions.
                 Otherwise, only up, down, left, right.
         """
@@ -31,18 +25,41 @@ class RandomWalker(Agent):
         self.pos = pos
         self.moore = moore
 
+    @classmethod
+    def spawn(cls, model, pos, moore, **kwargs):
+        """
+        Returns a new agent of this class with a fresh unique id. If an agent of this class died earlier, it is
+        taken from the model's pool and reinitialized instead of allocating a new object."""
+        unique_id = model.next_id()
+        pool = model.agent_pool[cls]
+        if pool:
+            agent = pool.pop()
+            agent.__init__(unique_id, pos, model, moore=moore, **kwargs)
+            return agent
+        return cls(unique_id, pos, model, moore=moore, **kwargs)
+
     def random_move(self):
         """
         Step one cell in any allowable direction.
         """
-        # Pick the next cell from the adjacent cells.
-        next_moves = self.model.grid.get_neighborhood(self.pos, self.moore, True)
-        next_move = self.random.choice(next_moves)
+        grid = self.model.grid
+        # Pick the next cell from the adjacent cells, in the precomputed moves table,
+        # with a draw of the batch made by the scheduler for the whole breed.
+        moves, size = grid.moves_table(self.moore)
+        draw = next(self.model.move_draws, None)
+        if draw is None:
+            draw = self.model.np_random.random()
+        x, y = self.pos
+        next_move = moves[(x * grid.height + y) * size + int(draw * size)]
         # Now move:
-        self.model.grid.move_agent(self, next_move)
+        grid.move_agent(self, divmod(next_move, grid.height))
 
     def dies(self):
         """
-        Method to call when a random walker dies. This removes the agent from the scheduler and from the grid."""
+        Method to call when a random walker dies. This removes the agent from the scheduler and from the grid,
+        and puts it in the model's pool, to be reused by spawn. The death is reported to the model's
+        PopulationStatistics."""
+        self.model.statistics.died(self)
         self.model.grid.remove_agent(self)
         self.model.schedule.remove(self)
+        self.model.agent_pool[type(self)].append(self)
@@ -0,0 +1,363 @@
+"""
+Recordings of Wolf-Sheep runs, to replay or query them without simulating them again.
+
+A recording is an append-only binary file : a header (the parameters and the size of the grid), then one record
+per step, written as soon as the step is over. A record holds the state of the grass of every cell (0 for no
+patch, 1 for a growing patch, 2 for a grown one) and the unique_id, cell, energy, age and last_ate of every
+sheep and wolf, as a compressed NumPy archive :
+
+- one record in keyframe_interval is a keyframe, holding the whole state,
+- the others only hold the changes since the previous record : the cells whose grass changed, the ids of the
+  agents who died, the agents born, and the changes of the attributes of the others (differences for the
+  integer attributes, XOR of the bits for the energy, which both compress well).
+
+Recording reads the state of the model only : the trajectories are the same with or without it.
+A Recording maps the file in memory and indexes its records, so that any step can be decoded from the nearest
+keyframe. The file can be read while it is being written (see refresh).
+
+    >>> model = WolfSheep(..., record="run.trace")
+    >>> model.run_model(1000)
+    >>> recording = Recording("run.trace")
+    >>> recording.state(500).agents["Sheep"]["cell"]
+    >>> recording.region_counts(0, 10, 0, 10)["Sheep"]
+"""
+
+import io
+import json
+import struct
+from collections import namedtuple
+from types import SimpleNamespace
+
+import numpy as np
+
+from prey_predator.agents import Sheep, Wolf
+from prey_predator.params import PARAMETER_NAMES
+
+MAGIC = b"WSREC001"
+META_SIZE = struct.Struct("<I")
+# step, kind and size of a record
+RECORD_HEADER = struct.Struct("<qBQ")
+KEYFRAME = 0
+DELTA = 1
+
+BREEDS = {"Sheep": Sheep, "Wolf": Wolf}
+COLUMNS = {
+    "unique_id": np.int64,
+    "cell": np.int64,
+    "energy": np.float64,
+    "age": np.int64,
+    "last_ate": np.int64,
+}
+
+RecordedState = namedtuple("RecordedState", ["step", "grass", "agents"])
+RecordedState.__doc__ = """
+The state of a model at a step : the grass state of every cell (flat array, cell x * height + y), and
+{breed name: {attribute: array}} for the agents, sorted by unique_id."""
+
+
+def model_state(model):
+    """
+    Returns the RecordedState of a model, whatever its engine."""
+    field = model.grass_field
+    grass = (field.present.astype(np.uint8) + field.grown).reshape(-1)
+    agents = {}
+    for name, breed in BREEDS.items():
+        columns = {
+            attribute: model.get_breed_values(breed, attribute)
+            for attribute in ("unique_id", "energy", "age", "last_ate")
+        }
+        columns["cell"] = model.get_breed_cells(breed)
+        order = np.argsort(columns["unique_id"], kind="stable")
+        agents[name] = {
+            attribute: np.asarray(columns[attribute], dtype=dtype)[order]
+            for attribute, dtype in COLUMNS.items()
+        }
+    return RecordedState(model.schedule.steps, grass, agents)
+
+
+def difference(after, before):
+    """
+    Returns the change from before to after : their difference for integers, the XOR of their bits for floats."""
+    if after.dtype.kind == "f":
+        return after.view(np.int64) ^ before.view(np.int64)
+    return after - before
+
+
+def apply_difference(before, change):
+    """
+    Returns the values after a change computed by difference."""
+    if before.dtype.kind == "f":
+        return (before.view(np.int64) ^ change).view(np.float64)
+    return before + change
+
+
+def encode_keyframe(state):
+    arrays = {"grass": state.grass}
+    for name, columns in state.agents.items():
+        for attribute, values in columns.items():
+            arrays["{}/{}".format(name, attribute)] = values
+    return arrays
+
+
+def decode_keyframe(step, arrays):
+    agents = {
+        name: {attribute: arrays["{}/{}".format(name, attribute)] for attribute in COLUMNS}
+        for name in BREEDS
+    }
+    return RecordedState(step, arrays["grass"], agents)
+
+
+def encode_delta(previous, state):
+    changed = np.flatnonzero(state.grass != previous.grass)
+    arrays = {"grass/index": changed, "grass/values": state.grass[changed]}
+    for name in BREEDS:
+        before, after = previous.agents[name], state.agents[name]
+        # both are sorted by unique_id : the survivors are in the same order in both
+        survived = np.isin(before["unique_id"], after["unique_id"], assume_unique=True)
+        kept = np.isin(after["unique_id"], before["unique_id"], assume_unique=True)
+        arrays[name + "/dead"] = before["unique_id"][~survived]
+        for attribute in COLUMNS:
+            arrays["{}/born/{}".format(name, attribute)] = after[attribute][~kept]
+            if attribute != "unique_id":
+                arrays["{}/change/{}".format(name, attribute)] = difference(
+                    after[attribute][kept], before[attribute][survived]
+                )
+    return arrays
+
+
+def decode_delta(previous, step, arrays):
+    grass = previous.grass.copy()
+    grass[arrays["grass/index"]] = arrays["grass/values"]
+    agents = {}
+    for name in BREEDS:
+        before = previous.agents[name]
+        survived = ~np.isin(before["unique_id"], arrays[name + "/dead"], assume_unique=True)
+        columns = {}
+        for attribute in COLUMNS:
+            values = before[attribute][survived]
+            if attribute != "unique_id":
+                values = apply_difference(values, arrays["{}/change/{}".format(name, attribute)])
+            columns[attribute] = np.concatenate(
+                [values, arrays["{}/born/{}".format(name, attribute)]]
+            )
+        order = np.argsort(columns["unique_id"], kind="stable")
+        agents[name] = {attribute: values[order] for attribute, values in columns.items()}
+    return RecordedState(step, grass, agents)
+
+
+class Recorder:
+    """
+    Records the state of a model after each step in the file path (overwritten).
+
+    Args:
+        path: the file of the recording.
+        keyframe_interval: one record in keyframe_interval holds the whole state.
+    """
+
+    def __init__(self, path, keyframe_interval=50):
+        self.path = path
+        self.keyframe_interval = keyframe_interval
+        self.file = None
+        self.previous = None
+        self.records = 0
+
+    def write_header(self, model):
+        meta = {
+            "width": model.grid.width,
+            "height": model.grid.height,
+            "keyframe_interval": self.keyframe_interval,
+            "parameters": {name: getattr(model, name) for name in PARAMETER_NAMES},
+        }
+        meta = json.dumps(meta).encode()
+        self.file = open(self.path, "wb")
+        self.file.write(MAGIC + META_SIZE.pack(len(meta)) + meta)
+
+    def record(self, model):
+        """
+        Appends the current state of the model to the recording."""
+        if self.file is None:
+            self.write_header(model)
+        state = model_state(model)
+        if self.previous is None or self.records % self.keyframe_interval == 0:
+            kind, arrays = KEYFRAME, encode_keyframe(state)
+        else:
+            kind, arrays = DELTA, encode_delta(self.previous, state)
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, **arrays)
+        payload = buffer.getvalue()
+        self.file.write(RECORD_HEADER.pack(state.step, kind, len(payload)) + payload)
+        # readers see every finished record
+        self.file.flush()
+        self.previous = state
+        self.records += 1
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class Recording:
+    """
+    A recording, read from the file path. Its records are indexed by step.
+
+    Attributes:
+        meta: the parameters ("parameters"), the grid's "width" and "height" and the "keyframe_interval".
+        steps: the steps recorded.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.data = np.memmap(path, dtype=np.uint8, mode="r")
+        if bytes(self.data[: len(MAGIC)]) != MAGIC:
+            raise ValueError("{} is not a Wolf-Sheep recording".format(path))
+        (size,) = META_SIZE.unpack_from(self.data, len(MAGIC))
+        start = len(MAGIC) + META_SIZE.size
+        self.meta = json.loads(bytes(self.data[start : start + size]))
+        self.width = self.meta["width"]
+        self.height = self.meta["height"]
+        self.end = start + size
+        self.offsets = []
+        self.kinds = []
+        self.step_list = []
+        self.refresh()
+
+    def refresh(self):
+        """
+        Indexes the records appended since the file was opened. A record still being written is left out."""
+        self.data = np.memmap(self.path, dtype=np.uint8, mode="r")
+        while self.end + RECORD_HEADER.size <= len(self.data):
+            step, kind, size = RECORD_HEADER.unpack_from(self.data, self.end)
+            if self.end + RECORD_HEADER.size + size > len(self.data):
+                break
+            self.offsets.append(self.end + RECORD_HEADER.size)
+            self.kinds.append(kind)
+            self.step_list.append(step)
+            self.end += RECORD_HEADER.size + size
+        self.steps = np.array(self.step_list, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def record_index(self, step):
+        """
+        Returns the index of the record of a step."""
+        index = np.searchsorted(self.steps, step)
+        if index == len(self.steps) or self.steps[index] != step:
+            raise KeyError("Step {} is not recorded".format(step))
+        return int(index)
+
+    def read(self, index):
+        """
+        Returns the arrays of a record."""
+        offset = self.offsets[index]
+        size = RECORD_HEADER.unpack_from(self.data, offset - RECORD_HEADER.size)[2]
+        with np.load(io.BytesIO(self.data[offset : offset + size])) as arrays:
+            return dict(arrays)
+
+    def decode(self, index, previous=None):
+        """
+        Returns the RecordedState of a record, previous being the state of the record before (not needed
+        for a keyframe)."""
+        if self.kinds[index] == KEYFRAME:
+            return decode_keyframe(self.step_list[index], self.read(index))
+        return decode_delta(previous, self.step_list[index], self.read(index))
+
+    def iter_states(self, start=None, stop=None):
+        """
+        Yields the RecordedState of the steps from start (the first recorded step by default) to stop excluded
+        (up to the last recorded step by default), decoding from the keyframe before start."""
+        first = 0 if start is None else int(np.searchsorted(self.steps, start))
+        last = len(self) if stop is None else int(np.searchsorted(self.steps, stop))
+        if first >= last:
+            return
+        keyframe = first
+        while self.kinds[keyframe] != KEYFRAME:
+            keyframe -= 1
+        state = None
+        for index in range(keyframe, last):
+            state = self.decode(index, state)
+            if index >= first:
+                yield state
+
+    def state(self, step):
+        """
+        Returns the RecordedState of a step."""
+        self.record_index(step)
+        return next(self.iter_states(step, step + 1))
+
+    def region_counts(self, x0, x1, y0, y1, start=None, stop=None):
+        """
+        Returns the number of sheep, wolves and grown grass patches in the cells x0 <= x < x1, y0 <= y < y1
+        at each step from start to stop excluded, as {"Step", "Sheep", "Wolves", "Grown grass": array}."""
+        x, y = np.divmod(np.arange(self.width * self.height), self.height)
+        region = (x0 <= x) & (x < x1) & (y0 <= y) & (y < y1)
+        counts = {"Step": [], "Sheep": [], "Wolves": [], "Grown grass": []}
+        for state in self.iter_states(start, stop):
+            counts["Step"].append(state.step)
+            counts["Sheep"].append(np.count_nonzero(region[state.agents["Sheep"]["cell"]]))
+            counts["Wolves"].append(np.count_nonzero(region[state.agents["Wolf"]["cell"]]))
+            counts["Grown grass"].append(np.count_nonzero(region & (state.grass == 2)))
+        return {name: np.array(values, dtype=np.int64) for name, values in counts.items()}
+
+
+class ReplayModel:
+    """
+    Replays a recording in the visualization server, from the step start, without simulating the model nor
+    creating any agent : each step of the replay decodes the next steps_per_frame records. The recording is
+    refreshed when its end is reached, so that a run being recorded can be followed.
+    It has the attributes the visualization elements read (grid size, grass_field, get_breed_cells, schedule
+    step and datacollector).
+    """
+
+    description = "Replay of a recorded Wolf-Sheep run."
+
+    def __init__(self, path, start=0, steps_per_frame=1):
+        self.recording = Recording(path)
+        self.steps_per_frame = steps_per_frame
+        self.running = True
+        self.grid = SimpleNamespace(
+            width=self.recording.width, height=self.recording.height
+        )
+        self.schedule = SimpleNamespace(steps=0)
+        self.datacollector = SimpleNamespace(model_vars={})
+        self.states = self.recording.iter_states(start)
+        self.state = None
+        self.advance(1)
+
+    def advance(self, n):
+        """
+        Decodes the next n records (or less, at the end of the recording)."""
+        for i in range(n):
+            state = next(self.states, None)
+            if state is None:
+                # the run may still be recorded
+                self.recording.refresh()
+                if self.state is not None:
+                    self.states = self.recording.iter_states(self.state.step + 1)
+                state = next(self.states, None)
+            if state is None:
+                self.running = False
+                break
+            self.state = state
+        if self.state is None:
+            self.running = False
+            return
+        self.schedule.steps = self.state.step
+        self.datacollector.model_vars = {
+            "Sheep": [len(self.state.agents["Sheep"]["cell"])],
+            "Wolves": [len(self.state.agents["Wolf"]["cell"])],
+        }
+        shape = (self.grid.width, self.grid.height)
+        self.grass_field = SimpleNamespace(
+            present=(self.state.grass > 0).reshape(shape),
+            grown=(self.state.grass == 2).reshape(shape),
+        )
+
+    def get_breed_cells(self, breed_class):
+        """
+        Returns the cells of the agents of certain breed at the current step."""
+        return self.state.agents[breed_class.__name__]["cell"]
+
+    def step(self):
+        self.advance(self.steps_per_frame)
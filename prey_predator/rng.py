@@ -0,0 +1,70 @@
+"""
+Counter-based random draws, for the "counter" random mode of WolfSheep.
+
+In this mode, every random number of a run is a function of (seed, tick, agent id, purpose) : it is computed by
+the Philox4x32-10 counter-based generator (Salmon et al., "Parallel random numbers: as easy as 1, 2, 3", 2011),
+keyed by the seed, from a counter made of the id, the tick and the purpose of the draw. There is no sequence to
+consume : the draws of any set of agents can be computed at once with NumPy, in any order or on any worker, and
+the trajectory of a run does not depend on the order the agents are stored or iterated in.
+
+The activation order of a breed is the order of a draw per agent, so it only depends on the set of agents.
+"""
+
+import numpy as np
+
+# purposes of the draws
+SHUFFLE = 0
+MOVE = 1
+REPRODUCE = 2
+PLACE = 3
+GRASS = 4
+
+MASK = np.uint64(0xFFFFFFFF)
+MULTIPLIERS = (np.uint64(0xD2511F53), np.uint64(0xCD9E8D57))
+WEYL = (np.uint64(0x9E3779B9), np.uint64(0xBB67AE85))
+
+
+def philox4x32(counter, key, rounds=10):
+    """
+    The Philox4x32 block function : returns the 4 words (uint32 arrays) computed from the 4 words of the
+    counters (arrays of 32 bits integers, broadcast together) and the 2 words of the key."""
+    c0, c1, c2, c3 = (np.asarray(word, dtype=np.uint64) & MASK for word in counter)
+    k0, k1 = np.uint64(key[0]), np.uint64(key[1])
+    for r in range(rounds):
+        if r:
+            k0 = (k0 + WEYL[0]) & MASK
+            k1 = (k1 + WEYL[1]) & MASK
+        # 32 x 32 bits products fit in 64 bits : their high and low words
+        p0 = MULTIPLIERS[0] * c0
+        p1 = MULTIPLIERS[1] * c2
+        c0, c1, c2, c3 = (p1 >> np.uint64(32)) ^ c1 ^ k0, p1 & MASK, (p0 >> np.uint64(32)) ^ c3 ^ k1, p0 & MASK
+    return tuple(word.astype(np.uint32) for word in (c0, c1, c2, c3))
+
+
+class CounterRNG:
+    """
+    Draws keyed by the seed of a model : random(tick, ids, purpose) is the same whenever and wherever it is
+    computed.
+    """
+
+    def __init__(self, seed=None):
+        # two 32 bits words derived from the seed (from fresh entropy if seed is None)
+        self.key = np.random.SeedSequence(seed).generate_state(2).tolist()
+
+    def random(self, tick, ids, purpose):
+        """
+        Returns a uniform number in [0, 1) for each id (of an agent, or of a cell), drawn for the given tick
+        and purpose."""
+        ids = np.asarray(ids, dtype=np.int64).astype(np.uint64)
+        x0, x1, _, _ = philox4x32((ids, ids >> np.uint64(32), tick, purpose), self.key)
+        # 53 random bits, as for the doubles of NumPy's generators
+        high = (x0 >> np.uint32(5)).astype(np.float64)
+        low = (x1 >> np.uint32(6)).astype(np.float64)
+        return (high * 67108864.0 + low) / 9007199254740992.0
+
+    def order(self, tick, ids):
+        """
+        Returns the activation order of the agents ids at a tick : the permutation sorting them by their
+        SHUFFLE draw (ties broken by id)."""
+        ids = np.asarray(ids, dtype=np.int64)
+        return np.lexsort((ids, self.random(tick, ids, SHUFFLE)))
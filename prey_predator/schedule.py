@@ -1,5 +1,7 @@
+import itertools
 from collections import defaultdict
 
+import numpy as np
 from mesa.time import RandomActivation
 
 
@@ -18,6 +20,19 @@ class RandomActivationByBreed(RandomActivation):
         super().__init__(model)
         self.agents_by_breed = defaultdict(dict)
 
+    @property
+    def breeds(self):
+        """
+        The breeds of the schedule, in the order they are stepped."""
+        return list(self.agents_by_breed)
+
+    def add_breed(self, breed):
+        """
+        Registers a breed, so that it is stepped at this position in the order of the breeds
+        even if it has no agent yet.
+        """
+        self.agents_by_breed[breed]
+
     def add(self, agent):
         """
         Add an Agent object to the schedule
@@ -30,6 +45,15 @@ class RandomActivationByBreed(RandomActivation):
         agent_class = type(agent)
         self.agents_by_breed[agent_class][agent.unique_id] = agent
 
+    def add_agents(self, agents):
+        """
+        Adds many agents to the schedule at once, in their order (the same as adding them one by one)."""
+        self._agents.update((agent.unique_id, agent) for agent in agents)
+        for agent_class, breed_agents in itertools.groupby(agents, type):
+            self.agents_by_breed[agent_class].update(
+                (agent.unique_id, agent) for agent in breed_agents
+            )
+
     def remove(self, agent):
         """
         Remove all instances of a given agent from the schedule.
@@ -64,7 +88,20 @@ class RandomActivationByBreed(RandomActivation):
             breed: Class object of the breed to run.
         """
         agent_keys = list(self.agents_by_breed[breed].keys())
-        self.model.random.shuffle(agent_keys)
+        if self.model.counter_rng is None:
+            self.model.random.shuffle(agent_keys)
+            # the moves of the whole breed are drawn at once
+            self.model.draw_moves(len(agent_keys))
+        else:
+            # the order and the draws only depend on the ids of the agents and on the step
+            ids = np.array(agent_keys, dtype=np.int64)
+            agent_keys = ids[self.model.draw_for_agents(ids)].tolist()
+        if self.model.instrumentation is not None:
+            agents = self.agents_by_breed[breed]
+            self.model.instrumentation.step_agents(
+                breed, (agents[agent_key] for agent_key in agent_keys)
+            )
+            return
         for agent_key in agent_keys:
             self.agents_by_breed[breed][agent_key].step()
 
@@ -73,3 +110,219 @@ class RandomActivationByBreed(RandomActivation):
         Returns the current number of agents of certain breed in the queue.
         """
         return len(self.agents_by_breed[breed_class].values())
+
+    def get_breed_agents(self, breed_class):
+        """
+        Returns the list of the agents of certain breed, in the order of the schedule.
+        """
+        return list(self.agents_by_breed[breed_class].values())
+
+
+class BreedSlots:
+    """
+    The agents of one breed, stored in a dense list along with the index of each agent in the list.
+    Agents are removed by moving the last agent of the list into their slot.
+    """
+
+    def __init__(self):
+        self.agents = []
+        # unique_id -> index in agents
+        self.slots = {}
+        # slots of the agents removed while the breed is being stepped, emptied afterwards
+        self.holes = []
+        # permutation buffer of the shuffles, and the identity it is reset from
+        self.order = np.zeros(0, dtype=np.int64)
+        self.identity = np.zeros(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.slots)
+
+    def add(self, agent):
+        self.slots[agent.unique_id] = len(self.agents)
+        self.agents.append(agent)
+
+    def extend(self, agents):
+        first = len(self.agents)
+        self.slots.update(
+            (agent.unique_id, slot) for slot, agent in enumerate(agents, first)
+        )
+        self.agents.extend(agents)
+
+    def remove(self, agent, stepping):
+        """
+        Removes an agent. While the breed is being stepped, its slot is only emptied (set to None),
+        so that the other agents keep their slot until compact is called."""
+        slot = self.slots.pop(agent.unique_id)
+        if stepping:
+            self.agents[slot] = None
+            self.holes.append(slot)
+            return
+        last = self.agents.pop()
+        if slot < len(self.agents):
+            self.agents[slot] = last
+            self.slots[last.unique_id] = slot
+
+    def compact(self):
+        """
+        Fills the slots emptied while stepping with the last agents of the list."""
+        agents = self.agents
+        # from the end, so that the last agent of the list is never an emptied slot
+        for slot in sorted(self.holes, reverse=True):
+            last = agents.pop()
+            if slot < len(agents):
+                agents[slot] = last
+                self.slots[last.unique_id] = slot
+        self.holes.clear()
+
+    def shuffled_order(self, rng):
+        """
+        Returns a random permutation of the slots, shuffled in place in a buffer which is only reallocated
+        when the breed outgrows it."""
+        n = len(self.agents)
+        if len(self.order) < n:
+            self.identity = np.arange(2 * n, dtype=np.int64)
+            self.order = self.identity.copy()
+        order = self.order[:n]
+        order[:] = self.identity[:n]
+        rng.shuffle(order)
+        return order
+
+
+class ArrayActivationByBreed(RandomActivation):
+    """
+    A scheduler with the behaviour of RandomActivationByBreed, storing each breed in a dense list
+    (see BreedSlots) instead of a dict : removing an agent is a swap with the last agent of its breed,
+    and the step order is shuffled in place in a preallocated permutation buffer with the model's
+    NumPy generator. An agent removed during the step of its own breed is skipped if its turn has not
+    come yet, and agents added during a step are only stepped from the next one.
+    """
+
+    def __init__(self, model):
+        super().__init__(model)
+        self.breed_slots = {}
+        self._stepping = None
+
+    @property
+    def agents(self):
+        return [agent for breed in self.breed_slots for agent in self.get_breed_agents(breed)]
+
+    @property
+    def agents_by_breed(self):
+        """
+        The agents of each breed, as {breed: {unique_id: agent}} (built on each access, for compatibility)."""
+        return {
+            breed: {agent.unique_id: agent for agent in self.get_breed_agents(breed)}
+            for breed in self.breed_slots
+        }
+
+    @property
+    def breeds(self):
+        """
+        The breeds of the schedule, in the order they are stepped."""
+        return list(self.breed_slots)
+
+    def get_agent_count(self):
+        return sum(len(slots) for slots in self.breed_slots.values())
+
+    def add_breed(self, breed):
+        """
+        Registers a breed, so that it is stepped at this position in the order of the breeds
+        even if it has no agent yet.
+        """
+        if breed not in self.breed_slots:
+            self.breed_slots[breed] = BreedSlots()
+
+    def add(self, agent):
+        """
+        Add an Agent object to the schedule
+
+        Args:
+            agent: An Agent to be added to the schedule.
+        """
+        self.add_breed(type(agent))
+        self.breed_slots[type(agent)].add(agent)
+
+    def add_agents(self, agents):
+        """
+        Adds many agents to the schedule at once, in their order (the same as adding them one by one)."""
+        for agent_class, breed_agents in itertools.groupby(agents, type):
+            self.add_breed(agent_class)
+            self.breed_slots[agent_class].extend(list(breed_agents))
+
+    def remove(self, agent):
+        """
+        Remove all instances of a given agent from the schedule.
+        """
+        slots = self.breed_slots[type(agent)]
+        slots.remove(agent, slots is self._stepping)
+
+    def step(self, by_breed=True):
+        """
+        Executes the step of each agent breed, one at a time, in random order.
+
+        Args:
+            by_breed: If True, run all agents of a single breed before running
+                      the next one.
+        """
+        if by_breed:
+            for agent_class in list(self.breed_slots):
+                self.step_breed(agent_class)
+        else:
+            agents = self.agents
+            self.model.np_random.shuffle(agents)
+            for agent in agents:
+                if agent.unique_id in self.breed_slots[type(agent)].slots:
+                    agent.step()
+        self.steps += 1
+        self.time += 1
+
+    def step_breed(self, breed):
+        """
+        Shuffle order and run all agents of a given breed.
+
+        Args:
+            breed: Class object of the breed to run.
+        """
+        slots = self.breed_slots[breed]
+        agents = slots.agents
+        if self.model.counter_rng is None:
+            order = slots.shuffled_order(self.model.np_random)
+            # the moves of the whole breed are drawn at once
+            self.model.draw_moves(len(order))
+        else:
+            # the order and the draws only depend on the ids of the agents and on the step
+            order = self.model.draw_for_agents(
+                np.fromiter((agent.unique_id for agent in agents), np.int64, len(agents))
+            )
+        self._stepping = slots
+        try:
+            if self.model.instrumentation is not None:
+                self.model.instrumentation.step_agents(
+                    breed,
+                    (agents[slot] for slot in order.tolist() if agents[slot] is not None),
+                )
+                return
+            for slot in order.tolist():
+                agent = agents[slot]
+                # the agent may have been removed since the start of the step
+                if agent is not None:
+                    agent.step()
+        finally:
+            self._stepping = None
+            slots.compact()
+
+    def get_breed_count(self, breed_class):
+        """
+        Returns the current number of agents of certain breed in the queue.
+        """
+        slots = self.breed_slots.get(breed_class)
+        return 0 if slots is None else len(slots)
+
+    def get_breed_agents(self, breed_class):
+        """
+        Returns the list of the agents of certain breed, in the order of the schedule.
+        """
+        slots = self.breed_slots.get(breed_class)
+        if slots is None:
+            return []
+        return [agent for agent in slots.agents if agent is not None]
@@ -1,9 +1,16 @@
 from mesa.visualization.ModularVisualization import ModularServer
-from mesa.visualization.modules import CanvasGrid, ChartModule
+from mesa.visualization.modules import CanvasGrid
 from mesa.visualization.UserParam import UserSettableParameter
 
 from prey_predator.agents import Wolf, Sheep, GrassPatch
-from prey_predator.model import WolfSheep
+from prey_predator.params import PARAMETERS
+from prey_predator.recording import Recording, ReplayModel
+from prey_predator.session_server import SessionServer
+from prey_predator.visualization import (
+    DeltaCanvasGrid,
+    DownsampledChartModule,
+    FrameSkippingWolfSheep,
+)
 
 
 def wolf_sheep_portrayal(agent):
@@ -43,83 +50,101 @@ def wolf_sheep_portrayal(agent):
     return portrayal
 
 
-## CanvasGrid(portrayal, nb_cells_width, nb_cells_height, canvas_width, canvas_height)
-# the grid on which the agents are
-canvas_element = CanvasGrid(wolf_sheep_portrayal, 20, 20, 500, 500)
-# the plot of the populations wrt time
-chart_element = ChartModule(
+class GrassCanvasGrid(CanvasGrid):
+    """
+    A CanvasGrid which also draws the grass field.
+    The grass patches are not agents of the grid anymore, so their GrassPatch views are portrayed
+    first, and the animals are drawn above them."""
+
+    def render(self, model):
+        grid_state = super().render(model)
+        grass_state = []
+        for patch in model.grass_field.patches():
+            portrayal = self.portrayal_method(patch)
+            portrayal["x"], portrayal["y"] = patch.pos
+            grass_state.append(portrayal)
+        grid_state[0] = grass_state + grid_state[0]
+        return grid_state
+
+
+## DeltaCanvasGrid(canvas_width, canvas_height)
+# the grid on which the agents are, whatever its size : only the cells which changed are sent to the browser,
+# and grids of more than max_cells cells are drawn as a heatmap
+canvas_element = DeltaCanvasGrid(500, 500, max_cells=10_000)
+# the plot of the populations wrt time, downsampled for long runs
+chart_element = DownsampledChartModule(
     [{"Label": "Wolves", "Color": "#000000"}, {
-        "Label": "Sheep", "Color": "#c7c5c5"}]
+        "Label": "Sheep", "Color": "#c7c5c5"}],
+    max_points=500,
 )
 
 # Below are all the parameters the user can adjust when running the server.
-# The values for each parameters are the ones used to compute our graph in our model restitution
-model_params = {
-    "height": 20,
-    "width": 20,
-    "sheep_energy": UserSettableParameter("number", "Energy of a Sheep", value=10),
-    "wolf_energy": UserSettableParameter("number", "Energy of a Wolf", value=10),
-    "initial_sheep": UserSettableParameter(
-        "number", "Initial Number of Sheeps", value=150
-    ),
-    "initial_wolves": UserSettableParameter(
-        "number", "Initial Number of Wolves", value=100
-    ),
-    "sheep_reproduce": UserSettableParameter(
-        "slider",
-        "Sheep Reproducing Probability",
-        value=0.15,
-        min_value=0,
-        max_value=0.5,
-        step=0.01,
-    ),
-    "wolf_reproduce": UserSettableParameter(
-        "slider",
-        "Wolves Reproducing Probability",
-        value=0.11,
-        min_value=0,
-        max_value=0.5,
-        step=0.01,
-    ),
-    "sheep_gain_from_food": UserSettableParameter(
-        "number", "Sheep Energy points with Food", value=5
-    ),
-    "wolf_gain_from_food": UserSettableParameter(
-        "number", "Wolves Energy points with Food", value=20
-    ),
-    "sheep_move_energy": UserSettableParameter(
-        "number", "Sheep energy loss with movement", value=1
-    ),
-    "wolf_move_energy": UserSettableParameter(
-        "number", "Wolves energy loss with movement", value=1
-    ),
-    "sheep_reproduction_energy": UserSettableParameter(
-        "number", "Sheep energy loss with reproduction", value=2
-    ),
-    "wolf_reproduction_energy": UserSettableParameter(
-        "number", "Wolves energy loss with reproduction", value=3
-    ),
-    "grass": UserSettableParameter("checkbox", "Are Sheeps eating Grass", value=True),
-    "grass_regrowth_time": UserSettableParameter(
-        "number", "Grass Regrowth Time", value=15
-    ),
-    "sheep_life_expectancy": UserSettableParameter(
-        "number", "Sheep life expectancy", value=45
-    ),
-    "wolf_life_expectancy": UserSettableParameter(
-        "number", "Wolf life expectancy", value=100
-    ),
-    "sheep_min_digestion": UserSettableParameter(
-        "number", "Sheep digestion time", value=3
-    ),
-    "wolf_min_digestion": UserSettableParameter(
-        "number", "Wolf digestion time", value=10
-    ),
-}
+# They are built from the shared parameter specification of params.py.
+def user_parameter(parameter):
+    """
+    Returns the server's version of a parameter of the specification :
+    a UserSettableParameter, or its value for fixed parameters."""
+    if parameter.kind == "fixed":
+        return parameter.value
+    if parameter.kind == "slider":
+        return UserSettableParameter(
+            "slider",
+            parameter.description,
+            value=parameter.value,
+            min_value=parameter.min_value,
+            max_value=parameter.max_value,
+            step=parameter.step,
+        )
+    return UserSettableParameter(
+        parameter.kind, parameter.description, value=parameter.value
+    )
+
+
+model_params = {parameter.name: user_parameter(parameter) for parameter in PARAMETERS}
+# the model can run several steps per rendered frame
+model_params["steps_per_frame"] = UserSettableParameter(
+    "slider", "Steps per frame", value=1, min_value=1, max_value=100, step=1
+)
 
 
 server = ModularServer(
-    WolfSheep, [canvas_element,
+    FrameSkippingWolfSheep, [canvas_element,
                 chart_element], "Prey Predator Model", model_params
 )
 server.port = 8521
+
+# the same page, with the model of each session stepped by its own worker process
+session_server = SessionServer(
+    FrameSkippingWolfSheep,
+    [canvas_element, chart_element],
+    "Prey Predator Model",
+    model_params,
+    max_sessions=4,
+)
+session_server.port = 8521
+
+
+def replay_server(path):
+    """
+    Returns a server replaying the recording path (see prey_predator.recording) : the "Start step" slider
+    seeks to any recorded step."""
+    steps = Recording(path).steps
+    replay_params = {
+        "path": path,
+        "start": UserSettableParameter(
+            "slider",
+            "Start step",
+            value=int(steps[0]),
+            min_value=int(steps[0]),
+            max_value=int(steps[-1]),
+            step=1,
+        ),
+        "steps_per_frame": UserSettableParameter(
+            "slider", "Steps per frame", value=1, min_value=1, max_value=100, step=1
+        ),
+    }
+    replay = ModularServer(
+        ReplayModel, [canvas_element, chart_element], "Prey Predator Replay", replay_params
+    )
+    replay.port = 8521
+    return replay
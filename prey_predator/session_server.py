@@ -0,0 +1,247 @@
+"""
+A server mode where the model of each browser session steps in its own worker process.
+
+With ModularServer, the model steps in the Tornado process, between two messages : a slow step freezes every page,
+and all the sessions share one model and one core. SessionServer gives each websocket session its own model, built
+from the session's parameters and stepped at full speed by a worker process :
+
+- after each step, the worker renders a frame and puts it in a bounded queue, unless the queue is full : the
+  states the browser is too slow to draw are never rendered, and a frame always follows the previous queued
+  frame (so the deltas of DeltaCanvasGrid stay valid),
+- the websocket handler answers each "get_step" of the browser with the next frame of the queue, waiting for it
+  without blocking the Tornado loop,
+- a worker pauses once its browser has not asked for a frame for idle_timeout seconds (the run was stopped),
+- at most max_sessions sessions run at once : the socket of the next ones is closed.
+
+The client is the usual Mesa page : the browser then draws the model as fast as it can, while the model runs at
+its own pace.
+"""
+
+import copy
+import multiprocessing
+import queue
+import time
+
+import tornado.escape
+import tornado.ioloop
+from mesa.visualization.ModularVisualization import ModularServer, SocketHandler
+from mesa.visualization.UserParam import UserSettableParameter
+
+
+def model_arguments(model_kwargs):
+    """
+    Returns the arguments of the model from the parameters of a server (values of the user settable
+    parameters)."""
+    arguments = {}
+    for key, value in model_kwargs.items():
+        if isinstance(value, UserSettableParameter):
+            if value.param_type == "static_text":
+                continue
+            arguments[key] = value.value
+        else:
+            arguments[key] = value
+    return arguments
+
+
+def session_worker(model_cls, arguments, elements, frames, stop, last_request, idle_timeout):
+    """
+    The loop of a worker process : builds the model and queues the frame of its initial state, then steps it
+    while the browser asks for frames, until the model stops (None is queued) or stop is set."""
+    # the frames left in the queue may be lost once the session is closed
+    frames.cancel_join_thread()
+    model = model_cls(**arguments)
+    frames.put([element.render(model) for element in elements])
+    while not stop.is_set():
+        if time.time() - last_request.value > idle_timeout:
+            stop.wait(0.05)
+            continue
+        if not model.running:
+            while not stop.is_set():
+                try:
+                    frames.put(None, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+            break
+        model.step()
+        if not frames.full():
+            frames.put([element.render(model) for element in elements])
+
+
+class Session:
+    """
+    The model of a websocket session, run by a worker process. The session keeps its own copy of the parameters
+    and of the visualization elements (which keep the state of the previous frame).
+    """
+
+    def __init__(self, application):
+        self.application = application
+        self.model_kwargs = copy.deepcopy(application.model_kwargs)
+        self.worker = None
+
+    def start(self):
+        """
+        Starts a worker process on a new model built from the current parameters (stopping the previous one),
+        and returns the frame of its initial state."""
+        self.stop()
+        application = self.application
+        self.frames = multiprocessing.Queue(application.frame_queue_size)
+        self.stop_event = multiprocessing.Event()
+        self.last_request = multiprocessing.Value("d", 0.0)
+        self.worker = multiprocessing.Process(
+            target=session_worker,
+            args=(
+                application.model_cls,
+                model_arguments(self.model_kwargs),
+                copy.deepcopy(application.visualization_elements),
+                self.frames,
+                self.stop_event,
+                self.last_request,
+                application.idle_timeout,
+            ),
+            daemon=True,
+        )
+        self.worker.start()
+        return self.next_frame(request=False)
+
+    def next_frame(self, request=True):
+        """
+        Waits for the next frame of the worker, and returns it, or None once the model has stopped.
+        When request is True, the worker is also told the browser still wants frames."""
+        # the session may be stopped (closed or reset) meanwhile
+        worker, frames, last_request = self.worker, self.frames, self.last_request
+        if worker is None:
+            return None
+        while True:
+            if request:
+                last_request.value = time.time()
+            try:
+                return frames.get(timeout=0.1)
+            except queue.Empty:
+                if not worker.is_alive():
+                    return None
+
+    def stop(self):
+        """
+        Stops the worker process, if any."""
+        if self.worker is None:
+            return
+        self.stop_event.set()
+        self.worker.join(timeout=1)
+        if self.worker.is_alive():
+            self.worker.terminate()
+            self.worker.join()
+        self.worker = None
+
+
+class SessionSocketHandler(SocketHandler):
+    """
+    The websocket handler of a SessionServer : each socket is a session, with its own model.
+    """
+
+    def open(self):
+        self.session = None
+        if not self.application.open_session(self):
+            self.close(1013, "Too many sessions, try again later")
+            return
+        super().open()
+
+    def on_close(self):
+        if self.session is not None:
+            self.application.close_session(self)
+
+    def send_frame(self, frame):
+        if self.ws_connection is None:
+            return
+        if frame is None:
+            self.write_message({"type": "end"})
+        else:
+            self.write_message({"type": "viz_state", "data": frame})
+
+    async def on_message(self, message):
+        if self.session is None:
+            return
+        if self.application.verbose:
+            print(message)
+        msg = tornado.escape.json_decode(message)
+        loop = tornado.ioloop.IOLoop.current()
+
+        if msg["type"] == "get_step":
+            if self.session.worker is None:
+                # the initial frame is not sent : a step answers with one frame, the one after the step
+                await loop.run_in_executor(None, self.session.start)
+            self.send_frame(await loop.run_in_executor(None, self.session.next_frame))
+
+        elif msg["type"] == "reset":
+            self.send_frame(await loop.run_in_executor(None, self.session.start))
+
+        elif msg["type"] == "submit_params":
+            param = msg["param"]
+            value = msg["value"]
+            model_kwargs = self.session.model_kwargs
+            if param in self.application.user_params:
+                if isinstance(model_kwargs[param], UserSettableParameter):
+                    model_kwargs[param].value = value
+                else:
+                    model_kwargs[param] = value
+
+        else:
+            if self.application.verbose:
+                print("Unexpected message!")
+
+
+class SessionServer(ModularServer):
+    """
+    A ModularServer running the model of each session in a worker process.
+
+    Args:
+        model_cls, visualization_elements, name, model_params: as for ModularServer.
+        max_sessions: the maximum number of sessions running at once.
+        frame_queue_size: the number of frames a worker renders ahead of its browser.
+        idle_timeout: the number of seconds after which a worker pauses if its browser asks for no frame.
+    """
+
+    socket_handler = (r"/ws", SessionSocketHandler)
+    handlers = [
+        ModularServer.page_handler,
+        socket_handler,
+        ModularServer.static_handler,
+        ModularServer.local_handler,
+    ]
+
+    def __init__(
+        self,
+        model_cls,
+        visualization_elements,
+        name="Mesa Model",
+        model_params={},
+        max_sessions=4,
+        frame_queue_size=2,
+        idle_timeout=2.0,
+    ):
+        self.max_sessions = max_sessions
+        self.frame_queue_size = frame_queue_size
+        self.idle_timeout = idle_timeout
+        self.sessions = set()
+        super().__init__(model_cls, visualization_elements, name, model_params)
+
+    def reset_model(self):
+        """
+        The models live in the workers of the sessions : the server has none."""
+        self.model = None
+
+    def open_session(self, handler):
+        """
+        Gives a new session to a websocket handler, and returns True, or returns False if there are already
+        max_sessions sessions."""
+        if len(self.sessions) >= self.max_sessions:
+            return False
+        handler.session = Session(self)
+        self.sessions.add(handler)
+        return True
+
+    def close_session(self, handler):
+        """
+        Stops the session of a websocket handler."""
+        self.sessions.discard(handler)
+        tornado.ioloop.IOLoop.current().run_in_executor(None, handler.session.stop)
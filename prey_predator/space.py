@@ -0,0 +1,120 @@
+"""
+Grid of the model, with a per-cell index of the agents of each breed.
+"""
+
+import itertools
+from collections import defaultdict
+from functools import lru_cache
+
+import numpy as np
+from mesa.space import MultiGrid
+
+
+def neighbourhood_offsets(moore, include_center):
+    """
+    Returns the (dx, dy) offsets of the cells of a radius 1 neighbourhood."""
+    return [
+        (dx, dy)
+        for dx in (-1, 0, 1)
+        for dy in (-1, 0, 1)
+        if (moore or abs(dx) + abs(dy) <= 1) and (include_center or (dx, dy) != (0, 0))
+    ]
+
+
+@lru_cache(maxsize=None)
+def torus_neighbourhood_table(width, height, moore, include_center):
+    """
+    Returns the radius 1 neighbourhood of every cell of a width x height torus, as a read-only array of shape
+    (width * height, neighbourhood size). Cells are flat indices x * height + y : row c holds the cells
+    neighbouring the cell c.
+    The table is computed once per grid shape and neighbourhood type. The grid is expected to be at least
+    3x3, so that no cell appears twice in a neighbourhood.
+    """
+    dx, dy = np.array(neighbourhood_offsets(moore, include_center)).T
+    x, y = np.divmod(np.arange(width * height), height)
+    table = ((x[:, None] + dx) % width) * height + (y[:, None] + dy) % height
+    table.flags.writeable = False
+    return table
+
+
+class BreedMultiGrid(MultiGrid):
+    """
+    A MultiGrid which also maintains, for each breed, the agents of that breed in each cell.
+
+    The index is updated whenever an agent is placed, moved or removed, so that it always agrees with the
+    grid : random_move, dies and the reproduce methods keep it up to date through the usual grid methods.
+    Within a cell, agents are kept in the order they arrived in, as in the cell's list.
+    """
+
+    def __init__(self, width, height, torus):
+        super().__init__(width, height, torus)
+        # breed -> {pos: {agent: None}}, only holding the non-empty cells
+        self.occupancy = defaultdict(dict)
+        self._moves_tables = {}
+
+    def _place_agent(self, pos, agent):
+        super()._place_agent(pos, agent)
+        cells = self.occupancy[type(agent)]
+        cell = cells.get(pos)
+        if cell is None:
+            cell = cells[pos] = {}
+        cell[agent] = None
+
+    def place_agents(self, agents):
+        """
+        Places many new agents at once, each in the cell of its pos (the same as placing them one by one
+        with place_agent, for agents which are not in the grid yet)."""
+        grid = self.grid
+        for breed, breed_agents in itertools.groupby(agents, type):
+            cells = self.occupancy[breed]
+            for agent in breed_agents:
+                pos = agent.pos
+                grid[pos[0]][pos[1]].append(agent)
+                cell = cells.get(pos)
+                if cell is None:
+                    cell = cells[pos] = {}
+                cell[agent] = None
+        self.empties.difference_update(agent.pos for agent in agents)
+
+    def _remove_agent(self, pos, agent):
+        super()._remove_agent(pos, agent)
+        cells = self.occupancy[type(agent)]
+        cell = cells[pos]
+        del cell[agent]
+        if not cell:
+            del cells[pos]
+
+    def moves_table(self, moore):
+        """
+        Returns the cells an agent can move to (staying in place included) from every cell, as a flat
+        memoryview over the torus neighbourhood table, along with the neighbourhood size k : the moves from
+        the cell (x, y) are the flat cells moves[(x * height + y) * k:(x * height + y + 1) * k].
+        Indexing a memoryview gives back plain ints, without going through NumPy scalars."""
+        table = self._moves_tables.get(moore)
+        if table is None:
+            neighbourhood = torus_neighbourhood_table(
+                self.width, self.height, moore, True
+            )
+            table = self._moves_tables[moore] = (
+                memoryview(neighbourhood.reshape(-1)),
+                neighbourhood.shape[1],
+            )
+        return table
+
+    def has_breed(self, pos, breed):
+        """
+        Returns True if there is an agent of the given breed in the cell pos."""
+        return pos in self.occupancy[breed]
+
+    def first_of_breed(self, pos, breed):
+        """
+        Returns the first arrived agent of the given breed in the cell pos, or None if there is none."""
+        cell = self.occupancy[breed].get(pos)
+        if cell is None:
+            return None
+        return next(iter(cell))
+
+    def count_breed(self, pos, breed):
+        """
+        Returns the number of agents of the given breed in the cell pos."""
+        return len(self.occupancy[breed].get(pos, ()))
@@ -0,0 +1,180 @@
+"""
+Stop conditions of WolfSheep.run_until.
+
+A stop condition is a callable taking the Snapshot of each step, which returns the reason to stop (a string),
+or None to go on. The conditions below keep the state they need (a sliding window of the last snapshots), so a
+fresh condition is needed for every run.
+
+The conditions also give their parameters (parameters method) : condition_key identifies a condition by its class
+and these parameters, in the result cache and in the keys of the runs of a sweep.
+"""
+
+from collections import deque, namedtuple
+
+import numpy as np
+
+from prey_predator.agents import Sheep, Wolf
+
+Snapshot = namedtuple("Snapshot", ["step", "sheep", "wolves", "grown_grass"])
+Snapshot.__doc__ = """
+The state of a model after a step : the step number, the number of sheep and wolves,
+and the number of grown grass patches."""
+
+
+def population(snapshot, breed=None):
+    """
+    Returns the number of agents of a breed in a snapshot, or of both breeds if breed is None."""
+    if breed is Sheep:
+        return snapshot.sheep
+    if breed is Wolf:
+        return snapshot.wolves
+    return snapshot.sheep + snapshot.wolves
+
+
+def breed_name(breed):
+    return None if breed is None else breed.__name__
+
+
+def condition_key(condition):
+    """
+    Returns the key of a stop condition : its class and its parameters, as JSON values. Returns None for a
+    condition without a parameters method, which cannot be identified."""
+    parameters = getattr(condition, "parameters", None)
+    if parameters is None:
+        return None
+    condition_class = type(condition)
+    return {
+        "condition": condition_class.__module__ + "." + condition_class.__qualname__,
+        **parameters(),
+    }
+
+
+class Extinction:
+    """
+    Stops once a breed (or both breeds, if breed is None) has no agent left.
+    """
+
+    def __init__(self, breed=None):
+        self.breed = breed
+
+    def __repr__(self):
+        return "Extinction({})".format(self.breed.__name__ if self.breed else "")
+
+    def parameters(self):
+        return {"breed": breed_name(self.breed)}
+
+    def __call__(self, snapshot):
+        if population(snapshot, self.breed) == 0:
+            if self.breed is None:
+                return "extinction"
+            return "extinction of {}".format(self.breed.__name__)
+        return None
+
+
+class PopulationCap:
+    """
+    Stops once the population of a breed (or of both breeds, if breed is None) is above cap.
+    """
+
+    def __init__(self, cap, breed=None):
+        self.cap = cap
+        self.breed = breed
+
+    def __repr__(self):
+        if self.breed is None:
+            return "PopulationCap({})".format(self.cap)
+        return "PopulationCap({}, {})".format(self.cap, self.breed.__name__)
+
+    def parameters(self):
+        return {"cap": float(self.cap), "breed": breed_name(self.breed)}
+
+    def __call__(self, snapshot):
+        if population(snapshot, self.breed) > self.cap:
+            return "population above {}".format(self.cap)
+        return None
+
+
+class SteadyState:
+    """
+    Stops once the number of sheep and the number of wolves have both stayed within tolerance (relative to their
+    mean) over the last window steps, without going extinct : a breed which died out is not in a steady state
+    (see Extinction).
+    """
+
+    def __init__(self, window=50, tolerance=0.05):
+        self.window = window
+        self.tolerance = tolerance
+        self.history = deque(maxlen=window)
+
+    def __repr__(self):
+        return "SteadyState({}, {})".format(self.window, self.tolerance)
+
+    def parameters(self):
+        return {"window": int(self.window), "tolerance": float(self.tolerance)}
+
+    def __call__(self, snapshot):
+        self.history.append((snapshot.sheep, snapshot.wolves))
+        if len(self.history) < self.window:
+            return None
+        counts = np.array(self.history)
+        if not counts.min() > 0:
+            return None
+        spread = counts.max(axis=0) - counts.min(axis=0)
+        if (spread <= self.tolerance * counts.mean(axis=0)).all():
+            return "steady state"
+        return None
+
+
+class PeriodicState:
+    """
+    Stops once the number of sheep oscillates with a stable period over the last window steps : past the first
+    lag at which the autocorrelation of the window is negative (and past min_period), its autocorrelation at
+    some lag up to window / 2 is at least min_correlation.
+    """
+
+    def __init__(self, window=200, min_correlation=0.9, min_period=4):
+        self.window = window
+        self.min_correlation = min_correlation
+        self.min_period = min_period
+        self.history = deque(maxlen=window)
+
+    def __repr__(self):
+        return "PeriodicState({}, {}, {})".format(
+            self.window, self.min_correlation, self.min_period
+        )
+
+    def parameters(self):
+        return {
+            "window": int(self.window),
+            "min_correlation": float(self.min_correlation),
+            "min_period": int(self.min_period),
+        }
+
+    def __call__(self, snapshot):
+        self.history.append(snapshot.sheep)
+        if len(self.history) < self.window:
+            return None
+        counts = np.array(self.history, dtype=np.float64)
+        counts -= counts.mean()
+        variance = counts @ counts
+        if variance == 0:
+            # constant : a steady state, not a periodic one
+            return None
+        lags = np.arange(1, self.window // 2 + 1)
+        # autocorrelation at each lag, corrected for the number of terms
+        correlation = np.array(
+            [
+                counts[lag:] @ counts[:-lag] / variance * self.window / (self.window - lag)
+                for lag in lags
+            ]
+        )
+        # a smooth series is correlated at short lags : the period is looked for once the
+        # autocorrelation has become negative
+        negative = np.flatnonzero(correlation < 0)
+        if len(negative) == 0:
+            return None
+        candidates = lags >= max(lags[negative[0]], self.min_period)
+        if candidates.any() and correlation[candidates].max() >= self.min_correlation:
+            period = lags[candidates][correlation[candidates].argmax()]
+            return "periodic state (period {})".format(period)
+        return None
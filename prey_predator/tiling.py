@@ -0,0 +1,337 @@
+"""
+Spatial tiling of the Wolf-Sheep model over worker processes.
+
+The torus is cut into rectangular tiles, each one simulated by its own worker process with the array engine :
+a tile owns the sheep, the wolves and the grass of its cells. Each step, the coordinator (TiledWolfSheep) runs
+the phases of the array engine on every tile at once :
+
+- the sheep move, and the sheep which left their tile migrate to the tile they arrived in,
+- the sheep eat, reproduce, age and die, then the wolves move and migrate,
+- the wolves eat, reproduce, age and die, and the grass grows.
+
+Sheep and wolves only interact with the grass and the other agents of their own cell, once they have moved :
+as the agents are migrated right after moving, every interaction is local to a tile, and there are no border
+cells to exchange besides the migrating agents.
+The statistics of the tiles are summed into the coordinator's collector.
+
+Each tile has its own random generator, spawned from the seed, so that a run is reproducible for a given seed and
+tile layout (but differs from a run with another layout, or from a WolfSheep run).
+"""
+
+import multiprocessing
+
+import numpy as np
+from mesa.time import BaseScheduler
+
+from prey_predator.agents import Sheep, Wolf
+from prey_predator.array_engine import ArrayEngine, BreedArrays
+from prey_predator.datacollection import ColumnarDataCollector, breed_summary
+from prey_predator.grass import GrassField
+from prey_predator.model import WolfSheep
+from prey_predator.params import PARAMETER_NAMES, default_parameters
+from prey_predator.space import neighbourhood_offsets
+
+
+class TileLayout:
+    """
+    The cut of a width x height torus into tiles_x x tiles_y tiles of (almost) equal sizes.
+    Tile (i, j) gets the index i * tiles_y + j.
+    """
+
+    def __init__(self, width, height, tiles_x, tiles_y):
+        if not (1 <= tiles_x <= width and 1 <= tiles_y <= height):
+            raise ValueError(
+                "Cannot cut a {}x{} grid into {}x{} tiles".format(
+                    width, height, tiles_x, tiles_y
+                )
+            )
+        self.width = width
+        self.height = height
+        self.tiles_x = tiles_x
+        self.tiles_y = tiles_y
+        self.x_edges = np.linspace(0, width, tiles_x + 1).astype(np.int64)
+        self.y_edges = np.linspace(0, height, tiles_y + 1).astype(np.int64)
+        # tile column of every x, and tile row of every y
+        self.tile_of_x = np.repeat(np.arange(tiles_x), np.diff(self.x_edges))
+        self.tile_of_y = np.repeat(np.arange(tiles_y), np.diff(self.y_edges))
+
+    def __len__(self):
+        return self.tiles_x * self.tiles_y
+
+    def bounds(self, index):
+        """
+        Returns the x0, x1, y0, y1 bounds of a tile (x0 <= x < x1, y0 <= y < y1)."""
+        i, j = divmod(index, self.tiles_y)
+        return self.x_edges[i], self.x_edges[i + 1], self.y_edges[j], self.y_edges[j + 1]
+
+    def tile_of(self, x, y):
+        """
+        Returns the indices of the tiles of the cells (x, y)."""
+        return self.tile_of_x[x] * self.tiles_y + self.tile_of_y[y]
+
+
+class TileModel:
+    """
+    The part of a WolfSheep model a tile needs : the parameters, a random generator, the id counter and the grass
+    of the tile.
+    """
+
+    get_breed_values = WolfSheep.get_breed_values
+    get_life_expectancy = WolfSheep.get_life_expectancy
+    # tiles draw from their own generator
+    counter_rng = None
+
+    def __init__(self, parameters, layout, index, seed_sequence, moore=True):
+        for name, value in parameters.items():
+            setattr(self, name, value)
+        self.np_random = np.random.default_rng(seed_sequence)
+        # ids of the agents born in different tiles never collide
+        self.current_id = index << 40
+        x0, x1, y0, y1 = layout.bounds(index)
+        self.grass_field = GrassField(self, x1 - x0, y1 - y0, self.grass_regrowth_time)
+        if self.grass:
+            # grass patches are created with a probability of 0.5 in each cell, as in WolfSheep
+            field = self.grass_field
+            field.present[...] = self.np_random.random(field.present.shape) < 0.5
+            field.grown[...] = field.present
+            field.recount()
+            field.countdown = self.grass_regrowth_time
+        self.array_engine = TileEngine(self, layout, index, moore)
+
+    def timed(self, owner, phase, function, *args):
+        return function(*args)
+
+
+class TileEngine(ArrayEngine):
+    """
+    The array engine of one tile. Cells are flat indices in the tile (x * height + y, x and y relative to the
+    corner of the tile), and global flat indices of the whole grid for the migrating agents.
+    """
+
+    def __init__(self, model, layout, index, moore=True):
+        self.model = model
+        self.layout = layout
+        self.index = index
+        self.x0, x1, self.y0, y1 = layout.bounds(index)
+        self.width = x1 - self.x0
+        self.height = y1 - self.y0
+        self.offsets = np.array(neighbourhood_offsets(moore, True))
+        self.sheep = BreedArrays()
+        self.wolves = BreedArrays()
+        self.sheep_arrival = np.zeros(0)
+
+    def to_local(self, cells):
+        """
+        Converts global cells of the tile to cells of the tile."""
+        x, y = np.divmod(cells, self.layout.height)
+        return (x - self.x0) * self.height + y - self.y0
+
+    def add_agents(self, breed, cells, energy):
+        """
+        Adds agents of the given breed in the given global cells."""
+        super().add_agents(breed, self.to_local(np.asarray(cells, dtype=np.int64)), energy)
+
+    def move(self, breed):
+        """
+        Every agent of a breed steps one cell in any allowable direction (or stays), and loses its move energy.
+        The agents which left the tile are removed, and returned as {tile index: {attribute: array}},
+        with global cells."""
+        model = self.model
+        arrays = self.breed_arrays(breed)
+        move_energy = model.sheep_move_energy if breed is Sheep else model.wolf_move_energy
+        draws = model.np_random.integers(0, len(self.offsets), size=len(arrays))
+        x, y = np.divmod(arrays.cell, self.height)
+        x = (x + self.x0 + self.offsets[draws, 0]) % self.layout.width
+        y = (y + self.y0 + self.offsets[draws, 1]) % self.layout.height
+        arrays.energy -= move_energy
+        tiles = self.layout.tile_of(x, y)
+        arrays.cell = x * self.layout.height + y
+        emigrants = {}
+        for tile in np.unique(tiles[tiles != self.index]).tolist():
+            leaving = tiles == tile
+            emigrants[tile] = {
+                name: getattr(arrays, name)[leaving] for name in BreedArrays.dtypes
+            }
+        arrays.select(tiles == self.index)
+        arrays.cell = self.to_local(arrays.cell)
+        return emigrants
+
+    def immigrate(self, breed, groups):
+        """
+        Adds the agents which migrated into the tile, then shuffles the breed into activation order."""
+        arrays = self.breed_arrays(breed)
+        for group in groups:
+            for name in BreedArrays.dtypes:
+                values = group[name]
+                if name == "cell":
+                    values = self.to_local(values)
+                setattr(arrays, name, np.concatenate([getattr(arrays, name), values]))
+        arrays.select(self.model.np_random.permutation(len(arrays)))
+
+    def summary(self, age_bins):
+        """
+        Returns the number of grown grass patches and the breed_summary of each breed of the tile."""
+        return (
+            self.model.grass_field.count_grown(),
+            {breed: breed_summary(self.model, breed, age_bins) for breed in (Sheep, Wolf)},
+        )
+
+    # the phases of a step, run by the coordinator on every tile in turn
+
+    def move_sheep(self):
+        return self.move(Sheep)
+
+    def settle_sheep(self, groups):
+        self.immigrate(Sheep, groups)
+        self.feed_sheep()
+        return self.move(Wolf)
+
+    def settle_wolves(self, groups, age_bins):
+        self.immigrate(Wolf, groups)
+        self.feed_wolves()
+        if self.model.grass:
+            self.model.grass_field.step()
+        return self.summary(age_bins)
+
+
+def tile_worker(connection, parameters, layout, index, seed_sequence):
+    """
+    The loop of a worker process : runs the (method name, arguments) commands it receives on its tile's engine,
+    and sends back their results, until it receives None."""
+    engine = TileModel(parameters, layout, index, seed_sequence).array_engine
+    while True:
+        command = connection.recv()
+        if command is None:
+            break
+        name, args = command
+        connection.send(getattr(engine, name)(*args))
+    connection.close()
+
+
+class TiledWolfSheep:
+    """
+    A Wolf-Sheep model whose grid is cut into tiles simulated in parallel by worker processes (one per tile).
+
+    The rules are the ones of the array engine. The model collects the same series as WolfSheep, in its
+    datacollector, and has to be closed (or used as a context manager) to stop its workers.
+
+    Args:
+        tiles: the number of tiles along x and along y.
+        seed: seed of the random generators of the tiles.
+        datacollector: the ColumnarDataCollector of the model (default: collect every step).
+        parameters: the parameters of WolfSheep, missing ones taking their default value.
+    """
+
+    def __init__(self, tiles=(2, 2), seed=None, datacollector=None, **parameters):
+        unknown = set(parameters) - set(PARAMETER_NAMES)
+        if unknown:
+            raise ValueError("Unknown parameters: {}".format(sorted(unknown)))
+        self.parameters = {**default_parameters(), **parameters}
+        for name, value in self.parameters.items():
+            setattr(self, name, value)
+        self.layout = TileLayout(self.width, self.height, *tiles)
+        self.schedule = BaseScheduler(self)
+        self.running = True
+        if datacollector is None:
+            datacollector = ColumnarDataCollector()
+        self.datacollector = datacollector
+
+        seed_sequence = np.random.SeedSequence(seed)
+        tile_seeds = seed_sequence.spawn(len(self.layout))
+        self.connections = []
+        self.workers = []
+        for index, tile_seed in enumerate(tile_seeds):
+            connection, worker_connection = multiprocessing.Pipe()
+            worker = multiprocessing.Process(
+                target=tile_worker,
+                args=(worker_connection, self.parameters, self.layout, index, tile_seed),
+                daemon=True,
+            )
+            worker.start()
+            worker_connection.close()
+            self.connections.append(connection)
+            self.workers.append(worker)
+
+        # initial agents are put in random cells of the whole grid, then sent to their tile
+        rng = np.random.default_rng(seed_sequence)
+        for breed, count, energy in (
+            (Sheep, self.initial_sheep, self.sheep_energy),
+            (Wolf, self.initial_wolves, self.wolf_energy),
+        ):
+            x = rng.integers(0, self.width, count)
+            y = rng.integers(0, self.height, count)
+            tiles = self.layout.tile_of(x, y)
+            cells = x * self.height + y
+            self.run_phase(
+                "add_agents",
+                [(breed, cells[tiles == index], energy) for index in range(len(self.layout))],
+            )
+        self.reduce(self.run_phase("summary", [(datacollector.age_bins,)] * len(self.layout)))
+
+    def run_phase(self, name, args):
+        """
+        Runs the method name of every tile's engine, with the arguments args[tile index], in parallel.
+        Returns the results, by tile."""
+        for connection, tile_args in zip(self.connections, args):
+            connection.send((name, tile_args))
+        return [connection.recv() for connection in self.connections]
+
+    def route(self, emigrants):
+        """
+        Given the agents leaving each tile ({destination: arrays} by tile), returns the list of the groups of
+        agents arriving in each tile."""
+        arriving = [[] for _ in range(len(self.layout))]
+        for leaving in emigrants:
+            for destination, group in leaving.items():
+                arriving[destination].append(group)
+        return arriving
+
+    def step(self):
+        emigrants = self.run_phase("move_sheep", [()] * len(self.layout))
+        emigrants = self.run_phase("settle_sheep", [(groups,) for groups in self.route(emigrants)])
+        self.reduce(
+            self.run_phase(
+                "settle_wolves",
+                [(groups, self.datacollector.age_bins) for groups in self.route(emigrants)],
+            )
+        )
+        self.schedule.step()
+        if self.datacollector.should_collect(self):
+            self.datacollector.record(self.schedule.steps, self.grown_grass, self.summaries)
+
+    def reduce(self, summaries):
+        """
+        Sums the summaries of the tiles into the statistics of the whole model."""
+        self.grown_grass = sum(grown for grown, _ in summaries)
+        self.summaries = {
+            breed: tuple(
+                sum(values) for values in zip(*(by_breed[breed] for _, by_breed in summaries))
+            )
+            for breed in (Sheep, Wolf)
+        }
+
+    def get_breed_count(self, breed_class):
+        """
+        Returns the current number of agents of certain breed."""
+        return self.summaries[breed_class][0]
+
+    def run_model(self, step_count=10):
+        for i in range(step_count):
+            self.step()
+
+    def close(self):
+        """
+        Stops the worker processes."""
+        for connection in self.connections:
+            connection.send(None)
+            connection.close()
+        for worker in self.workers:
+            worker.join()
+        self.connections = []
+        self.workers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
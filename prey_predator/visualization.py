@@ -0,0 +1,172 @@
+"""
+Visualization elements of the Wolf-Sheep server, built for large grids and long runs.
+
+- DeltaCanvasGrid draws the grid from per-cell arrays (grass state, number of sheep and wolves), computed with
+  array operations instead of one portrayal dict per agent, and only sends the cells which changed since the
+  previous frame. Above max_cells cells, blocks of cells are drawn as a heatmap of their densities.
+- DownsampledChartModule is a ChartModule whose chart keeps at most max_points points, halving its resolution
+  whenever it is full.
+- FrameSkippingWolfSheep runs several steps of the model per rendered frame.
+
+The JavaScript side of the elements is in prey_predator/js, served from the directory the server runs in
+(the root of the repository, as with `mesa runserver`).
+"""
+
+import json
+import math
+import weakref
+
+import numpy as np
+from mesa.visualization.ModularVisualization import VisualizationElement
+from mesa.visualization.modules import ChartModule
+
+from prey_predator.agents import Sheep, Wolf
+from prey_predator.model import WolfSheep
+
+# counts are sent as unsigned 16 bits integers
+MAX_COUNT = 2**16 - 1
+
+
+class DeltaCanvasGrid(VisualizationElement):
+    """
+    A grid element sending the changes of the grid from frame to frame.
+
+    A frame is an array of blocks of block x block cells (block being 1 as long as the grid has at most
+    max_cells cells), with 3 values per block : the grass (0 for no grass, 1 for growing and 2 for grown grass
+    if block is 1, and the number of grown patches of the block otherwise), the number of sheep and the number
+    of wolves.
+    The first frame, a frame after a reset and one frame in keyframe_interval are sent whole, the others only
+    hold the blocks which changed since the previous frame of the same model : the element is shared by every
+    connection of a server, so the previous frame and the frame counter are kept per model. A client which missed
+    a frame (several clients stepping the same model) waits for the next whole frame.
+    """
+
+    package_includes = []
+    local_includes = ["prey_predator/js/DeltaGridModule.js"]
+
+    def __init__(
+        self, canvas_width=500, canvas_height=500, max_cells=10_000, keyframe_interval=50
+    ):
+        self.canvas_width = canvas_width
+        self.canvas_height = canvas_height
+        self.max_cells = max_cells
+        self.keyframe_interval = keyframe_interval
+        self.js_code = "elements.push(new DeltaGridModule({}, {}));".format(
+            canvas_width, canvas_height
+        )
+        # model -> (id of its last frame, last frame), forgotten with the model
+        self._previous = weakref.WeakKeyDictionary()
+
+    def __getstate__(self):
+        # copies (one per session of a SessionServer) start without previous frames
+        state = dict(self.__dict__)
+        del state["_previous"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._previous = weakref.WeakKeyDictionary()
+
+    def block_size(self, width, height):
+        """
+        Returns the side of the blocks of cells drawn as one, so that there are at most max_cells blocks."""
+        return max(1, math.ceil(math.sqrt(width * height / self.max_cells)))
+
+    def frame(self, model):
+        """
+        Returns the frame of the model's current state, as an array of shape (blocks_x * blocks_y, 3),
+        and the block size and the number of blocks along x and y."""
+        width, height = model.grid.width, model.grid.height
+        block = self.block_size(width, height)
+        blocks_x, blocks_y = math.ceil(width / block), math.ceil(height / block)
+        frame = np.zeros((blocks_x * blocks_y, 3), dtype=np.int64)
+
+        field = model.grass_field
+        if block == 1:
+            frame[:, 0] = (field.present.astype(np.int64) + field.grown).reshape(-1)
+        else:
+            grown = np.zeros((blocks_x * block, blocks_y * block), dtype=np.int64)
+            grown[:width, :height] = field.grown
+            blocks = grown.reshape(blocks_x, block, blocks_y, block)
+            frame[:, 0] = blocks.sum(axis=(1, 3)).reshape(-1)
+
+        for column, breed in ((1, Sheep), (2, Wolf)):
+            x, y = np.divmod(model.get_breed_cells(breed), height)
+            frame[:, column] = np.bincount(
+                (x // block) * blocks_y + y // block, minlength=blocks_x * blocks_y
+            )
+        return np.minimum(frame, MAX_COUNT).astype(np.uint16), block, blocks_x, blocks_y
+
+    def render(self, model):
+        frame, block, blocks_x, blocks_y = self.frame(model)
+        frame_id, previous = self._previous.get(model, (0, None))
+        frame_id += 1
+        data = {
+            "id": frame_id,
+            "step": model.schedule.steps,
+            "block": block,
+            "width": blocks_x,
+            "height": blocks_y,
+        }
+        whole = (
+            previous is None
+            or previous.shape != frame.shape
+            or frame_id % self.keyframe_interval == 0
+        )
+        if whole:
+            data["base"] = None
+            data["index"] = None
+            data["values"] = frame.reshape(-1).tolist()
+        else:
+            changed = np.flatnonzero((frame != previous).any(axis=1))
+            data["base"] = frame_id - 1
+            data["index"] = changed.tolist()
+            data["values"] = frame[changed].reshape(-1).tolist()
+        self._previous[model] = (frame_id, frame)
+        return data
+
+
+class DownsampledChartModule(ChartModule):
+    """
+    A ChartModule keeping at most max_points points per series : when the chart is full, every other point
+    is dropped, and only one new point in 2 (then 4, 8...) is added from then on.
+    """
+
+    package_includes = ["Chart.min.js"]
+    local_includes = ["prey_predator/js/DownsampledChartModule.js"]
+
+    def __init__(
+        self,
+        series,
+        canvas_height=200,
+        canvas_width=500,
+        data_collector_name="datacollector",
+        max_points=500,
+    ):
+        super().__init__(series, canvas_height, canvas_width, data_collector_name)
+        self.max_points = max_points
+        self.js_code = "elements.push(new DownsampledChartModule({}, {}, {}, {}));".format(
+            json.dumps(series), canvas_width, canvas_height, max_points
+        )
+
+    def render(self, model):
+        return {"step": model.schedule.steps, "values": super().render(model)}
+
+
+class FrameSkippingWolfSheep(WolfSheep):
+    """
+    A WolfSheep model running steps_per_frame steps each time the server asks for a step (and renders a frame).
+    """
+
+    def __init__(self, steps_per_frame=1, **parameters):
+        super().__init__(**parameters)
+        self.steps_per_frame = steps_per_frame
+
+    def cache_arguments(self):
+        return {**super().cache_arguments(), "steps_per_frame": self.steps_per_frame}
+
+    def step(self):
+        for i in range(self.steps_per_frame):
+            super().step()
+            if not self.running:
+                break
@@ -1,4 +1,13 @@
-from prey_predator.server import server
+import sys
+
+from prey_predator.server import replay_server, server, session_server
 
 # first commit
-server.launch()
+if "--sessions" in sys.argv:
+    # each session steps its own model in a worker process
+    session_server.launch()
+elif "--replay" in sys.argv:
+    # replays a recorded run : python run.py --replay run.trace
+    replay_server(sys.argv[sys.argv.index("--replay") + 1]).launch()
+else:
+    server.launch()
@@ -0,0 +1,49 @@
+"""
+The array engine against the agent engine : with their own random streams, the two engines must give the same
+dynamics on average over many seeds, and in the counter random mode, the same trajectory exactly.
+"""
+
+import numpy as np
+
+from prey_predator.model import WolfSheep
+from prey_predator.params import default_parameters
+
+SEEDS = 20
+STEPS = 100
+# the largest allowed difference of the per-step means, in standard errors of the difference
+MAX_Z = 4.5
+
+
+def population_series(engine, seeds, steps=STEPS, **options):
+    """
+    Returns the numbers of sheep, wolves and grown grass patches of runs with the given seeds (and parameters
+    options, the others taking their default value), as an array of shape (seeds, 3, steps)."""
+    runs = []
+    for seed in seeds:
+        model = WolfSheep(seed=seed, engine=engine, **{**default_parameters(), **options})
+        model.run_model(steps)
+        series = model.datacollector.get_series()
+        runs.append([series["Sheep"], series["Wolves"], series["Grown grass"]])
+    return np.array(runs, dtype=np.float64)
+
+
+def test_same_mean_populations():
+    agents = population_series("agents", range(SEEDS))
+    arrays = population_series("arrays", range(SEEDS, 2 * SEEDS))
+    # standard error of the difference of the means, at least one animal or patch
+    error = np.sqrt(agents.var(axis=0, ddof=1) / SEEDS + arrays.var(axis=0, ddof=1) / SEEDS)
+    z = np.abs(agents.mean(axis=0) - arrays.mean(axis=0)) / np.maximum(error, 1.0)
+    for name, worst in zip(("sheep", "wolves", "grown grass"), z.max(axis=1)):
+        assert worst <= MAX_Z, "mean {} differ by {:.1f} standard errors".format(name, worst)
+
+
+def test_same_trajectory_in_counter_mode():
+    for seed in range(3):
+        runs = []
+        for engine in ("agents", "arrays"):
+            model = WolfSheep(seed=seed, engine=engine, rng="counter", **default_parameters())
+            model.run_model(STEPS)
+            runs.append(model.datacollector.get_series())
+        agents, arrays = runs
+        for name in agents:
+            np.testing.assert_array_equal(agents[name], arrays[name], err_msg=name)
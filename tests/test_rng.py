@@ -0,0 +1,31 @@
+"""
+Fixed-seed regression test of the counter random mode : every engine and scheduler gives the same trajectory,
+pinned by its hash (benchmarks.suite.COUNTER_HASH, which the benchmark's determinism check reuses).
+"""
+
+import itertools
+
+import numpy as np
+
+from benchmarks.suite import COUNTER_HASH, series_hash
+from prey_predator.rng import MOVE, CounterRNG
+
+
+def test_counter_mode_trajectory_is_pinned():
+    hashes = {
+        (engine, scheduler): series_hash(engine, scheduler, rng="counter")
+        for engine, scheduler in itertools.product(("agents", "arrays"), ("dict", "array"))
+    }
+    assert set(hashes.values()) == {COUNTER_HASH}, hashes
+
+
+def test_draws_do_not_depend_on_order():
+    rng = CounterRNG(1)
+    ids = np.arange(1000)
+    draws = rng.random(7, ids, MOVE)
+    order = np.random.default_rng(0).permutation(len(ids))
+    np.testing.assert_array_equal(rng.random(7, ids[order], MOVE), draws[order])
+    assert ((draws >= 0) & (draws < 1)).all()
+    # another tick, seed or purpose gives other draws
+    assert not np.array_equal(rng.random(8, ids, MOVE), draws)
+    assert not np.array_equal(CounterRNG(2).random(7, ids, MOVE), draws)